@@ -0,0 +1,23 @@
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def atomic_write(path, mode: str = 'w', **kwargs):
+    """Open a temporary file next to path and move it into place once fully written
+
+    An interrupted run never leaves a partial or corrupt file under the final name: readers see
+    either the previous version or the new one. Text files default to UTF-8.
+    """
+    path = Path(path)
+    if 'b' not in mode:
+        kwargs.setdefault('encoding', 'utf-8')
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
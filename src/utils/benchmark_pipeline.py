@@ -0,0 +1,180 @@
+import json
+import logging
+import multiprocessing
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+from synthetic_funds import BASELINE_DATES, BASELINE_FUNDS, SyntheticFundData
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Stages timed at every scale, in pipeline order (each one uses the outputs of the previous ones)
+STAGES = ['load_all_data', 'calculate_volatility', 'merge_volatility_into_funds', 'convert_xlsx', 'stream_xlsx']
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process in MB (None where unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_stage(stage: str, work_dir: str) -> dict:
+    """Run one stage on a generated data set and time it (runs in a fresh worker process)"""
+    # Imported here so the import cost and memory of each stage stay in its own worker
+    from compute_funds_stats import VolatilityCalculator
+    from convert_xlsx_to_csv import read_and_save, stream_and_save
+    from merge_volatility_data import merge_volatility_into_funds
+
+    # Per-file loading messages would dominate the output
+    logging.disable(logging.INFO)
+    work_dir = Path(work_dir)
+    calculator = VolatilityCalculator(csv_dir=work_dir / 'csv', output_file=work_dir / 'fund_volatility_analysis.csv')
+
+    if stage == 'load_all_data':
+        start = time.perf_counter()
+        df = calculator.load_all_data()
+        elapsed = time.perf_counter() - start
+        rows = len(df)
+
+    elif stage == 'calculate_volatility':
+        df = calculator.load_all_data()
+        start = time.perf_counter()
+        results = calculator.calculate_volatility(df)
+        elapsed = time.perf_counter() - start
+        # Input of the merge stage
+        results.to_csv(calculator.output_file, index=False)
+        rows = len(results)
+
+    elif stage == 'merge_volatility_into_funds':
+        start = time.perf_counter()
+        stats = merge_volatility_into_funds(
+            funds_json_path=work_dir / 'funds.json',
+            volatility_csv_path=calculator.output_file,
+            output_path=work_dir / 'funds_merged.json'
+        )
+        elapsed = time.perf_counter() - start
+        rows = sum(stats.values())
+
+    elif stage in ('convert_xlsx', 'stream_xlsx'):
+        convert = read_and_save if stage == 'convert_xlsx' else stream_and_save
+        output_dir = work_dir / stage
+        output_dir.mkdir(exist_ok=True)
+        xlsx_files = sorted((work_dir / 'xlsx').glob('*.xlsx'))
+        start = time.perf_counter()
+        for xlsx_file in xlsx_files:
+            convert(xlsx_file, output_dir / f"{xlsx_file.stem}.csv")
+        elapsed = time.perf_counter() - start
+        rows = len(xlsx_files)
+
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+    # Rows are panel rows, funds or workbooks depending on the stage
+    return {'Wall Time (s)': elapsed, 'Peak RSS (MB)': peak_rss_mb(), 'Rows': rows}
+
+
+def measure_stage(stage: str, work_dir: Path) -> dict:
+    """Run one stage in a fresh process so its peak RSS is not inflated by earlier stages"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_stage, stage, str(work_dir)).result()
+
+
+def generate_data(work_dir: Path, scale: int, xlsx_files: int, seed: int = 0):
+    """Write the CSV tables, workbooks and funds.json of one scale (scale x today's number of funds)"""
+    data = SyntheticFundData(n_funds=BASELINE_FUNDS * scale, n_dates=BASELINE_DATES, seed=seed)
+    data.write_csv_dir(work_dir / 'csv')
+    data.write_xlsx_dir(work_dir / 'xlsx', max_files=xlsx_files)
+    data.write_funds_json(work_dir / 'funds.json')
+
+
+def benchmark_pipeline(scales: list[int] = (1, 10, 100), repeats: int = 1, xlsx_files: int = 2) -> pd.DataFrame:
+    """Time every stage at every scale on synthetic data (best wall time of the repeats)"""
+    results = []
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            work_dir = Path(tmp_dir)
+            logger.info(f"Generating {scale}x data ({BASELINE_FUNDS * scale} funds x {BASELINE_DATES} tables)")
+            generate_data(work_dir, scale, xlsx_files)
+
+            for stage in STAGES:
+                runs = [measure_stage(stage, work_dir) for _ in range(repeats)]
+                best = min(runs, key=lambda run: run['Wall Time (s)'])
+                peaks = [run['Peak RSS (MB)'] for run in runs if run['Peak RSS (MB)'] is not None]
+                results.append({
+                    'Stage': stage,
+                    'Scale': scale,
+                    'Wall Time (s)': best['Wall Time (s)'],
+                    'Peak RSS (MB)': max(peaks) if peaks else None,
+                    'Rows': best['Rows']
+                })
+                logger.info(f"{stage} @ {scale}x: {best['Wall Time (s)']:.3f}s")
+
+    return pd.DataFrame(results)
+
+
+def compare_with_baseline(results: pd.DataFrame, baseline_file: Path) -> pd.DataFrame:
+    """Add the baseline wall time and peak RSS of each stage and scale, with the relative change"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = pd.DataFrame(json.load(f)['results'])
+
+    merged = results.merge(
+        baseline[['Stage', 'Scale', 'Wall Time (s)', 'Peak RSS (MB)']],
+        on=['Stage', 'Scale'], how='left', suffixes=('', ' Baseline')
+    )
+    merged['Time Change (%)'] = (merged['Wall Time (s)'] / merged['Wall Time (s) Baseline'] - 1) * 100
+    merged['RSS Change (%)'] = (merged['Peak RSS (MB)'] / merged['Peak RSS (MB) Baseline'] - 1) * 100
+    return merged
+
+
+def save_baseline(results: pd.DataFrame, baseline_file: Path):
+    """Store the results as the reference for later runs"""
+    payload = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'pandas': pd.__version__,
+        'results': results.astype(object).where(results.notna(), None).to_dict('records')
+    }
+    with open(baseline_file, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+
+
+def main():
+    # Configuration
+    SCALES = [1, 10, 100]        # Multiples of today's data size (640 funds x 104 weekly tables)
+    REPEATS = 1                  # Runs per stage, the best wall time is kept
+    XLSX_FILES = 2               # Workbooks converted per scale
+    BASELINE_FILE = "benchmark_baseline.json"  # Reference results compared against on every run
+    UPDATE_BASELINE = False      # Set to True to replace the baseline with this run
+
+    results = benchmark_pipeline(SCALES, REPEATS, XLSX_FILES)
+    baseline_file = Path(BASELINE_FILE)
+
+    print("\nPipeline benchmark:")
+    if baseline_file.exists() and not UPDATE_BASELINE:
+        comparison = compare_with_baseline(results, baseline_file)
+        print(comparison[['Stage', 'Scale', 'Wall Time (s)', 'Wall Time (s) Baseline', 'Time Change (%)',
+                          'Peak RSS (MB)', 'RSS Change (%)']].to_string(index=False))
+    else:
+        print(results.to_string(index=False))
+        save_baseline(results, baseline_file)
+        logger.info(f"✓ Baseline saved to: {baseline_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import json
+import logging
+import subprocess
+import sys
+from pathlib import Path
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Modules that must not be loaded just by importing an entry point
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'httpx', 'aiofiles', 'openpyxl', 'playwright', 'selectolax']
+
+# Prints the heavy modules an import really loaded (lazy ones are not in sys.modules until first use)
+CHECK_LOADED = """
+import sys
+import {module}
+print(','.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def import_time_ms(module: str, utils_dir: Path) -> float:
+    """Cold-start import time of a module in a fresh interpreter (cumulative, in ms)"""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=utils_dir, capture_output=True, text=True, check=True
+    )
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    for line in process.stderr.splitlines():
+        fields = line.split('|')
+        # The entry point itself is the only line that is not indented below another import
+        if len(fields) == 3 and fields[2] == f" {module}":
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def loaded_heavy_modules(module: str, utils_dir: Path) -> list[str]:
+    """Heavy modules actually executed when importing a module"""
+    process = subprocess.run(
+        [sys.executable, '-c', CHECK_LOADED.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=utils_dir, capture_output=True, text=True, check=True
+    )
+    output = process.stdout.strip()
+    return output.split(',') if output else []
+
+
+def benchmark_startup(budgets: dict, repeats: int = 5) -> list[dict]:
+    """Best import time of each entry point over the repeats, checked against its budget"""
+    utils_dir = Path(__file__).resolve().parent
+    results = []
+    for module, budget_ms in budgets.items():
+        best_ms = min(import_time_ms(module, utils_dir) for _ in range(repeats))
+        loaded = loaded_heavy_modules(module, utils_dir)
+        results.append({
+            'module': module,
+            'import_ms': round(best_ms, 1),
+            'budget_ms': budget_ms,
+            'heavy_loaded': loaded,
+            'ok': best_ms <= budget_ms and not loaded
+        })
+    return results
+
+
+def main():
+    # Configuration
+    STARTUP_BUDGETS_MS = {       # Cold-start budget of each entry point (import only, excluding Python's own start-up)
+        'scrape_funds_data': 250,
+        'convert_xlsx_to_csv': 250,
+        'compute_funds_stats': 150,
+        'merge_volatility_data': 150,
+        'risk_metrics': 150,
+        'fund_covariance': 150,
+        'portfolio': 150,
+        'pipeline': 300,
+    }
+    REPEATS = 5                  # Runs per entry point, the best time is kept
+    REPORT_FILE = None           # Set to a path to also write the results as JSON
+
+    results = benchmark_startup(STARTUP_BUDGETS_MS, REPEATS)
+
+    print("\nStartup benchmark:")
+    for result in results:
+        status = "ok" if result['ok'] else "FAIL"
+        heavy = f" (loaded {', '.join(result['heavy_loaded'])})" if result['heavy_loaded'] else ""
+        print(f"  {result['module']:<24} {result['import_ms']:>8.1f} ms / {result['budget_ms']} ms  {status}{heavy}")
+
+    if REPORT_FILE:
+        with open(REPORT_FILE, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    failed = [result['module'] for result in results if not result['ok']]
+    if failed:
+        logger.error(f"Start-up over budget or loading heavy modules: {', '.join(failed)}")
+        sys.exit(1)
+    logger.info("✓ All entry points within their start-up budget")
+
+
+if __name__ == "__main__":
+    main()
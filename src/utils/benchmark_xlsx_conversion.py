@@ -0,0 +1,85 @@
+import logging
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+from convert_xlsx_to_csv import read_and_save, stream_and_save
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def measure(convert, xlsx_file: Path, csv_path: Path) -> tuple[float, float]:
+    """Run one conversion and return (wall time in s, peak traced memory in MB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    convert(xlsx_file, csv_path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+def benchmark_conversion(input_dir: str = "asfim_downloads", max_files: int = 10) -> pd.DataFrame:
+    """Compare pd.read_excel conversion with the streaming read-only path on the same files"""
+    xlsx_files = sorted(Path(input_dir).glob('*.xlsx'))[:max_files]
+
+    if not xlsx_files:
+        logger.warning(f"No .xlsx files found in {input_dir}")
+        return pd.DataFrame()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for xlsx_file in xlsx_files:
+            pandas_csv = Path(tmp_dir) / f"{xlsx_file.stem}.pandas.csv"
+            stream_csv = Path(tmp_dir) / f"{xlsx_file.stem}.stream.csv"
+
+            pandas_time, pandas_peak = measure(read_and_save, xlsx_file, pandas_csv)
+            stream_time, stream_peak = measure(stream_and_save, xlsx_file, stream_csv)
+
+            # Both paths must produce the same table once parsed back
+            try:
+                pd.testing.assert_frame_equal(
+                    pd.read_csv(pandas_csv), pd.read_csv(stream_csv), check_dtype=False
+                )
+                same_output = True
+            except AssertionError:
+                same_output = False
+
+            results.append({
+                'File': xlsx_file.name,
+                'Size (MB)': xlsx_file.stat().st_size / 1024 / 1024,
+                'read_excel (s)': pandas_time,
+                'Streaming (s)': stream_time,
+                'read_excel peak (MB)': pandas_peak,
+                'Streaming peak (MB)': stream_peak,
+                'Same Output': same_output
+            })
+            logger.info(f"Benchmarked: {xlsx_file.name}")
+
+    return pd.DataFrame(results)
+
+
+def main():
+    # Configuration
+    INPUT_DIR = "asfim_downloads"  # Directory containing .xlsx files
+    MAX_FILES = 10                 # Number of files to benchmark
+
+    results = benchmark_conversion(INPUT_DIR, MAX_FILES)
+
+    if results.empty:
+        return
+
+    print("\nxlsx conversion benchmark:")
+    print(results.to_string(index=False))
+
+    print("\n\nTotals:")
+    print(results[['read_excel (s)', 'Streaming (s)']].sum().to_string())
+    print(results[['read_excel peak (MB)', 'Streaming peak (MB)']].max().to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,174 +1,637 @@
-import pandas as pd
-import numpy as np
+from __future__ import annotations
+
 from pathlib import Path
 import logging
 from datetime import datetime
-import re
+import json
+
+from atomic_write import atomic_write
+from lazy_import import lazy_import
+from fund_identity import FundIdentityIndex
+from history_store import DEFAULT_FREQUENCY, FundHistoryStore, extract_date_from_filename, extract_frequency_from_filename
+from pipeline_manifest import PipelineManifest
+from pipeline_metrics import PipelineMetrics
+from validate_panel import PanelValidator
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Columns identifying a fund across files
+FUND_KEYS = ['CODE ISIN', 'Code Maroclear']
+
+# Descriptive columns taken from each fund's first row
+FUND_INFO_COLUMNS = ['Dénomination OPCVM', 'Société de Gestion', 'Nature juridique', 'Dépositaire', 'Classification']
+
+# Columns read from each performance table
+PANEL_COLUMNS = FUND_KEYS + FUND_INFO_COLUMNS + ['VL']
+
+# Observations per year of each table frequency, used when dates are too close together to measure spacing
+NOMINAL_PERIODS_PER_YEAR = {'daily': 252, 'weekly': 52, 'monthly': 12, 'annual': 1}
+
+# Name of one period in the report columns ('Weekly Volatility (%)', 'Mean Weekly Return (%)')
+PERIOD_LABELS = {'daily': 'Daily', 'weekly': 'Weekly', 'monthly': 'Monthly', 'annual': 'Yearly'}
+
+# pandas period alias used to bucket dates when resampling a panel to a coarser frequency
+RESAMPLE_PERIODS = {'daily': 'D', 'weekly': 'W', 'monthly': 'M', 'annual': 'Y'}
+
+DAYS_PER_YEAR = 365.25
+
+# Per-fund running statistics persisted between incremental runs ('excluded': dropped by the screening)
+STATE_COLUMNS = ['rows', 'data_points', 'start_date', 'end_date', 'starting_vl', 'latest_vl',
+                 'return_count', 'return_mean', 'return_m2', 'excluded']
+
+
+def periods_per_year(dates, default: float = float('nan')) -> float:
+    """Observations per year implied by the mean spacing of a set of dates (default if they span no time)"""
+    dates = np.unique(np.asarray(dates, dtype='datetime64[D]'))
+    if len(dates) < 2:
+        return default
+    span_days = (dates[-1] - dates[0]).astype(np.float64)
+    return (len(dates) - 1) * DAYS_PER_YEAR / span_days
+
 
 class VolatilityCalculator:
-    def __init__(self, csv_dir: str = "csv_output", output_file: str = "fund_volatility.csv"):
+    def __init__(
+        self,
+        csv_dir: str = "csv_output",
+        output_file: str = "fund_volatility.csv",
+        state_file: str = "fund_volatility_state.json",
+        history_dir: str = None,
+        manifest_file: str = None,
+        frequency: str = DEFAULT_FREQUENCY,
+        metrics: PipelineMetrics = None,
+        validator: PanelValidator = None,
+        identity: FundIdentityIndex = None
+    ):
+        if frequency not in NOMINAL_PERIODS_PER_YEAR:
+            raise ValueError(f"Unknown frequency {frequency!r}, expected one of {list(NOMINAL_PERIODS_PER_YEAR)}")
+        
         self.csv_dir = Path(csv_dir)
         self.output_file = output_file
+        self.state_file = Path(state_file)
+        # Read from the Parquet history store instead of the CSV directory when set
+        self.history_store = FundHistoryStore(history_dir) if history_dir else None
+        # Skip the analysis when no input changed since the last run when set
+        self.manifest = PipelineManifest(manifest_file) if manifest_file else None
+        # Only tables of this frequency are loaded, so daily, weekly and monthly panels never mix
+        self.frequency = frequency
+        # Stage timings and counters (written as a run report when it has a report file)
+        self.metrics = metrics or PipelineMetrics()
+        # Screen the loaded panel for broken series before computing statistics when set
+        self.validator = validator
+        # Put every row under its fund's stable identity (across code changes and renames) when set
+        self.identity = identity
         
     def extract_date_from_filename(self, filename: str) -> datetime:
         """Extract date from filename like 'Tableau des performances quotidiennes au 02-10-2025.csv'"""
+        return extract_date_from_filename(filename)
+    
+    def load_csv_file(self, csv_file: Path) -> pd.DataFrame:
+        """Load the analysis columns of a single CSV file tagged with its date (None if it cannot be used)"""
+        date = self.extract_date_from_filename(csv_file.name)
+        
+        if date is None:
+            logger.warning(f"Skipping {csv_file.name} - could not extract date")
+            self.metrics.skip('no date in file name', stage='load')
+            return None
+        
         try:
-            # Match pattern: DD-MM-YYYY
-            match = re.search(r'(\d{2})-(\d{2})-(\d{4})', filename)
-            if match:
-                day, month, year = match.groups()
-                return datetime(int(year), int(month), int(day))
+            # Only the columns needed for the analysis, with text read as strings instead of inferred objects
+            df = pd.read_csv(
+                csv_file,
+                usecols=lambda col: col in PANEL_COLUMNS,
+                dtype={col: 'string' for col in ['CODE ISIN'] + FUND_INFO_COLUMNS}
+            )
+            df = self.prepare_table(df, date)
+            logger.info(f"Loaded: {csv_file.name} ({date.strftime('%Y-%m-%d')})")
+            self.metrics.count('files', stage='load')
+            self.metrics.count('bytes', csv_file.stat().st_size, stage='load')
+            self.metrics.count('rows', len(df), stage='load')
+            return df
         except Exception as e:
-            logger.warning(f"Could not extract date from {filename}: {e}")
-        return None
+            logger.error(f"Error reading {csv_file.name}: {e}")
+            self.metrics.skip('unreadable file', stage='load')
+            return None
     
-    def load_all_data(self) -> pd.DataFrame:
-        """Load all CSV files and combine them with dates"""
-        all_data = []
-        
-        csv_files = sorted(list(self.csv_dir.glob('*.csv')))
+    def prepare_table(self, df: pd.DataFrame, date: datetime) -> pd.DataFrame:
+        """Analysis columns of one performance table with the loader's types, tagged with its date"""
+        df = df.reindex(columns=PANEL_COLUMNS)
+        for col in ['CODE ISIN'] + FUND_INFO_COLUMNS:
+            df[col] = df[col].astype('string')
+        df['Code Maroclear'] = pd.to_numeric(df['Code Maroclear'], errors='coerce').astype('Int64')
+        df['VL'] = pd.to_numeric(df['VL'], errors='coerce').astype('float64')
+        df['date'] = date
+        return df
+    
+    def load_history(self) -> pd.DataFrame:
+        """Load the columns needed for the analysis from the Parquet history store"""
+        df = self.history_store.read(columns=FUND_KEYS + FUND_INFO_COLUMNS + ['VL', 'date'], frequency=self.frequency)
         
-        if not csv_files:
-            logger.error(f"No CSV files found in {self.csv_dir}")
-            return pd.DataFrame()
+        if df.empty:
+            logger.error(f"No data found in {self.history_store.store_dir}")
+            return df
         
-        logger.info(f"Found {len(csv_files)} CSV files")
+        logger.info(f"Total records loaded: {len(df)} ({df['date'].nunique()} dates)")
+        self.metrics.count('rows', len(df), stage='load')
+        return df
+    
+    def list_sources(self) -> list[tuple[datetime, str]]:
+        """List dated input sources (CSV files or history store partitions) of the calculator's frequency in date order"""
+        if self.history_store:
+            return [
+                (datetime.strptime(path.parent.name, '%Y-%m-%d'), path.relative_to(self.history_store.store_dir).as_posix())
+                for path in self.history_store.partitions(frequency=self.frequency)
+            ]
         
-        for csv_file in csv_files:
+        sources = []
+        for csv_file in sorted(self.csv_dir.glob('*.csv')):
             date = self.extract_date_from_filename(csv_file.name)
-            
             if date is None:
                 logger.warning(f"Skipping {csv_file.name} - could not extract date")
                 continue
+            if extract_frequency_from_filename(csv_file.name) != self.frequency:
+                continue
+            sources.append((date, csv_file.name))
+        return sorted(sources)
+    
+    def source_name(self, table_name: str) -> str:
+        """Source name (as listed by list_sources) of a performance table converted from a workbook"""
+        if self.history_store:
+            return self.history_store.partition_path(table_name).relative_to(self.history_store.store_dir).as_posix()
+        return f"{Path(table_name).stem}.csv"
+    
+    def source_path(self, name: str) -> Path:
+        """File backing one dated input source"""
+        if self.history_store:
+            return self.history_store.store_dir / name
+        return self.csv_dir / name
+    
+    def load_source(self, name: str) -> pd.DataFrame:
+        """Load one dated input source listed by list_sources"""
+        if self.history_store:
+            return self.history_store.read_partition(
+                self.source_path(name),
+                columns=FUND_KEYS + FUND_INFO_COLUMNS + ['VL', 'date']
+            )
+        return self.load_csv_file(self.source_path(name))
+    
+    def input_fingerprint(self) -> dict:
+        """Content hash of every dated input source, keyed by source name"""
+        return {name: self.manifest.file_hash(self.source_path(name)) for _, name in self.list_sources()}
+    
+    def empty_panel(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Fund dimension and fact tables with no rows"""
+        return pd.DataFrame(columns=FUND_KEYS + FUND_INFO_COLUMNS), pd.DataFrame(columns=['fund_id', 'date', 'VL'])
+    
+    def load_panel(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Load all sources as a fund dimension table and a narrow (fund_id, date, VL) fact table
+        
+        Fund descriptors are stored once per fund (indexed by an int32 fund_id) instead of on
+        every row, so memory grows with funds + rows rather than funds x dates x strings.
+        """
+        if self.history_store:
+            chunks = [self.load_history()]
+        else:
+            sources = self.list_sources()
+            if not sources:
+                logger.error(f"No {self.frequency} CSV files found in {self.csv_dir}")
+                return self.empty_panel()
+            logger.info(f"Found {len(sources)} {self.frequency} CSV files")
+            # Files are read one at a time in date order, so a fund's first row is its earliest one
+            chunks = (self.load_csv_file(self.source_path(name)) for _, name in sources)
+        
+        return self.panel_from_chunks(chunks)
+    
+    def panel_from_chunks(self, chunks) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Build the fund dimension and fact tables from prepared tables given in date order"""
+        fund_ids = {}  # (ISIN, Maroclear code) -> fund_id, in order of first appearance
+        fund_info = []
+        facts = []
+        
+        for chunk in chunks:
+            if chunk is None or chunk.empty:
+                continue
+            
+            chunk = chunk.dropna(subset=FUND_KEYS)
+            known = len(fund_ids)
+            ids = np.fromiter(
+                (fund_ids.setdefault(key, len(fund_ids))
+                 for key in zip(chunk['CODE ISIN'].tolist(), chunk['Code Maroclear'].tolist())),
+                dtype=np.int32, count=len(chunk)
+            )
+            
+            # Funds seen for the first time take their descriptors from their first (earliest) row
+            if len(fund_ids) > known:
+                _, first_rows = np.unique(ids, return_index=True)
+                first_rows = first_rows[ids[first_rows] >= known]
+                fund_info.append(chunk.iloc[first_rows][FUND_KEYS + FUND_INFO_COLUMNS])
             
-            try:
-                df = pd.read_csv(csv_file)
-                df['date'] = date
-                df['filename'] = csv_file.name
-                all_data.append(df)
-                logger.info(f"Loaded: {csv_file.name} ({date.strftime('%Y-%m-%d')})")
-            except Exception as e:
-                logger.error(f"Error reading {csv_file.name}: {e}")
-        
-        if not all_data:
+            facts.append(pd.DataFrame({
+                'fund_id': ids,
+                'date': chunk['date'].to_numpy(),
+                'VL': chunk['VL'].to_numpy(dtype='float64')
+            }))
+        
+        if not facts:
             logger.error("No data loaded successfully")
+            return self.empty_panel()
+        
+        funds = pd.concat(fund_info, ignore_index=True)
+        for col in ['CODE ISIN'] + FUND_INFO_COLUMNS:
+            funds[col] = funds[col].astype('string').astype('category')
+        funds['Code Maroclear'] = funds['Code Maroclear'].astype('Int64')
+        funds.index = pd.RangeIndex(len(funds), name='fund_id')
+        
+        facts = pd.concat(facts, ignore_index=True)
+        self.report_memory(funds, facts)
+        
+        return funds, facts
+    
+    def report_memory(self, funds: pd.DataFrame, facts: pd.DataFrame):
+        """Log the memory used by the fund dimension and fact tables"""
+        funds_mb = funds.memory_usage(deep=True).sum() / 1024 / 1024
+        facts_mb = facts.memory_usage(deep=True).sum() / 1024 / 1024
+        logger.info(f"Panel memory: {len(funds)} funds ({funds_mb:.2f} MB) + {len(facts)} rows ({facts_mb:.1f} MB)")
+    
+    def load_all_data(self) -> pd.DataFrame:
+        """Load all sources as one row per fund and date, with categorical fund descriptors"""
+        return self.combine_panel(*self.load_panel())
+    
+    def combine_panel(self, funds: pd.DataFrame, facts: pd.DataFrame) -> pd.DataFrame:
+        """Expand the fund dimension and fact tables into one row per fund and date"""
+        if facts.empty:
             return pd.DataFrame()
         
-        # Combine all dataframes
-        combined_df = pd.concat(all_data, ignore_index=True)
+        # Expanding the dimension table only repeats category codes, not the strings themselves
+        combined_df = funds.take(facts['fund_id'].to_numpy()).reset_index(drop=True)
+        combined_df['date'] = facts['date'].to_numpy()
+        combined_df['VL'] = facts['VL'].to_numpy()
         logger.info(f"Total records loaded: {len(combined_df)}")
         
         return combined_df
     
+    def resample_panel(self, df: pd.DataFrame, frequency: str) -> pd.DataFrame:
+        """Downsample a loaded panel to a coarser frequency, keeping each fund's last valid VL per period
+        
+        Rows keep their actual observation dates, so the result is annualized from its own spacing.
+        Works on the panel in memory, e.g. weekly statistics from the daily tables without re-reading them.
+        """
+        vl = pd.to_numeric(df['VL'], errors='coerce')
+        df = df[vl > 0].sort_values(FUND_KEYS + ['date'], kind='stable')
+        period = df['date'].dt.to_period(RESAMPLE_PERIODS[frequency]).rename('period')
+        last_rows = ~df[FUND_KEYS].assign(period=period).duplicated(keep='last')
+        return df[last_rows.to_numpy()].reset_index(drop=True)
+    
+    def compute_returns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Clean VL series of every fund with period returns, sorted by fund and date"""
+        keys = FUND_KEYS
+        
+        # Sort by fund identifiers and date
+        df = df.sort_values(keys + ['date'])
+        
+        # Convert VL to numeric once for the whole panel and drop NaN or zero values
+        vl = pd.to_numeric(df['VL'], errors='coerce')
+        valid_mask = vl > 0
+        clean = df.loc[valid_mask, keys + ['date']].assign(VL=vl[valid_mask])
+        
+        # Calculate returns within each fund: (VL_t / VL_t-1) - 1
+        previous_vl = clean.groupby(keys, sort=False, observed=True)['VL'].shift(1)
+        clean['return'] = (clean['VL'] - previous_vl) / previous_vl
+        
+        return clean
+    
     def calculate_volatility(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calculate annual volatility for each fund"""
+        keys = FUND_KEYS
         
         # Sort by fund identifiers and date
-        df = df.sort_values(['CODE ISIN', 'Code Maroclear', 'date'])
-        
-        results = []
-        
-        # Group by all fund identifiers to ensure unique funds
-        for (isin, maroclear_code), group in df.groupby(['CODE ISIN', 'Code Maroclear']):
-            # Get fund info
-            fund_name = group['Dénomination OPCVM'].iloc[0]
-            classification = group['Classification'].iloc[0]
-            management_company = group['Société de Gestion'].iloc[0]
-            nature_juridique = group['Nature juridique'].iloc[0]
-            depositaire = group['Dépositaire'].iloc[0]
-            
-            # Ensure we have enough data points
-            if len(group) < 2:
-                logger.warning(f"Skipping {fund_name} - insufficient data points ({len(group)})")
-                continue
-            
-            # Calculate weekly returns from VL (Net Asset Value)
-            # Convert VL to numeric, handling any non-numeric values
-            vl_series = pd.to_numeric(group['VL'], errors='coerce').values
-            dates = group['date'].values
-            
-            # Remove any NaN or zero values
-            valid_mask = (pd.notna(vl_series)) & (vl_series > 0)
-            vl_clean = vl_series[valid_mask]
-            dates_clean = dates[valid_mask]
-            
-            if len(vl_clean) < 2:
-                logger.warning(f"Skipping {fund_name} - insufficient valid VL data")
-                continue
-            
-            # Calculate returns: (VL_t / VL_t-1) - 1
-            returns = np.diff(vl_clean) / vl_clean[:-1]
-            
-            # Calculate weekly volatility (standard deviation of returns)
-            weekly_vol = np.std(returns, ddof=1)  # ddof=1 for sample std
-            
-            # Annualize volatility: weekly_vol × sqrt(52)
-            annual_vol = weekly_vol * np.sqrt(52)
-            
-            # Calculate additional metrics
-            mean_return = np.mean(returns)
-            annual_return = mean_return * 52
-            
-            # Calculate Sharpe-like ratio (simplified, assuming 0 risk-free rate)
-            sharpe = annual_return / annual_vol if annual_vol > 0 else 0
-            
-            results.append({
-                'CODE ISIN': isin,
-                'Code Maroclear': maroclear_code,
-                'Fund Name': fund_name,
-                'Management Company': management_company,
-                'Nature juridique': nature_juridique,
-                'Dépositaire': depositaire,
-                'Classification': classification,
-                'Data Points': len(vl_clean),
-                'Date Range': f"{dates_clean[0]} to {dates_clean[-1]}",
-                'Weekly Volatility (%)': weekly_vol * 100,
-                'Annual Volatility (%)': annual_vol * 100,
-                'Mean Weekly Return (%)': mean_return * 100,
-                'Annualized Return (%)': annual_return * 100,
-                'Sharpe Ratio': sharpe,
-                'Latest VL': vl_clean[-1],
-                'Starting VL': vl_clean[0],
-                'Total Return (%)': ((vl_clean[-1] / vl_clean[0]) - 1) * 100
-            })
-        
-        results_df = pd.DataFrame(results)
+        df = df.sort_values(keys + ['date'])
+        
+        # Fund info comes from each fund's first row
+        info = df.drop_duplicates(keys).set_index(keys)
+        
+        clean = self.compute_returns(df)
+        
+        grouped = clean.groupby(keys, observed=True)
+        stats = grouped.agg(
+            data_points=('VL', 'size'),
+            start_date=('date', 'first'),
+            end_date=('date', 'last'),
+            starting_vl=('VL', 'first'),
+            latest_vl=('VL', 'last'),
+            weekly_vol=('return', 'std'),  # sample std (ddof=1)
+            mean_return=('return', 'mean'),
+        )
+        
+        raw_counts = df.groupby(keys, observed=True).size()
+        
+        return self.build_results(info, stats, raw_counts)
+    
+    def build_results(self, info: pd.DataFrame, stats: pd.DataFrame, raw_counts: pd.Series) -> pd.DataFrame:
+        """Turn per-fund return statistics into the volatility report"""
+        # Ensure we have enough data points
+        valid_counts = stats['data_points'].reindex(raw_counts.index, fill_value=0)
+        too_short = raw_counts.index[raw_counts < 2]
+        no_valid_vl = raw_counts.index[(raw_counts >= 2) & (valid_counts < 2)]
+        for key in too_short:
+            logger.warning(f"Skipping {info.at[key, 'Dénomination OPCVM']} - insufficient data points ({raw_counts[key]})")
+        for key in no_valid_vl:
+            logger.warning(f"Skipping {info.at[key, 'Dénomination OPCVM']} - insufficient valid VL data")
+        self.metrics.skip('insufficient data points', len(too_short), stage='compute')
+        self.metrics.skip('insufficient valid VL data', len(no_valid_vl), stage='compute')
+        stats = stats[stats['data_points'] >= 2]
+        info = info.loc[stats.index]
+        
+        if stats.empty:
+            return pd.DataFrame()
+        
+        # Annualize from each fund's observed spacing: (observations - 1) returns over its date span
+        data_points = stats['data_points'].to_numpy(dtype=np.float64)
+        span_days = (stats['end_date'] - stats['start_date']).dt.days.to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            periods = np.where(span_days > 0, (data_points - 1) * DAYS_PER_YEAR / span_days,
+                               NOMINAL_PERIODS_PER_YEAR[self.frequency])
+        
+        # Annualize volatility: period_vol × sqrt(periods per year)
+        weekly_vol = stats['weekly_vol'].to_numpy()
+        annual_vol = weekly_vol * np.sqrt(periods)
+        mean_return = stats['mean_return'].to_numpy()
+        annual_return = mean_return * periods
+        
+        # Calculate Sharpe-like ratio (simplified, assuming 0 risk-free rate)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = np.where(annual_vol > 0, annual_return / annual_vol, 0)
+        
+        start_dates = np.datetime_as_string(stats['start_date'].to_numpy())
+        end_dates = np.datetime_as_string(stats['end_date'].to_numpy())
+        label = PERIOD_LABELS[self.frequency]
+        
+        results_df = pd.DataFrame({
+            'CODE ISIN': stats.index.get_level_values('CODE ISIN'),
+            'Code Maroclear': stats.index.get_level_values('Code Maroclear'),
+            'Fund Name': info['Dénomination OPCVM'].to_numpy(),
+            'Management Company': info['Société de Gestion'].to_numpy(),
+            'Nature juridique': info['Nature juridique'].to_numpy(),
+            'Dépositaire': info['Dépositaire'].to_numpy(),
+            'Classification': info['Classification'].to_numpy(),
+            'Data Points': stats['data_points'].to_numpy(),
+            'Date Range': [f"{start} to {end}" for start, end in zip(start_dates, end_dates)],
+            'Periods per Year': periods,
+            f'{label} Volatility (%)': weekly_vol * 100,
+            'Annual Volatility (%)': annual_vol * 100,
+            f'Mean {label} Return (%)': mean_return * 100,
+            'Annualized Return (%)': annual_return * 100,
+            'Sharpe Ratio': sharpe,
+            'Latest VL': stats['latest_vl'].to_numpy(),
+            'Starting VL': stats['starting_vl'].to_numpy(),
+            'Total Return (%)': ((stats['latest_vl'] / stats['starting_vl']).to_numpy() - 1) * 100
+        })
+        
+        if self.identity:
+            fund_ids = self.identity.resolve(results_df['CODE ISIN'], results_df['Code Maroclear'],
+                                             results_df['Fund Name'], register=False)
+            results_df.insert(0, 'Fund ID', fund_ids.to_numpy())
         
         # Sort by annual volatility (descending)
         results_df = results_df.sort_values('Annual Volatility (%)', ascending=False)
         
         return results_df
     
+    def empty_state(self) -> pd.DataFrame:
+        """Per-fund running statistics before any file has been processed"""
+        state = pd.DataFrame(columns=FUND_KEYS + FUND_INFO_COLUMNS + STATE_COLUMNS)
+        return state.set_index(FUND_KEYS)
+    
+    def load_state(self) -> tuple[list, pd.DataFrame]:
+        """Load the processed file list and per-fund running statistics"""
+        if not self.state_file.exists():
+            return [], self.empty_state()
+        
+        with open(self.state_file, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        
+        state = pd.DataFrame.from_records(payload['funds'], columns=FUND_KEYS + FUND_INFO_COLUMNS + STATE_COLUMNS)
+        for col in ['start_date', 'end_date']:
+            # Funds without a valid VL yet have no dates (read back as NaN, not None)
+            state[col] = pd.to_datetime([datetime.fromisoformat(d) if isinstance(d, str) else None for d in state[col]])
+        # State files written before funds could be excluded have no such column
+        state['excluded'] = state['excluded'].fillna(False).astype(bool)
+        
+        logger.info(f"Loaded state for {len(state)} funds ({len(payload['processed_files'])} files processed)")
+        return payload['processed_files'], state.set_index(FUND_KEYS)
+    
+    def save_state(self, processed_files: list, state: pd.DataFrame):
+        """Persist the processed file list and per-fund running statistics"""
+        funds = state.reset_index()
+        for col in ['start_date', 'end_date']:
+            funds[col] = [d.isoformat() if pd.notna(d) else None for d in funds[col]]
+        funds = funds.astype(object).where(funds.notna(), None)
+        
+        payload = {
+            'processed_files': processed_files,
+            'funds': funds.to_dict('records')
+        }
+        
+        with atomic_write(self.state_file) as f:
+            json.dump(payload, f, ensure_ascii=False)
+    
+    def update_state(self, state: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+        """Fold one dated file into the per-fund running statistics"""
+        keys = FUND_KEYS
+        
+        df = df.sort_values(keys + ['date'], kind='stable')
+        rows = df.groupby(keys, observed=True).size()
+        info = df.drop_duplicates(keys).set_index(keys)[FUND_INFO_COLUMNS]
+        
+        vl = pd.to_numeric(df['VL'], errors='coerce')
+        valid_mask = vl > 0
+        clean = df.loc[valid_mask, keys + ['date']].assign(VL=vl[valid_mask])
+        
+        # The first return of each fund in this file chains onto its last stored VL
+        previous_vl = clean.groupby(keys, sort=False, observed=True)['VL'].shift(1)
+        stored_vl = state['latest_vl'].reindex(pd.MultiIndex.from_frame(clean[keys])).to_numpy(dtype=float)
+        previous_vl = previous_vl.fillna(pd.Series(stored_vl, index=clean.index))
+        clean['return'] = (clean['VL'] - previous_vl) / previous_vl
+        
+        grouped = clean.groupby(keys, observed=True)
+        batch = grouped.agg(
+            data_points=('VL', 'size'),
+            start_date=('date', 'first'),
+            end_date=('date', 'last'),
+            starting_vl=('VL', 'first'),
+            latest_vl=('VL', 'last'),
+            return_count=('return', 'count'),
+            return_mean=('return', 'mean'),
+        )
+        batch['return_m2'] = grouped['return'].var(ddof=0) * batch['return_count']
+        
+        index = state.index.union(rows.index)
+        old = state.reindex(index)
+        new = batch.reindex(index)
+        
+        # Funds keep the descriptors of their first row, new funds take them from this file
+        new_info = info[~info.index.isin(state.index)]
+        merged = pd.concat([state[FUND_INFO_COLUMNS], new_info]).reindex(index)
+        merged['rows'] = old['rows'].fillna(0).astype(int) + rows.reindex(index, fill_value=0)
+        merged['data_points'] = old['data_points'].fillna(0).astype(int) + new['data_points'].fillna(0).astype(int)
+        merged['start_date'] = old['start_date'].astype(batch['start_date'].dtype).combine_first(new['start_date'])
+        merged['end_date'] = new['end_date'].combine_first(old['end_date'].astype(batch['end_date'].dtype))
+        merged['starting_vl'] = old['starting_vl'].astype(float).combine_first(new['starting_vl'])
+        merged['latest_vl'] = new['latest_vl'].combine_first(old['latest_vl'].astype(float))
+        merged['excluded'] = old['excluded'].fillna(False).astype(bool)
+        
+        # Combine running mean and sum of squared deviations (Welford/Chan parallel update)
+        n_old = old['return_count'].fillna(0).to_numpy(dtype=float)
+        n_new = new['return_count'].fillna(0).to_numpy(dtype=float)
+        mean_old = old['return_mean'].fillna(0).to_numpy(dtype=float)
+        mean_new = new['return_mean'].fillna(0).to_numpy(dtype=float)
+        m2_old = old['return_m2'].fillna(0).to_numpy(dtype=float)
+        m2_new = new['return_m2'].fillna(0).to_numpy(dtype=float)
+        
+        count = n_old + n_new
+        delta = mean_new - mean_old
+        with np.errstate(divide='ignore', invalid='ignore'):
+            merged['return_count'] = count.astype(int)
+            merged['return_mean'] = np.where(count > 0, mean_old + delta * n_new / count, np.nan)
+            merged['return_m2'] = np.where(count > 0, m2_old + m2_new + delta ** 2 * n_old * n_new / count, 0.0)
+        
+        return merged
+    
+    def screen_new_sources(self, tables: list, state: pd.DataFrame) -> tuple[list, pd.DataFrame]:
+        """Screen the rows of new sources against each fund's stored last VL
+        
+        Each fund's last stored row is put before its new rows, so a jump from the stored history
+        is seen (with few new returns per fund, min_jump alone decides what a jump is). A rescaled
+        level shift rescales the stored VLs too, and a fund the screening excludes stays excluded.
+        Returns the screened (name, rows) tables and the state.
+        """
+        new = pd.concat([df.assign(source=name) for name, df in tables], ignore_index=True)
+        excluded = pd.MultiIndex.from_frame(new[FUND_KEYS]).isin(state.index[state['excluded'].astype(bool)])
+        self.metrics.skip('excluded fund', int(excluded.sum()), stage='validate')
+        new = new[~excluded]
+        
+        stored = state[state['latest_vl'].notna() & ~state['excluded'].astype(bool)]
+        stored = stored[FUND_INFO_COLUMNS + ['end_date', 'latest_vl']].reset_index()
+        stored = stored.rename(columns={'end_date': 'date', 'latest_vl': 'VL'})
+        stored['Code Maroclear'] = pd.to_numeric(stored['Code Maroclear']).astype('Int64')
+        stored['VL'] = stored['VL'].astype('float64')
+        stored['date'] = stored['date'].astype(new['date'].dtype)
+        
+        screened = self.validator.screen(pd.concat([stored, new], ignore_index=True))
+        from_state = screened['source'].isna().to_numpy()
+        
+        # The stored rows come back rescaled, or not at all for excluded funds
+        kept = screened[from_state].set_index(FUND_KEYS)['VL']
+        scale = kept / state['latest_vl'].reindex(kept.index).astype(float)
+        state = state.copy()
+        state.loc[stored.set_index(FUND_KEYS).index.difference(kept.index), 'excluded'] = True
+        for col in ['starting_vl', 'latest_vl']:
+            state.loc[scale.index, col] = state.loc[scale.index, col].astype(float) * scale
+        
+        rows = dict(tuple(screened[~from_state].groupby('source', sort=False)))
+        return [(name, rows[name].drop(columns='source')) for name, _ in tables if name in rows], state
+    
+    def results_from_state(self, state: pd.DataFrame) -> pd.DataFrame:
+        """Build the volatility report from per-fund running statistics"""
+        count = state['return_count'].astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weekly_vol = np.where(count >= 2, np.sqrt(state['return_m2'].astype(float) / (count - 1)), np.nan)
+        
+        stats = state[['data_points', 'start_date', 'end_date', 'starting_vl', 'latest_vl']].assign(
+            weekly_vol=weekly_vol,
+            mean_return=state['return_mean'].astype(float)
+        )
+        stats = stats[(stats['data_points'] > 0) & ~state['excluded'].astype(bool)]
+        
+        return self.build_results(state[FUND_INFO_COLUMNS], stats, state['rows'])
+    
+    def screen_panel(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Put a loaded panel under stable fund ids and screen it for broken series, as configured"""
+        if self.identity:
+            df = self.identity.canonicalize(df)
+            self.identity.save()
+        
+        if self.validator:
+            df = self.validator.screen(df)
+        return df
+    
+    def load_screened_panel(self) -> pd.DataFrame:
+        """Load every source as the panel all statistics are computed on (see screen_panel)"""
+        with self.metrics.stage('load'):
+            df = self.load_all_data()
+        
+        if df.empty:
+            return df
+        return self.screen_panel(df)
+    
+    def analyze_panel(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Compute the volatility report of a screened panel and save it
+        
+        Returns the results (empty when no fund could be measured).
+        """
+        # Calculate volatility
+        logger.info("\nCalculating volatility metrics...")
+        with self.metrics.stage('compute'):
+            results = self.calculate_volatility(df)
+            self.metrics.count('funds', len(results))
+        
+        if results.empty:
+            logger.error("No volatility calculations completed")
+            return results
+        
+        # Save results
+        with self.metrics.stage('write'):
+            results.to_csv(self.output_file, index=False)
+            self.metrics.count('rows', len(results))
+        logger.info(f"\n✓ Results saved to: {self.output_file}")
+        
+        if self.manifest:
+            rules = self.validator.rules() if self.validator else None
+            self.manifest.record('compute', str(self.output_file), inputs=self.input_fingerprint(), rules=rules)
+            self.manifest.save()
+        
+        return results
+    
     def run_analysis(self):
         """Main method to run the volatility analysis"""
         logger.info("="*60)
         logger.info("Starting Fund Volatility Analysis")
         logger.info("="*60)
         
-        # Load all data
-        df = self.load_all_data()
+        # Nothing to do when the inputs are exactly those behind the existing results
+        if self.manifest:
+            fingerprint = self.input_fingerprint()
+            rules = self.validator.rules() if self.validator else None
+            entry = self.manifest.get('compute', str(self.output_file))
+            if entry and entry['inputs'] == fingerprint and entry.get('rules') == rules and Path(self.output_file).exists():
+                logger.info(f"Inputs unchanged since the last run - keeping {self.output_file}")
+                self.metrics.skip('inputs unchanged', stage='compute')
+                self.metrics.save()
+                self.manifest.save()
+                return pd.read_csv(self.output_file)
+        
+        df = self.load_screened_panel()
         
         if df.empty:
             logger.error("No data to analyze")
             return
         
-        # Calculate volatility
-        logger.info("\nCalculating volatility metrics...")
-        results = self.calculate_volatility(df)
+        results = self.analyze_panel(df)
         
         if results.empty:
-            logger.error("No volatility calculations completed")
             return
         
-        # Save results
-        results.to_csv(self.output_file, index=False)
-        logger.info(f"\n✓ Results saved to: {self.output_file}")
+        self.display_summary(results)
+        self.metrics.log_summary()
+        self.metrics.save()
         
-        # Display summary
+        return results
+    
+    def display_summary(self, results: pd.DataFrame):
+        """Print the volatility analysis summary"""
         logger.info("\n" + "="*60)
         logger.info("VOLATILITY ANALYSIS SUMMARY")
         logger.info("="*60)
@@ -188,6 +651,95 @@ class VolatilityCalculator:
         print(results.nlargest(10, 'Sharpe Ratio')[['CODE ISIN', 'Code Maroclear', 'Fund Name', 
                                                       'Classification', 'Annual Volatility (%)', 
                                                       'Annualized Return (%)', 'Sharpe Ratio']].to_string(index=False))
+    
+    def run_incremental_analysis(self):
+        """Update per-fund state with new sources only and regenerate the results"""
+        logger.info("="*60)
+        logger.info("Starting Incremental Fund Volatility Analysis")
+        logger.info("="*60)
+        
+        processed_files, state = self.load_state()
+        
+        # Find dated sources that have not been folded into the state yet
+        sources = self.list_sources()
+        new_sources = [(date, name) for date, name in sources if name not in processed_files]
+        
+        # Returns are chained in date order, so a back-filled source forces a rebuild
+        processed_dates = [date for date, name in sources if name in processed_files]
+        if new_sources and processed_dates and new_sources[0][0] < max(processed_dates):
+            logger.warning(f"{new_sources[0][1]} is older than the stored state - rebuilding from scratch")
+            processed_files, state = [], self.empty_state()
+            new_sources = sources
+        
+        # So does a source that was re-published after being folded into the state, or new screening rules
+        rules = self.validator.rules() if self.validator else None
+        if self.manifest:
+            fingerprint = self.input_fingerprint()
+            entry = self.manifest.get('compute', str(self.state_file))
+            recorded = entry['inputs'] if entry else {}
+            changed = [name for name in processed_files if name in recorded and recorded[name] != fingerprint.get(name)]
+            if changed:
+                logger.warning(f"{changed[0]} changed since it was processed - rebuilding from scratch")
+                processed_files, state = [], self.empty_state()
+                new_sources = sources
+            elif processed_files and entry and entry.get('rules') != rules:
+                logger.warning("Screening rules changed since the state was built - rebuilding from scratch")
+                processed_files, state = [], self.empty_state()
+                new_sources = sources
+        
+        logger.info(f"Found {len(new_sources)} new sources")
+        
+        tables = []  # (name, rows) of every readable new source, in date order
+        for date, name in new_sources:
+            with self.metrics.stage('load'):
+                df = self.load_source(name)
+            if df is None:
+                continue
+            if self.identity:
+                df = self.identity.canonicalize(df)
+            tables.append((name, df))
+        
+        if self.identity:
+            self.identity.save()
+        
+        screened = tables
+        if self.validator and tables:
+            screened, state = self.screen_new_sources(tables, state)
+        
+        with self.metrics.stage('compute'):
+            for name, df in screened:
+                state = self.update_state(state, df)
+        processed_files.extend(name for name, _ in tables)
+        
+        if new_sources:
+            self.save_state(processed_files, state)
+            logger.info(f"✓ State saved to: {self.state_file}")
+        
+        if self.manifest:
+            self.manifest.record('compute', str(self.state_file), inputs=fingerprint, rules=rules)
+            self.manifest.save()
+        
+        if state.empty:
+            logger.error("No data to analyze")
+            return
+        
+        with self.metrics.stage('compute'):
+            results = self.results_from_state(state)
+            self.metrics.count('funds', len(results))
+        
+        if results.empty:
+            logger.error("No volatility calculations completed")
+            return
+        
+        # Save results
+        with self.metrics.stage('write'):
+            results.to_csv(self.output_file, index=False)
+            self.metrics.count('rows', len(results))
+        logger.info(f"\n✓ Results saved to: {self.output_file}")
+        
+        self.display_summary(results)
+        self.metrics.log_summary()
+        self.metrics.save()
         
         return results
 
@@ -196,13 +748,43 @@ def main():
     # Configuration
     CSV_DIR = "csv_output"  # Directory containing CSV files
     OUTPUT_FILE = "fund_volatility_analysis.csv"
+    STATE_FILE = "fund_volatility_state.json"  # Per-fund running statistics for incremental runs
+    HISTORY_DIR = None  # Set to "fund_history" to read the Parquet history store instead of CSV_DIR
+    MANIFEST_FILE = "pipeline_manifest.json"  # Shared manifest used to skip the analysis when inputs are unchanged
+    INCREMENTAL = False  # Set to True to only process CSV files added since the last run
+    FREQUENCY = "weekly"  # Tables to analyze: "daily", "weekly", "monthly" or "annual" (use one output/state file each)
+    REPORT_FILE = "fund_volatility_analysis.run.json"  # JSON run report with stage timings and counters
+    PROFILE_STAGES = []  # Stages to run under cProfile, e.g. ["load", "compute"]
+    TRACE_MEMORY_STAGES = []  # Stages whose peak Python memory is traced with tracemalloc
+    VALIDATE = True  # Screen the panel for broken series before computing statistics
+    QUARANTINE_FILE = "fund_quarantine.csv"  # Rows flagged by the screening, with the action taken
+    JUMP_ACTION = "rescale"  # VL jumps: "flag", "rescale" (unit changes and splits) or "exclude" the fund
+    STALE_ACTION = "flag"  # Unchanged VLs: "flag" or "drop" the repeats
+    IDENTITY_FILE = "fund_identity.json"  # Stable fund ids across code changes and renames (None to group by codes only)
     
+    metrics = PipelineMetrics(report_file=REPORT_FILE, profile=PROFILE_STAGES, trace_memory=TRACE_MEMORY_STAGES)
+    validator = PanelValidator(
+        jumps=JUMP_ACTION,
+        stale=STALE_ACTION,
+        quarantine_file=QUARANTINE_FILE,
+        metrics=metrics
+    ) if VALIDATE else None
     calculator = VolatilityCalculator(
         csv_dir=CSV_DIR,
-        output_file=OUTPUT_FILE
+        output_file=OUTPUT_FILE,
+        state_file=STATE_FILE,
+        history_dir=HISTORY_DIR,
+        manifest_file=MANIFEST_FILE,
+        frequency=FREQUENCY,
+        metrics=metrics,
+        validator=validator,
+        identity=FundIdentityIndex(IDENTITY_FILE) if IDENTITY_FILE else None
     )
     
-    results = calculator.run_analysis()
+    if INCREMENTAL:
+        results = calculator.run_incremental_analysis()
+    else:
+        results = calculator.run_analysis()
 
 
 if __name__ == "__main__":
@@ -1,64 +1,228 @@
+from __future__ import annotations
+
 import asyncio
-import pandas as pd
+import csv
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import logging
+import os
+import time
+
+from atomic_write import atomic_write
+from lazy_import import lazy_import
+from history_store import FundHistoryStore
+from pipeline_manifest import PipelineManifest
+from pipeline_metrics import PipelineMetrics
+
+# Loaded on first use, so a run with nothing to convert does not pay for pandas
+pd = lazy_import('pandas')
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Rows per Parquet row group when streaming a workbook to the history store
+STORE_BATCH_ROWS = 10000
+
+
+def read_and_save(xlsx_file: Path, csv_path: Path, history_store: FundHistoryStore = None, columns: list = None):
+    """Read one ASFIM workbook and save it as CSV or to the history store (runs in a worker)
+    
+    When columns are given, those columns of the table are returned so callers can use it without reading the output back.
+    """
+    # Read Excel file with headers on row 2 (skip first row, use second as header)
+    # header=1 means use row index 1 (second row) as column names
+    df = pd.read_excel(
+        xlsx_file,
+        header=1,  # Row 2 becomes the header (0-indexed, so 1 = second row)
+        engine='openpyxl'
+    )
+    
+    # Save to the history store or to CSV
+    if history_store:
+        history_store.append(df, xlsx_file.name)
+    else:
+        df.to_csv(csv_path, index=False, encoding='utf-8')
+    
+    if columns is not None:
+        return df[[c for c in columns if c in df.columns]]
+
+
+@contextmanager
+def open_workbook_rows(xlsx_file: Path):
+    """Stream (header, rows) from the first sheet of a workbook without loading it fully"""
+    # Imported here so openpyxl is only loaded when there is a workbook to convert
+    from openpyxl import load_workbook
+    
+    # read_only mode parses the sheet lazily instead of building the whole cell tree
+    workbook = load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        
+        # Skip the title row, the second row is the header (same as header=1 in pd.read_excel)
+        next(rows, None)
+        raw_header = next(rows, None) or ()
+        
+        # Name blank and duplicate headers the way pandas does ('Unnamed: 3', 'VL.1')
+        header = []
+        for i, name in enumerate(raw_header):
+            name = f"Unnamed: {i}" if name is None else str(name)
+            base, count = name, 1
+            while name in header:
+                name = f"{base}.{count}"
+                count += 1
+            header.append(name)
+        
+        def data_rows():
+            width = len(header)
+            for row in rows:
+                # Skip blank rows and align ragged rows with the header
+                if all(value is None for value in row):
+                    continue
+                yield tuple(row[:width]) + (None,) * (width - len(row))
+        
+        yield header, data_rows()
+    finally:
+        workbook.close()
+
+
+def stream_and_save(xlsx_file: Path, csv_path: Path, history_store: FundHistoryStore = None, columns: list = None):
+    """Stream one ASFIM workbook row by row to CSV (or to the history store) with flat memory use
+    
+    When columns are given, only those columns are kept in memory while streaming and returned.
+    """
+    with open_workbook_rows(xlsx_file) as (header, rows):
+        picked = [header.index(name) for name in columns or [] if name in header]
+        kept = []
+        
+        def tee(rows):
+            for row in rows:
+                kept.append(tuple(row[i] for i in picked))
+                yield row
+        
+        if columns is not None:
+            rows = tee(rows)
+        
+        if history_store:
+            # The store writes one row group per batch of rows, so only one batch is in memory
+            def batches():
+                while True:
+                    batch = list(islice(rows, STORE_BATCH_ROWS))
+                    yield pd.DataFrame.from_records(batch, columns=header)
+                    if len(batch) < STORE_BATCH_ROWS:
+                        return
+            
+            history_store.append_batches(batches(), xlsx_file.name)
+        else:
+            with atomic_write(csv_path, newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+    
+    if columns is not None:
+        return pd.DataFrame.from_records(kept, columns=[header[i] for i in picked])
+
 
 class ExcelToCSVConverter:
     def __init__(
         self, 
         input_dir: str = "asfim_downloads",
         output_dir: str = "csv_output",
-        delete_original: bool = False
+        delete_original: bool = False,
+        history_dir: str = None,
+        use_processes: bool = False,
+        max_workers: int = None,
+        max_in_flight: int = None,
+        streaming: bool = False,
+        manifest_file: str = None,
+        metrics: PipelineMetrics = None
     ):
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
         self.delete_original = delete_original
-        self.output_dir.mkdir(exist_ok=True)
+        # openpyxl parsing holds the GIL, so a process pool is needed for real parallelism
+        self.use_processes = use_processes
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Bound how many workbooks are queued or being parsed at once
+        self.max_in_flight = max_in_flight or 2 * self.max_workers
+        self.converted_files = 0
+        self.converted_bytes = 0
+        # Stream rows through openpyxl read-only mode instead of pd.read_excel
+        self.streaming = streaming
+        # Reconvert workbooks whose content changed since their last conversion when set
+        self.manifest = PipelineManifest(manifest_file) if manifest_file else None
+        # Stage timings and counters (written as a run report when it has a report file)
+        self.metrics = metrics or PipelineMetrics()
+        # Append to the Parquet history store instead of writing CSV files when set
+        self.history_store = FundHistoryStore(history_dir) if history_dir else None
+        if self.history_store is None:
+            self.output_dir.mkdir(exist_ok=True)
         
-    async def convert_single_file(self, xlsx_file: Path) -> bool:
+    async def convert_single_file(self, xlsx_file: Path, executor: ProcessPoolExecutor = None) -> bool:
         """Convert a single Excel file to CSV"""
+        converted, _ = await self.convert_file(xlsx_file, executor)
+        return converted
+    
+    async def convert_file(self, xlsx_file: Path, executor: ProcessPoolExecutor = None,
+                           columns: list = None) -> tuple[bool, pd.DataFrame]:
+        """Convert a single Excel file, returning whether it succeeded and the requested columns of its table
+        
+        The table is None when no columns are requested or the existing output is already up to date.
+        """
         try:
             csv_filename = xlsx_file.stem + '.csv'
             csv_path = self.output_dir / csv_filename
             
-            # Skip if CSV already exists
-            if csv_path.exists():
-                logger.info(f"Skipping {xlsx_file.name} - CSV already exists")
-                return True
+            if self.history_store:
+                output_exists = self.history_store.has_source(xlsx_file.name)
+            else:
+                output_exists = csv_path.exists()
+            
+            # Skip if CSV (or history store partition) already exists and the workbook is unchanged
+            source_hash = self.manifest.file_hash(xlsx_file) if self.manifest else None
+            if output_exists:
+                entry = self.manifest.get('convert', xlsx_file.name) if self.manifest else None
+                if self.manifest and entry is None:
+                    # Output from before the manifest existed: adopt it as is
+                    self.manifest.record('convert', xlsx_file.name, source_sha256=source_hash)
+                if entry is None or entry['source_sha256'] == source_hash:
+                    logger.info(f"Skipping {xlsx_file.name} - already converted")
+                    self.metrics.skip('already converted', stage='conversion')
+                    return True, None
+                logger.info(f"{xlsx_file.name} changed since its last conversion")
             
             logger.info(f"Converting: {xlsx_file.name}")
+            file_size = xlsx_file.stat().st_size
             
-            # Read Excel file with headers on row 2 (skip first row, use second as header)
-            # header=1 means use row index 1 (second row) as column names
-            def read_and_save():
-                df = pd.read_excel(
-                    xlsx_file,
-                    header=1,  # Row 2 becomes the header (0-indexed, so 1 = second row)
-                    engine='openpyxl'
-                )
-                
-                # Save to CSV
-                df.to_csv(csv_path, index=False, encoding='utf-8')
-                
-            # Run pandas operations in thread pool to avoid blocking
-            await asyncio.to_thread(read_and_save)
+            convert = stream_and_save if self.streaming else read_and_save
+            if executor:
+                # Parse in a worker process
+                loop = asyncio.get_running_loop()
+                table = await loop.run_in_executor(executor, convert, xlsx_file, csv_path, self.history_store, columns)
+            else:
+                # Run pandas operations in thread pool to avoid blocking
+                table = await asyncio.to_thread(convert, xlsx_file, csv_path, self.history_store, columns)
             
-            logger.info(f"✓ Converted: {csv_filename}")
+            self.converted_files += 1
+            self.converted_bytes += file_size
+            self.metrics.count('files', stage='conversion')
+            self.metrics.count('bytes', file_size, stage='conversion')
+            if self.manifest:
+                self.manifest.record('convert', xlsx_file.name, source_sha256=source_hash)
+            logger.info(f"✓ Converted: {xlsx_file.name}")
             
             # Delete original if requested
             if self.delete_original:
                 xlsx_file.unlink()
                 logger.info(f"  Deleted original: {xlsx_file.name}")
             
-            return True
+            return True, table
             
         except Exception as e:
             logger.error(f"✗ Failed to convert {xlsx_file.name}: {e}")
-            return False
+            self.metrics.skip('failed', stage='conversion')
+            return False, None
     
     async def convert_all_files(self):
         """Convert all Excel files in the input directory"""
@@ -70,16 +234,49 @@ class ExcelToCSVConverter:
             return
         
         logger.info(f"Found {len(xlsx_files)} Excel files to convert")
-        logger.info(f"Output directory: {self.output_dir.absolute()}")
+        output_dir = self.history_store.store_dir if self.history_store else self.output_dir
+        logger.info(f"Output directory: {output_dir.absolute()}")
         
-        # Convert files concurrently
-        tasks = [self.convert_single_file(file) for file in xlsx_files]
-        results = await asyncio.gather(*tasks)
+        # Convert files concurrently, with at most max_in_flight workbooks queued or parsing
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        executor = ProcessPoolExecutor(max_workers=self.max_workers) if self.use_processes else None
+        
+        async def convert_bounded(file):
+            async with semaphore:
+                return await self.convert_single_file(file, executor)
+        
+        self.converted_files = 0
+        self.converted_bytes = 0
+        start = time.perf_counter()
+        try:
+            with self.metrics.stage('conversion'):
+                tasks = [convert_bounded(file) for file in xlsx_files]
+                results = await asyncio.gather(*tasks)
+        finally:
+            if executor:
+                executor.shutdown()
+            if self.manifest:
+                self.manifest.save()
+        elapsed = time.perf_counter() - start
         
         success_count = sum(results)
         logger.info(f"\n{'='*50}")
         logger.info(f"Conversion complete: {success_count}/{len(xlsx_files)} files succeeded")
-        logger.info(f"CSV files saved to: {self.output_dir.absolute()}")
+        logger.info(f"Files saved to: {output_dir.absolute()}")
+        self.report_throughput(elapsed)
+        self.metrics.log_summary()
+        self.metrics.save()
+    
+    def report_throughput(self, elapsed: float):
+        """Log conversion throughput to help size the worker count"""
+        mode = f"{self.max_workers} processes" if self.use_processes else "threads"
+        megabytes = self.converted_bytes / 1024 / 1024
+        files_per_s = self.converted_files / elapsed if elapsed > 0 else 0
+        mb_per_s = megabytes / elapsed if elapsed > 0 else 0
+        logger.info(
+            f"Throughput ({mode}, {self.max_in_flight} in flight): {self.converted_files} files, "
+            f"{megabytes:.1f} MB in {elapsed:.2f}s -> {files_per_s:.2f} files/s, {mb_per_s:.2f} MB/s"
+        )
 
 
 async def main():
@@ -87,11 +284,26 @@ async def main():
     INPUT_DIR = "asfim_downloads"      # Directory containing .xlsx files
     OUTPUT_DIR = "csv_output"          # Directory for CSV output
     DELETE_ORIGINAL = False            # Set to True to delete .xlsx after conversion
+    HISTORY_DIR = None                 # Set to "fund_history" to append to the Parquet history store instead
+    USE_PROCESSES = True               # Parse workbooks in a process pool (False = thread pool)
+    MAX_WORKERS = None                 # Worker processes (None = CPU count)
+    MAX_IN_FLIGHT = None               # Workbooks queued or parsing at once (None = 2 x MAX_WORKERS)
+    STREAMING = False                  # Set to True to stream rows with openpyxl read-only mode
+    MANIFEST_FILE = "pipeline_manifest.json"  # Shared manifest used to skip unchanged workbooks
+    REPORT_FILE = "fund_volatility_analysis.run.json"  # JSON run report with stage timings and counters
+    PROFILE_STAGES = []                # e.g. ["conversion"] (profiles this process, not the pool workers)
     
     converter = ExcelToCSVConverter(
         input_dir=INPUT_DIR,
         output_dir=OUTPUT_DIR,
-        delete_original=DELETE_ORIGINAL
+        delete_original=DELETE_ORIGINAL,
+        history_dir=HISTORY_DIR,
+        use_processes=USE_PROCESSES,
+        max_workers=MAX_WORKERS,
+        max_in_flight=MAX_IN_FLIGHT,
+        streaming=STREAMING,
+        manifest_file=MANIFEST_FILE,
+        metrics=PipelineMetrics(report_file=REPORT_FILE, profile=PROFILE_STAGES)
     )
     
     await converter.convert_all_files()
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from atomic_write import atomic_write
+from compute_funds_stats import FUND_KEYS, RESAMPLE_PERIODS, VolatilityCalculator
+from fund_identity import FundIdentityIndex
+from lazy_import import lazy_import
+from merge_volatility_data import VOLATILITY_COLUMNS, normalize_isin
+from pipeline_manifest import PipelineManifest
+from pipeline_metrics import PipelineMetrics
+from validate_panel import PanelValidator
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Fund descriptors listed in the index, with their key in the frontend's JSON
+INDEX_COLUMNS = {
+    'Dénomination OPCVM': 'name',
+    'Société de Gestion': 'manager',
+    'Classification': 'classification',
+    'Nature juridique': 'legalForm',
+}
+
+# Layout of the optional binary shards, described in the index for the frontend
+BINARY_LAYOUT = {
+    'dtype': 'float32',
+    'byteOrder': 'little',
+    'arrays': ['daysSinceEpoch', 'vl', 'return'],  # Each array has 'points' values, one after the other
+}
+
+
+class FundSeriesExporter:
+    """Per-fund VL and return series for the frontend, as a slim index plus one shard per fund
+
+    The index lists every fund with its descriptors and latest metrics, so the fund list loads
+    without any history. Each shard holds one fund's downsampled series, so the fund page needs
+    a single small request. Shards are keyed by ISIN and only rewritten when their data changed
+    (hash of the fund's dates and VLs, recorded in the manifest).
+    """
+
+    def __init__(
+        self,
+        calculator: VolatilityCalculator = None,
+        output_dir: str = "src/frontend/public/series",
+        volatility_file: str = None,
+        manifest_file: str = "pipeline_manifest.json",
+        frequency: str = None,
+        max_points: int = 260,
+        binary: bool = False,
+        compress: bool = True,
+        metrics: PipelineMetrics = None
+    ):
+        if frequency is not None and frequency not in RESAMPLE_PERIODS:
+            raise ValueError(f"Unknown frequency {frequency!r}, expected one of {list(RESAMPLE_PERIODS)}")
+
+        self.calculator = calculator or VolatilityCalculator(validator=PanelValidator())
+        self.output_dir = Path(output_dir)
+        self.volatility_file = Path(volatility_file) if volatility_file else None  # Metrics added to the index when set
+        self.manifest = PipelineManifest(manifest_file)
+        self.frequency = frequency  # Downsample the series to this frequency (None keeps the tables' frequency)
+        self.max_points = max_points  # Most recent points kept per fund
+        self.binary = binary  # Also write each series as a float32 array (.f32)
+        self.compress = compress  # Also write a gzip copy of every file (.gz) for static hosting
+        self.metrics = metrics or self.calculator.metrics
+
+    def settings(self) -> dict:
+        """Export settings recorded with each shard, so changing them regenerates every shard"""
+        return {
+            'frequency': self.frequency or self.calculator.frequency,
+            'max_points': self.max_points,
+            'binary': self.binary,
+            'compress': self.compress,
+        }
+
+    def series(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Downsampled VL and return series of every fund, sorted by fund and date"""
+        if self.frequency and self.frequency != self.calculator.frequency:
+            df = self.calculator.resample_panel(df, self.frequency)
+        series = self.calculator.compute_returns(df)
+
+        # Keep the most recent points of each fund
+        from_end = series.groupby(FUND_KEYS, sort=False, observed=True).cumcount(ascending=False)
+        return series[(from_end < self.max_points).to_numpy()].reset_index(drop=True)
+
+    def shard_ids(self, funds: pd.DataFrame) -> pd.Series:
+        """File name of each fund's shard: its ISIN, with the Maroclear code when an ISIN is shared"""
+        isin = normalize_isin(funds['CODE ISIN'].astype('object'))
+        shared = isin.duplicated(keep=False)
+        maroclear = funds['Code Maroclear'].astype('string').fillna('')
+        return isin.where(~shared, isin + '-' + maroclear).astype(str)
+
+    def data_hashes(self, series: pd.DataFrame, starts: np.ndarray) -> list[str]:
+        """Hash of each fund's dates and VLs, computed for all funds at once"""
+        row_hashes = pd.util.hash_pandas_object(series[['date', 'VL']], index=False).to_numpy()
+        # Sums wrap around in uint64, which keeps them usable as hashes
+        fund_hashes = np.add.reduceat(row_hashes, starts) if len(starts) else row_hashes[:0]
+        counts = np.diff(np.append(starts, len(series)))
+        return [f"{value:016x}{count:x}" for value, count in zip(fund_hashes.tolist(), counts.tolist())]
+
+    def write_file(self, path: Path, data: bytes):
+        """Write a file (and its gzip copy) through a temporary file so readers never see partial data"""
+        outputs = [(path, data)]
+        if self.compress:
+            # mtime=0 keeps the compressed bytes identical for identical data
+            outputs.append((path.with_name(path.name + '.gz'), gzip.compress(data, mtime=0)))
+
+        for output, content in outputs:
+            with atomic_write(output, 'wb') as f:
+                f.write(content)
+            self.metrics.count('bytes', len(content))
+
+    def shard_files(self, shard_id: str) -> list[Path]:
+        """Every file written for a shard"""
+        names = [f"{shard_id}.json"] + ([f"{shard_id}.f32"] if self.binary else [])
+        paths = [self.output_dir / name for name in names]
+        return paths + ([path.with_name(path.name + '.gz') for path in paths] if self.compress else [])
+
+    def write_shard(self, shard_id: str, dates: np.ndarray, vl: np.ndarray, returns: np.ndarray):
+        """Write one fund's series as compact JSON (and as a float32 array when enabled)"""
+        shard = {
+            'id': shard_id,
+            'frequency': self.frequency or self.calculator.frequency,
+            'dates': np.datetime_as_string(dates, unit='D').tolist(),
+            'vl': np.round(vl, 4).tolist(),
+            # The first point has no return; JSON has no NaN, so it is written as null
+            'returns': [None if np.isnan(r) else r for r in np.round(returns, 6).tolist()],
+        }
+        self.write_file(self.output_dir / f"{shard_id}.json",
+                        json.dumps(shard, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+
+        if self.binary:
+            days = dates.astype('datetime64[D]').astype(np.float64)
+            self.write_file(self.output_dir / f"{shard_id}.f32",
+                            np.concatenate([days, vl, returns]).astype('<f4').tobytes())
+
+    def load_volatility(self) -> pd.DataFrame:
+        """Latest volatility and Sharpe ratio by normalized ISIN (empty when there is no volatility file)"""
+        if self.volatility_file is None or not self.volatility_file.exists():
+            return pd.DataFrame(columns=['Annual Volatility (%)', 'Sharpe Ratio'])
+
+        df_vol = pd.read_csv(self.volatility_file, usecols=lambda c: c.strip() in VOLATILITY_COLUMNS)
+        df_vol.columns = [c.strip() for c in df_vol.columns]
+        df_vol = df_vol.astype(VOLATILITY_COLUMNS)
+        df_vol.index = normalize_isin(df_vol['CODE ISIN'])
+        return df_vol[~df_vol.index.duplicated(keep='last')][['Annual Volatility (%)', 'Sharpe Ratio']]
+
+    def build_index(self, funds: pd.DataFrame, series: pd.DataFrame, starts: np.ndarray,
+                    ends: np.ndarray, hashes: list[str]) -> dict:
+        """Slim index of every exported fund: descriptors, latest VL and metrics, and where its shard is"""
+        index = pd.DataFrame({
+            'id': funds['shard_id'].to_numpy(),
+            'isin': funds['CODE ISIN'].astype('string').to_numpy(),
+            'maroclear': funds['Code Maroclear'].astype('string').to_numpy(),
+        })
+        for column, key in INDEX_COLUMNS.items():
+            index[key] = funds[column].astype('string').to_numpy()
+
+        index['points'] = ends - starts
+        index['start'] = np.datetime_as_string(series['date'].to_numpy()[starts], unit='D')
+        index['end'] = np.datetime_as_string(series['date'].to_numpy()[ends - 1], unit='D')
+        index['latestVL'] = series['VL'].to_numpy()[ends - 1]
+
+        volatility = self.load_volatility().reindex(normalize_isin(funds['CODE ISIN'].astype('object')))
+        index['annualVolatility'] = volatility['Annual Volatility (%)'].to_numpy(dtype='float64')
+        index['sharpeRatio'] = volatility['Sharpe Ratio'].to_numpy(dtype='float64')
+        # Short content version, appended to shard URLs so browsers never use a stale cached shard
+        index['version'] = [value[:12] for value in hashes]
+
+        records = index.astype(object).where(index.notna(), None).to_dict('records')
+        payload = {
+            'generated': datetime.now().isoformat(timespec='seconds'),
+            'frequency': self.frequency or self.calculator.frequency,
+            'maxPoints': self.max_points,
+            'funds': records,
+        }
+        if self.binary:
+            payload['binaryLayout'] = BINARY_LAYOUT
+        return payload
+
+    def export(self, df: pd.DataFrame = None) -> dict:
+        """Write the index and every changed shard, and remove shards of funds no longer listed"""
+        if df is None:
+            df = self.calculator.load_screened_panel()
+        if df.empty:
+            logger.error("No data to export")
+            return {}
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with self.metrics.stage('export'):
+            series = self.series(df)
+
+            # Group boundaries of the (sorted) series, one group per fund
+            new_fund = series[FUND_KEYS].ne(series[FUND_KEYS].shift()).any(axis=1).to_numpy()
+            starts = np.flatnonzero(new_fund)
+            ends = np.append(starts[1:], len(series))
+
+            funds = series.iloc[starts][FUND_KEYS].reset_index(drop=True)
+            funds = funds.merge(df.drop_duplicates(FUND_KEYS)[FUND_KEYS + list(INDEX_COLUMNS)], on=FUND_KEYS, how='left')
+            funds['shard_id'] = self.shard_ids(funds).to_numpy()
+            hashes = self.data_hashes(series, starts)
+
+            settings = self.settings()
+            dates = series['date'].to_numpy()
+            vl = series['VL'].to_numpy(dtype='float64')
+            returns = series['return'].to_numpy(dtype='float64')
+
+            stats = {'written': 0, 'unchanged': 0, 'removed': 0}
+            for shard_id, start, end, data_hash in zip(funds['shard_id'], starts, ends, hashes):
+                entry = self.manifest.get('export', shard_id)
+                unchanged = (entry is not None and entry['data_hash'] == data_hash and entry['settings'] == settings
+                             and all(path.exists() for path in self.shard_files(shard_id)))
+                if unchanged:
+                    stats['unchanged'] += 1
+                    continue
+                self.write_shard(shard_id, dates[start:end], vl[start:end], returns[start:end])
+                self.manifest.record('export', shard_id, data_hash=data_hash, settings=settings)
+                stats['written'] += 1
+
+            # Shards of funds that are no longer in the data
+            listed = set(funds['shard_id'])
+            for shard_id in [key for key in self.manifest.entries.get('export', {}) if key not in listed]:
+                for path in self.shard_files(shard_id):
+                    path.unlink(missing_ok=True)
+                self.manifest.forget('export', shard_id)
+                stats['removed'] += 1
+
+            index = self.build_index(funds, series, starts, ends, hashes)
+            self.write_file(self.output_dir / 'index.json',
+                            json.dumps(index, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+            self.manifest.save()
+
+            self.metrics.count('funds', len(funds))
+            self.metrics.count('shards', stats['written'])
+            self.metrics.skip('unchanged', stats['unchanged'])
+
+        logger.info(f"✓ Exported {len(funds)} funds to {self.output_dir}: {stats['written']} shards written, "
+                    f"{stats['unchanged']} unchanged, {stats['removed']} removed")
+        return stats
+
+
+def main():
+    # Configuration
+    CSV_DIR = "csv_output"  # Directory containing CSV files
+    HISTORY_DIR = None  # Set to "fund_history" to read the Parquet history store instead of CSV_DIR
+    OUTPUT_DIR = "src/frontend/public/series"  # Served by the frontend as /series/
+    VOLATILITY_FILE = "fund_volatility_analysis.csv"  # Volatility and Sharpe ratio listed in the index
+    MANIFEST_FILE = "pipeline_manifest.json"  # Records the data hash of each shard so unchanged ones are skipped
+    FREQUENCY = "weekly"  # Tables to export: "daily", "weekly", "monthly" or "annual"
+    EXPORT_FREQUENCY = None  # Downsample the series, e.g. "weekly" from daily tables (None keeps FREQUENCY)
+    MAX_POINTS = 260  # Most recent points per fund (5 years of weekly data)
+    BINARY = False  # Also write each series as a float32 array (.f32)
+    COMPRESS = True  # Also write gzip copies (.gz) for hosts serving precompressed files
+    REPORT_FILE = "fund_volatility_analysis.run.json"  # JSON run report with stage timings and counters
+    VALIDATE = True  # Screen the panel for broken series before exporting the series
+    IDENTITY_FILE = "fund_identity.json"  # Stable fund ids across code changes and renames (None to group by codes only)
+
+    metrics = PipelineMetrics(report_file=REPORT_FILE)
+    exporter = FundSeriesExporter(
+        calculator=VolatilityCalculator(
+            csv_dir=CSV_DIR,
+            history_dir=HISTORY_DIR,
+            frequency=FREQUENCY,
+            metrics=metrics,
+            validator=PanelValidator(metrics=metrics) if VALIDATE else None,
+            identity=FundIdentityIndex(IDENTITY_FILE) if IDENTITY_FILE else None
+        ),
+        output_dir=OUTPUT_DIR,
+        volatility_file=VOLATILITY_FILE,
+        manifest_file=MANIFEST_FILE,
+        frequency=EXPORT_FREQUENCY,
+        max_points=MAX_POINTS,
+        binary=BINARY,
+        compress=COMPRESS,
+        metrics=metrics
+    )
+
+    exporter.export()
+    metrics.log_summary()
+    metrics.save()
+
+
+if __name__ == "__main__":
+    main()
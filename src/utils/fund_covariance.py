@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+from atomic_write import atomic_write
+from compute_funds_stats import NOMINAL_PERIODS_PER_YEAR, VolatilityCalculator, periods_per_year
+from fund_identity import FundIdentityIndex
+from lazy_import import lazy_import
+from validate_panel import PanelValidator
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class FundCovarianceCalculator:
+    """Shrinkage covariance and correlation matrix of fund returns for portfolio simulation"""
+
+    def __init__(
+        self,
+        calculator: VolatilityCalculator = None,
+        output_file: str = "fund_covariance.npz",
+        min_observations: int = 26
+    ):
+        self.calculator = calculator or VolatilityCalculator(validator=PanelValidator())
+        self.output_file = Path(output_file)
+        self.min_observations = min_observations  # Funds with fewer returns are left out of the matrix
+
+    def return_matrix(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Aligned date x ISIN matrix of period returns (NaN where a fund has no return for a date)"""
+        clean = self.calculator.compute_returns(df)
+
+        # One VL per ISIN and date (the last listed wins, as in the merge step)
+        vl = clean.drop_duplicates(['CODE ISIN', 'date'], keep='last').pivot(
+            index='date', columns='CODE ISIN', values='VL'
+        ).sort_index()
+
+        # Returns are taken between consecutive table dates only, so a missing week leaves
+        # NaN for that week and the next one instead of a two-week return
+        returns = vl / vl.shift(1) - 1
+        returns = returns.iloc[1:]
+
+        counts = returns.notna().sum()
+        return returns.loc[:, counts >= self.min_observations]
+
+    def shrunk_correlation(self, returns: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, float]:
+        """Ledoit-Wolf correlation matrix shrunk towards the identity, with the per-fund std
+
+        Each fund is standardized with its own observed mean and std. Products are summed over
+        the dates both funds have a return (pairwise-complete), with BLAS matrix products instead
+        of pairwise loops. The shrinkage intensity is the Ledoit-Wolf estimate on the
+        standardized returns with missing values at zero.
+        """
+        values = returns.to_numpy(dtype=np.float64)
+        observed = ~np.isnan(values)
+
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0, ddof=1)
+        std[std == 0] = np.nan
+
+        z = np.where(observed, (values - mean) / std, 0.0)
+        z[:, np.isnan(std)] = 0.0
+        n_periods, n_funds = z.shape
+
+        # Pairwise-complete sample correlation
+        cross = z.T @ z
+        overlap = observed.T.astype(np.float64) @ observed.astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sample = np.where(overlap > 1, cross / (overlap - 1), 0.0)
+        sample = np.clip(sample, -1.0, 1.0)
+        np.fill_diagonal(sample, 1.0)
+
+        # Ledoit-Wolf intensity: estimation noise of the sample matrix over its distance to the target
+        scaled = cross / n_periods
+        mu = np.trace(scaled) / n_funds
+        squared = z ** 2
+        beta = ((squared.T @ squared).sum() / n_periods - (scaled ** 2).sum()) / (n_funds * n_periods)
+        delta = ((scaled - mu * np.eye(n_funds)) ** 2).sum() / n_funds
+        shrinkage = float(min(beta, delta) / delta) if delta > 0 else 1.0
+        shrinkage = max(shrinkage, 0.0)
+
+        correlation = (1 - shrinkage) * sample + shrinkage * np.eye(n_funds)
+
+        # Pairwise-complete estimates can be slightly indefinite, clip to a valid correlation matrix
+        eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+        if eigenvalues[0] < 1e-10:
+            eigenvalues = np.maximum(eigenvalues, 1e-10)
+            correlation = (eigenvectors * eigenvalues) @ eigenvectors.T
+            scale = 1 / np.sqrt(np.diag(correlation))
+            correlation = correlation * np.outer(scale, scale)
+
+        return correlation, std, shrinkage
+
+    def calculate_covariance(self, df: pd.DataFrame) -> dict:
+        """Annualized shrinkage covariance matrix of every fund with enough history"""
+        return self.covariance_from_returns(self.return_matrix(df))
+
+    def covariance_from_returns(self, returns: pd.DataFrame) -> dict:
+        """Annualized shrinkage covariance matrix of the funds of a return_matrix"""
+        # Constant funds carry no risk information and would make the correlation undefined
+        stds = returns.std()
+        returns = returns.loc[:, stds > 0]
+
+        if returns.shape[1] == 0:
+            return {}
+
+        correlation, std, shrinkage = self.shrunk_correlation(returns)
+        periods = periods_per_year(returns.index, default=NOMINAL_PERIODS_PER_YEAR[self.calculator.frequency])
+        annual_std = std * np.sqrt(periods)
+        covariance = correlation * np.outer(annual_std, annual_std)
+
+        return {
+            'isin': returns.columns.to_numpy(dtype=str),
+            'covariance': covariance.astype(np.float32),
+            'correlation': correlation.astype(np.float32),
+            'volatility': annual_std.astype(np.float32),
+            'observations': returns.notna().sum().to_numpy(dtype=np.int32),
+            'shrinkage': np.float32(shrinkage),
+            'periods_per_year': np.float32(periods),
+            'start_date': str(returns.index.min().date()),
+            'end_date': str(returns.index.max().date()),
+        }
+
+    def save(self, matrix: dict):
+        """Write the matrix as an uncompressed .npz (float32 arrays plus the ISIN index)"""
+        with atomic_write(self.output_file, 'wb') as f:
+            np.savez(f, **matrix)
+
+    def run_analysis(self):
+        """Load the VL panel, compute the covariance matrix and save it"""
+        logger.info("="*60)
+        logger.info("Starting Fund Covariance Analysis")
+        logger.info("="*60)
+
+        df = self.calculator.load_screened_panel()
+
+        if df.empty:
+            logger.error("No data to analyze")
+            return
+
+        matrix = self.calculate_covariance(df)
+
+        if not matrix:
+            logger.error(f"No fund has at least {self.min_observations} returns")
+            return
+
+        self.save(matrix)
+        n_funds = len(matrix['isin'])
+        logger.info(f"✓ {n_funds}x{n_funds} covariance matrix "
+                    f"({matrix['start_date']} to {matrix['end_date']}, shrinkage {matrix['shrinkage']:.3f})")
+        logger.info(f"✓ Results saved to: {self.output_file}")
+
+        return matrix
+
+
+class FundCovariance:
+    """Loaded covariance matrix for fast portfolio variance queries"""
+
+    def __init__(self, matrix_file: str = "fund_covariance.npz"):
+        with np.load(matrix_file) as data:
+            self.isin = data['isin']
+            self.covariance = data['covariance']
+            self.correlation = data['correlation']
+            self.volatility = data['volatility']
+            self.shrinkage = float(data['shrinkage'])
+            self.end_date = str(data['end_date'])  # Last date of the returns it was estimated on
+        self.index = {isin: i for i, isin in enumerate(self.isin)}
+
+    def portfolio_volatility(self, weights: dict) -> float:
+        """Annualized volatility (%) of a portfolio given as {ISIN: weight}"""
+        positions = [self.index[isin] for isin in weights]
+        w = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+
+        # Only the held funds' sub-matrix is needed for w^T Σ w
+        sub = self.covariance[np.ix_(positions, positions)]
+        return float(np.sqrt(max(w @ sub @ w, 0.0)) * 100)
+
+
+def main():
+    # Configuration
+    CSV_DIR = "csv_output"  # Directory containing CSV files
+    HISTORY_DIR = None  # Set to "fund_history" to read the Parquet history store instead of CSV_DIR
+    OUTPUT_FILE = "fund_covariance.npz"
+    MIN_OBSERVATIONS = 26  # Minimum returns for a fund to enter the matrix (half a year of weeks)
+    VALIDATE = True  # Screen the panel for broken series before estimating the matrix
+    IDENTITY_FILE = "fund_identity.json"  # Stable fund ids across code changes and renames (None to group by codes only)
+
+    covariance = FundCovarianceCalculator(
+        calculator=VolatilityCalculator(
+            csv_dir=CSV_DIR,
+            history_dir=HISTORY_DIR,
+            validator=PanelValidator() if VALIDATE else None,
+            identity=FundIdentityIndex(IDENTITY_FILE) if IDENTITY_FILE else None
+        ),
+        output_file=OUTPUT_FILE,
+        min_observations=MIN_OBSERVATIONS
+    )
+
+    covariance.run_analysis()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import logging
+import math
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from compute_funds_stats import DAYS_PER_YEAR, NOMINAL_PERIODS_PER_YEAR, VolatilityCalculator
+from history_store import extract_frequency_from_filename
+from lazy_import import lazy_import
+from pipeline_metrics import PipelineMetrics
+
+pd = lazy_import('pandas')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Panel column -> funds table column
+FUND_COLUMNS = {
+    'CODE ISIN': 'isin',
+    'Code Maroclear': 'maroclear',
+    'Dénomination OPCVM': 'name',
+    'Société de Gestion': 'manager',
+    'Nature juridique': 'legal_form',
+    'Dépositaire': 'depositary',
+    'Classification': 'classification',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS funds (
+    fund_id INTEGER PRIMARY KEY,
+    isin TEXT NOT NULL,
+    maroclear INTEGER NOT NULL,
+    name TEXT,
+    manager TEXT,
+    legal_form TEXT,
+    depositary TEXT,
+    classification TEXT,
+    UNIQUE (isin, maroclear)
+);
+CREATE TABLE IF NOT EXISTS vl (
+    fund_id INTEGER NOT NULL REFERENCES funds (fund_id),
+    frequency TEXT NOT NULL,
+    date TEXT NOT NULL,
+    vl REAL NOT NULL,
+    PRIMARY KEY (fund_id, frequency, date)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS vl_by_date ON vl (frequency, date);
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    frequency TEXT NOT NULL,
+    date TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    rows INTEGER NOT NULL,
+    loaded TEXT NOT NULL
+);
+"""
+
+# Period returns of every fund, from the previous VL of the same frequency
+RETURNS_VIEW = """
+CREATE VIEW IF NOT EXISTS vl_returns AS
+SELECT fund_id, frequency, date, vl,
+       vl / LAG(vl) OVER w - 1 AS ret,
+       ln(vl / LAG(vl) OVER w) AS log_ret
+FROM vl
+WINDOW w AS (PARTITION BY fund_id, frequency ORDER BY date)
+"""
+
+# Per-fund statistics with the formulas of VolatilityCalculator.build_results (sample std, annualized
+# from each fund's observed date spacing), over the VLs as published: PanelValidator does not
+# screen them. {vl_filter} restricts the VLs a query looks at.
+STATS_SQL = """
+WITH window_vl AS (
+    SELECT fund_id, frequency, date, vl FROM vl WHERE {vl_filter}
+), returns AS (
+    SELECT fund_id, frequency, date, vl,
+           vl / LAG(vl) OVER (PARTITION BY fund_id, frequency ORDER BY date) - 1 AS ret,
+           ROW_NUMBER() OVER (PARTITION BY fund_id, frequency ORDER BY date) AS first_rank,
+           ROW_NUMBER() OVER (PARTITION BY fund_id, frequency ORDER BY date DESC) AS last_rank
+    FROM window_vl
+), moments AS (
+    SELECT fund_id, frequency,
+           COUNT(*) AS data_points,
+           MIN(date) AS start_date,
+           MAX(date) AS end_date,
+           MAX(CASE WHEN first_rank = 1 THEN vl END) AS starting_vl,
+           MAX(CASE WHEN last_rank = 1 THEN vl END) AS latest_vl,
+           COUNT(ret) AS return_count,
+           AVG(ret) AS mean_return,
+           (SUM(ret * ret) - SUM(ret) * SUM(ret) / COUNT(ret)) / (COUNT(ret) - 1) AS return_variance
+    FROM returns
+    GROUP BY fund_id, frequency
+    HAVING COUNT(*) >= 2
+), annualized AS (
+    SELECT *,
+           CASE WHEN julianday(end_date) > julianday(start_date)
+                THEN (data_points - 1) * {days_per_year} / (julianday(end_date) - julianday(start_date))
+                ELSE {nominal_periods} END AS periods_per_year,
+           sqrt(MAX(return_variance, 0)) AS period_volatility
+    FROM moments
+)
+SELECT f.isin, f.maroclear, f.name, f.manager, f.legal_form, f.depositary, f.classification,
+       a.frequency, a.data_points, a.start_date, a.end_date, a.periods_per_year,
+       a.period_volatility * 100 AS period_volatility_pct,
+       a.period_volatility * sqrt(a.periods_per_year) * 100 AS annual_volatility_pct,
+       a.mean_return * 100 AS mean_return_pct,
+       a.mean_return * a.periods_per_year * 100 AS annualized_return_pct,
+       CASE WHEN a.period_volatility > 0
+            THEN a.mean_return * a.periods_per_year / (a.period_volatility * sqrt(a.periods_per_year))
+            ELSE 0 END AS sharpe_ratio,
+       a.latest_vl, a.starting_vl,
+       (a.latest_vl / a.starting_vl - 1) * 100 AS total_return_pct
+FROM annualized a JOIN funds f USING (fund_id)
+"""
+
+
+def stats_sql(vl_filter: str = "1", nominal_periods: str = None) -> str:
+    """Per-fund statistics query over the VLs matching a filter"""
+    if nominal_periods is None:
+        # Fallback periods per year of each frequency, for funds whose dates span no time
+        nominal_periods = "CASE frequency " + " ".join(
+            f"WHEN '{frequency}' THEN {periods}" for frequency, periods in NOMINAL_PERIODS_PER_YEAR.items()
+        ) + " END"
+    return STATS_SQL.format(vl_filter=vl_filter, days_per_year=DAYS_PER_YEAR, nominal_periods=nominal_periods)
+
+
+VIEWS = [
+    RETURNS_VIEW,
+    f"CREATE VIEW IF NOT EXISTS fund_stats AS {stats_sql()}",
+    # Latest statistics with Sharpe and volatility ranks within each frequency
+    """
+    CREATE VIEW IF NOT EXISTS fund_volatility AS
+    SELECT *,
+           RANK() OVER (PARTITION BY frequency ORDER BY annual_volatility_pct DESC) AS volatility_rank,
+           RANK() OVER (PARTITION BY frequency ORDER BY sharpe_ratio DESC) AS sharpe_rank
+    FROM fund_stats
+    """,
+]
+
+
+class FundDatabase:
+    """Embedded SQLite database of fund descriptors and VL history, with the metrics as SQL views
+
+    Tables: funds (one row per ISIN and Maroclear code), vl (one row per fund, frequency and
+    date) and sources (tables already loaded, with the size and mtime of their file). Views:
+    vl_returns (period and log returns by window function), fund_stats (the calculator's
+    per-fund statistics over the whole history) and fund_volatility (fund_stats with volatility
+    and Sharpe ranks). fund_stats() gives the same statistics over a date range. The file
+    can also be opened with any SQLite client.
+
+    VLs are stored unscreened, as published. For a series PanelValidator drops or repairs (e.g. a
+    unit change rescaled), the views therefore disagree with fund_volatility_analysis.csv, which
+    is computed after screening.
+    """
+
+    def __init__(self, db_file: str = "fund_history.db", metrics: PipelineMetrics = None):
+        self.db_file = Path(db_file)
+        self.metrics = metrics or PipelineMetrics()
+        self.connection = sqlite3.connect(self.db_file)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.register_math_functions()
+        self.connection.executescript(SCHEMA)
+        for view in VIEWS:
+            self.connection.execute(view)
+        self.connection.commit()
+
+    def register_math_functions(self):
+        """Provide sqrt() and ln() when SQLite was built without its math functions"""
+        try:
+            self.connection.execute("SELECT sqrt(1), ln(1)")
+        except sqlite3.OperationalError:
+            self.connection.create_function("sqrt", 1, lambda x: math.sqrt(x) if x is not None and x >= 0 else None,
+                                            deterministic=True)
+            self.connection.create_function("ln", 1, lambda x: math.log(x) if x is not None and x > 0 else None,
+                                            deterministic=True)
+
+    def close(self):
+        self.connection.close()
+
+    def source_stamp(self, path: Path) -> tuple[int, int]:
+        """Size and modification time of a source file ((None, None) when it has no file)"""
+        if path is None or not Path(path).exists():
+            return None, None
+        stat = Path(path).stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def is_loaded(self, name: str, path: Path = None) -> bool:
+        """Whether a source was loaded and its file is unchanged since"""
+        row = self.connection.execute("SELECT size, mtime_ns FROM sources WHERE name = ?", (name,)).fetchone()
+        return row is not None and tuple(row) == self.source_stamp(path)
+
+    def fund_ids(self, df: pd.DataFrame) -> pd.Series:
+        """fund_id of every row, adding the funds seen for the first time"""
+        funds = df[list(FUND_COLUMNS)].drop_duplicates(['CODE ISIN', 'Code Maroclear']).rename(columns=FUND_COLUMNS)
+        funds = funds.astype(object).where(funds.notna(), None)
+        funds['maroclear'] = funds['maroclear'].map(int)
+        self.connection.executemany(
+            f"INSERT OR IGNORE INTO funds ({', '.join(FUND_COLUMNS.values())}) "
+            f"VALUES ({', '.join('?' * len(FUND_COLUMNS))})",
+            funds.itertuples(index=False, name=None)
+        )
+
+        known = pd.read_sql_query("SELECT fund_id, isin, maroclear FROM funds", self.connection)
+        keys = pd.DataFrame({'isin': df['CODE ISIN'].astype(str).to_numpy(),
+                             'maroclear': df['Code Maroclear'].astype('int64').to_numpy()})
+        return keys.merge(known, on=['isin', 'maroclear'], how='left')['fund_id']
+
+    def add_table(self, name: str, df: pd.DataFrame, path: Path = None):
+        """Store one prepared performance table (replacing an earlier load of the same source)"""
+        frequency = extract_frequency_from_filename(name)
+        df = df.dropna(subset=['CODE ISIN', 'Code Maroclear'])
+        df = df[df['VL'] > 0]
+        date = pd.Timestamp(df['date'].iloc[0]).strftime('%Y-%m-%d') if len(df) else None
+
+        with self.connection:
+            if date is not None:
+                # A re-published table replaces all VLs of its date
+                self.connection.execute("DELETE FROM vl WHERE frequency = ? AND date = ?", (frequency, date))
+                facts = pd.DataFrame({
+                    'fund_id': self.fund_ids(df).to_numpy(),
+                    'frequency': frequency,
+                    'date': pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d').to_numpy(),
+                    'vl': df['VL'].to_numpy(dtype='float64'),
+                })
+                # The last row wins when a fund is listed twice in a table
+                facts = facts.drop_duplicates(['fund_id', 'date'], keep='last')
+                self.connection.executemany("INSERT INTO vl VALUES (?, ?, ?, ?)",
+                                            facts.itertuples(index=False, name=None))
+            size, mtime_ns = self.source_stamp(path)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, frequency, date or '', size, mtime_ns, len(df), datetime.now().isoformat(timespec='seconds'))
+            )
+        self.metrics.count('rows', len(df))
+
+    def sync(self, calculator: VolatilityCalculator, tables: dict = None) -> int:
+        """Load the calculator's sources that are new or changed since they were stored
+
+        tables maps source names to tables already prepared in this run (e.g. streamed from the
+        converter), which are stored without reading their file again. Returns the number of
+        sources loaded.
+        """
+        tables = tables or {}
+        loaded = 0
+        with self.metrics.stage('database'):
+            for _, name in calculator.list_sources():
+                path = calculator.source_path(name)
+                if self.is_loaded(name, path):
+                    self.metrics.skip('already loaded')
+                    continue
+                table = tables.get(name)
+                if table is None:
+                    table = calculator.load_source(name)
+                if table is None:
+                    continue
+                self.add_table(name, table, path)
+                self.metrics.count('sources')
+                loaded += 1
+
+        logger.info(f"✓ Database {self.db_file}: {loaded} sources loaded")
+        return loaded
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        """Run any SQL query (tables, views or ad hoc) and return the result as a DataFrame"""
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def fund_stats(self, frequency: str = 'weekly', start: str = None, end: str = None,
+                   last_periods: int = None) -> pd.DataFrame:
+        """Per-fund statistics over a date range, or over the last periods of the history"""
+        conditions = ["frequency = :frequency"]
+        if last_periods:
+            # Dates of the last periods published at this frequency, whichever funds they list
+            conditions.append(
+                "date >= (SELECT MIN(date) FROM (SELECT DISTINCT date FROM vl WHERE frequency = :frequency "
+                "ORDER BY date DESC LIMIT :last_periods))"
+            )
+        if start:
+            conditions.append("date >= :start")
+        if end:
+            conditions.append("date <= :end")
+
+        sql = stats_sql(" AND ".join(conditions), nominal_periods=str(NOMINAL_PERIODS_PER_YEAR[frequency]))
+        return self.query(f"{sql} ORDER BY annual_volatility_pct DESC", params={
+            'frequency': frequency, 'start': start, 'end': end, 'last_periods': last_periods
+        })
+
+
+def main():
+    # Configuration
+    CSV_DIR = "csv_output"  # Directory containing CSV files
+    HISTORY_DIR = None  # Set to "fund_history" to read the Parquet history store instead of CSV_DIR
+    DB_FILE = "fund_history.db"  # SQLite database kept up to date with the sources
+    FREQUENCY = "weekly"  # Tables to load: "daily", "weekly", "monthly" or "annual"
+    REPORT_FILE = "fund_volatility_analysis.run.json"  # JSON run report with stage timings and counters
+
+    metrics = PipelineMetrics(report_file=REPORT_FILE)
+    database = FundDatabase(DB_FILE, metrics=metrics)
+    database.sync(VolatilityCalculator(csv_dir=CSV_DIR, history_dir=HISTORY_DIR, frequency=FREQUENCY, metrics=metrics))
+
+    # Examples of questions answered without re-running the analysis
+    print("\nVolatility by management company over the last 26 periods:")
+    stats = database.fund_stats(FREQUENCY, last_periods=26)
+    print(stats.groupby('manager')['annual_volatility_pct'].agg(['mean', 'count'])
+          .sort_values('mean', ascending=False).head(10).to_string())
+
+    print("\nFunds whose Sharpe ratio rank changed the most (whole history vs last 26 periods):")
+    recent = stats.assign(recent_rank=stats['sharpe_ratio'].rank(ascending=False, method='min'))
+    history = database.query("SELECT isin, maroclear, name, sharpe_rank FROM fund_volatility WHERE frequency = ?",
+                             (FREQUENCY,))
+    ranks = history.merge(recent[['isin', 'maroclear', 'recent_rank']], on=['isin', 'maroclear'])
+    ranks['rank_change'] = ranks['sharpe_rank'] - ranks['recent_rank']
+    print(ranks.reindex(ranks['rank_change'].abs().sort_values(ascending=False).index).head(10).to_string(index=False))
+
+    database.close()
+    metrics.log_summary()
+    metrics.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import json
+import logging
+from collections import Counter
+from pathlib import Path
+
+from atomic_write import atomic_write
+from lazy_import import lazy_import
+
+pd = lazy_import('pandas')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Words dropped from names before matching: legal forms and articles that come and go between releases
+NAME_STOP_WORDS = ['fcp', 'sicav', 'opcvm', 'le', 'la', 'les', 'l', 'de', 'du', 'des', 'd', 'et']
+
+# Kinds of alias looked up when matching
+ALIAS_KINDS = ['isin', 'maroclear', 'name']
+
+# Recorded for each fund: its aliases and its published names as written (the latest is the display name)
+FUND_FIELDS = ALIAS_KINDS + ['label']
+
+
+def normalize_isin(values: pd.Series) -> pd.Series:
+    """Identity key for ISIN codes (trimmed, upper case, '' when missing)"""
+    return values.astype('string').fillna('').str.strip().str.upper()
+
+
+def normalize_maroclear(values: pd.Series) -> pd.Series:
+    """Identity key for Maroclear codes (digits without leading zeros or '.0', '' when missing)"""
+    codes = values.astype('string').fillna('').str.strip().str.replace(r'\.0+$', '', regex=True)
+    return codes.str.lstrip('0').where(codes.str.fullmatch(r'\d+'), '')
+
+
+def normalize_fund_name(values: pd.Series) -> pd.Series:
+    """Identity key for fund names: accent-stripped lower case words, without legal forms or articles"""
+    names = (
+        values.astype('string').fillna('')
+        .str.normalize('NFKD').str.encode('ascii', errors='ignore').str.decode('ascii')
+        .str.lower()
+        .str.replace(r'[^a-z0-9]+', ' ', regex=True)
+    )
+    stop_words = rf"\b(?:{'|'.join(NAME_STOP_WORDS)})\b"
+    return names.str.replace(stop_words, ' ', regex=True).str.split().str.join(' ')
+
+
+def trigrams(name: str) -> set[str]:
+    """Character trigrams of a normalized name, padded so short words still have some"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FundIdentityIndex:
+    """Persistent map from ISIN, Maroclear code and fund names to a stable fund id
+
+    Rows are matched on their ISIN first, then their Maroclear code, then their normalized name
+    (accents, punctuation, legal forms and articles removed), then the closest name by trigram
+    similarity. A name match is never accepted between two different ISINs. Every alias seen
+    for a fund is kept with the first and last date it was seen, so a fund keeps its id across
+    code changes and renames. Unmatched rows get new ids when registering.
+    """
+
+    def __init__(self, index_file: str = "fund_identity.json", min_similarity: float = 0.7,
+                 min_margin: float = 0.1):
+        self.index_file = Path(index_file)
+        self.min_similarity = min_similarity  # Trigram Jaccard similarity a fuzzy name match needs
+        self.min_margin = min_margin  # Lead over the second best candidate, so ambiguous names stay unmatched
+        self.funds = {}  # fund_id -> {field: {alias: [first seen, last seen]}} for every field of FUND_FIELDS
+        self.dirty = False
+
+        if self.index_file.exists():
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                self.funds = {int(fund_id): fund for fund_id, fund in json.load(f)['funds'].items()}
+        self.next_id = max(self.funds, default=0) + 1
+        self.build_lookups()
+
+    def build_lookups(self):
+        """Alias -> fund_id maps and the trigram index of names"""
+        self.lookups = {kind: {} for kind in ALIAS_KINDS}
+        self.name_trigrams = {}  # trigram -> fund ids with a name containing it
+        self.fund_trigrams = {}  # fund_id -> {name: trigrams}
+        for fund_id, fund in self.funds.items():
+            for kind in ALIAS_KINDS:
+                for alias in fund[kind]:
+                    self.add_lookup(kind, alias, fund_id)
+
+    def add_lookup(self, kind: str, alias: str, fund_id: int):
+        """Make an alias resolve to a fund (the first fund keeps an alias shared by two)"""
+        self.lookups[kind].setdefault(alias, fund_id)
+        if kind == 'name':
+            grams = trigrams(alias)
+            self.fund_trigrams.setdefault(fund_id, {})[alias] = grams
+            for gram in grams:
+                self.name_trigrams.setdefault(gram, set()).add(fund_id)
+
+    def fund_isins(self, fund_id: int) -> set[str]:
+        """Every ISIN a fund was listed under"""
+        return set(self.funds[fund_id]['isin'])
+
+    def fuzzy_match(self, name: str, isin: str) -> int:
+        """Fund whose closest name is similar enough to a name, and clearly closer than any other"""
+        grams = trigrams(name)
+        shared = Counter(fund_id for gram in grams for fund_id in self.name_trigrams.get(gram, ()))
+        scores = []
+        for fund_id in shared:
+            # A different ISIN means a different fund, however close the names are
+            if isin and self.fund_isins(fund_id) and isin not in self.fund_isins(fund_id):
+                continue
+            best = max(len(grams & other) / len(grams | other) for other in self.fund_trigrams[fund_id].values())
+            scores.append((best, fund_id))
+
+        scores.sort(reverse=True)
+        if not scores or scores[0][0] < self.min_similarity:
+            return None
+        if len(scores) > 1 and scores[0][0] - scores[1][0] < self.min_margin:
+            return None
+        return scores[0][1]
+
+    def match(self, isin: str, maroclear: str, name: str) -> int:
+        """Fund id of one set of identifiers (None when nothing matches)"""
+        if isin and isin in self.lookups['isin']:
+            return self.lookups['isin'][isin]
+
+        for kind, alias in (('maroclear', maroclear), ('name', name)):
+            fund_id = self.lookups[kind].get(alias) if alias else None
+            # A code or name known under another ISIN belongs to another fund
+            if fund_id is not None and not (isin and self.fund_isins(fund_id) and isin not in self.fund_isins(fund_id)):
+                return fund_id
+
+        return self.fuzzy_match(name, isin) if name else None
+
+    def record(self, fund_id: int, kind: str, alias: str, first: str, last: str):
+        """Add an alias to a fund or widen the dates it was seen"""
+        if not alias:
+            return
+        seen = self.funds[fund_id][kind].get(alias)
+        if seen is None:
+            self.funds[fund_id][kind][alias] = [first, last]
+            if kind in self.lookups:
+                self.add_lookup(kind, alias, fund_id)
+        elif first < seen[0] or last > seen[1]:
+            seen[0], seen[1] = min(seen[0], first), max(seen[1], last)
+        else:
+            return
+        self.dirty = True
+
+    def resolve(self, isins: pd.Series, maroclear: pd.Series | None, names: pd.Series, dates: pd.Series = None,
+                register: bool = True) -> pd.Series:
+        """Fund id of every row (<NA> when unmatched and not registering)
+
+        Rows are reduced to their distinct identifiers first, so only those are matched. When
+        registering, unmatched identifiers become new funds and the aliases of every row are
+        recorded with the dates they were seen. maroclear is None for sources without those codes.
+        """
+        if maroclear is None:
+            maroclear = pd.Series(pd.NA, index=isins.index, dtype='string')
+        raw = pd.DataFrame({
+            'isin': isins.astype('string').to_numpy(),
+            'maroclear': maroclear.astype('string').to_numpy(),
+            'label': names.astype('string').str.strip().to_numpy(),
+        })
+        if dates is None:
+            dates = pd.Series(pd.Timestamp.now().normalize(), index=raw.index)
+        raw['date'] = pd.to_datetime(pd.Series(dates).to_numpy())
+
+        # Normalize and match each distinct set of identifiers once, not every row
+        columns = ['isin', 'maroclear', 'label']
+        codes = raw.groupby(columns, sort=False, dropna=False).ngroup().to_numpy()
+        distinct = raw.groupby(codes).agg(
+            isin=('isin', 'first'), maroclear=('maroclear', 'first'), label=('label', 'first'),
+            first=('date', 'min'), last=('date', 'max'))
+        distinct['first'] = distinct['first'].dt.strftime('%Y-%m-%d')
+        distinct['last'] = distinct['last'].dt.strftime('%Y-%m-%d')
+        distinct['name'] = normalize_fund_name(distinct['label'])
+        distinct['isin'] = normalize_isin(distinct['isin'])
+        distinct['maroclear'] = normalize_maroclear(distinct['maroclear'])
+        distinct['label'] = distinct['label'].fillna('')
+
+        fund_ids = pd.Series(pd.NA, index=distinct.index, dtype='Int64')
+        # Earliest identifiers first, so a fund's first listing creates it and later ones join it
+        ordered = distinct.sort_values('first', kind='stable')[FUND_FIELDS + ['first', 'last']]
+        for group, isin, maroclear_code, name, label, first, last in ordered.itertuples(name=None):
+            fund_id = self.match(isin, maroclear_code, name)
+            if fund_id is None and register and (isin or maroclear_code or name):
+                fund_id = self.next_id
+                self.next_id += 1
+                self.funds[fund_id] = {kind: {} for kind in FUND_FIELDS}
+                self.dirty = True
+            if fund_id is not None and register:
+                for kind, alias in zip(FUND_FIELDS, (isin, maroclear_code, name, label)):
+                    self.record(fund_id, kind, alias, first, last)
+            fund_ids[group] = fund_id
+
+        return pd.Series(fund_ids.to_numpy()[codes], index=isins.index, name='Fund ID')
+
+    def canonical(self) -> pd.DataFrame:
+        """First ISIN and Maroclear code and latest published name of every fund, indexed by fund id
+
+        The codes a fund was first seen under never change, so they stay valid keys for stored
+        results (incremental state, merged JSON) whatever codes the fund takes later.
+        """
+        rows = {}
+        for fund_id, fund in self.funds.items():
+            first_isin = min(fund['isin'].items(), key=lambda item: item[1][0])[0] if fund['isin'] else None
+            first_code = min(fund['maroclear'].items(), key=lambda item: item[1][0])[0] if fund['maroclear'] else None
+            latest_label = max(fund['label'].items(), key=lambda item: item[1][1])[0] if fund['label'] else None
+            rows[fund_id] = {'isin': first_isin, 'maroclear': first_code, 'label': latest_label}
+        canonical = pd.DataFrame.from_dict(rows, orient='index', columns=['isin', 'maroclear', 'label'])
+        canonical.index.name = 'Fund ID'
+        return canonical
+
+    def canonicalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Panel with every row under its fund's canonical ISIN, Maroclear code and name, plus its Fund ID
+
+        A fund whose Maroclear code changed or that was renamed stays one series in the analysis.
+        """
+        fund_ids = self.resolve(df['CODE ISIN'], df['Code Maroclear'], df['Dénomination OPCVM'], df['date'])
+        canonical = self.canonical().reindex(fund_ids.to_numpy())
+        df = df.assign(**{
+            'CODE ISIN': canonical['isin'].to_numpy(),
+            'Code Maroclear': pd.to_numeric(canonical['maroclear']).astype('Int64').to_numpy(),
+            'Dénomination OPCVM': canonical['label'].to_numpy(),
+            'Fund ID': fund_ids.to_numpy(),
+        })
+        for col in ['CODE ISIN', 'Dénomination OPCVM']:
+            df[col] = df[col].astype('string').astype('category')
+        return df
+
+    def save(self):
+        """Write the index if anything changed"""
+        if not self.dirty:
+            return
+
+        with atomic_write(self.index_file) as f:
+            json.dump({'funds': {str(fund_id): fund for fund_id, fund in sorted(self.funds.items())}},
+                      f, indent=2, ensure_ascii=False)
+        self.dirty = False
+        logger.info(f"✓ Fund identity index saved to: {self.index_file} ({len(self.funds)} funds)")
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import re
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from atomic_write import atomic_write
+from lazy_import import lazy_import
+
+# Loaded on first use: the file name helpers are imported by every stage, the store only by some
+pd = lazy_import('pandas')
+pa = lazy_import('pyarrow')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Low-cardinality text columns stored as dictionary-encoded categoricals
+CATEGORICAL_COLUMNS = [
+    'CODE ISIN', 'Dénomination OPCVM', 'Société de Gestion', 'Nature juridique',
+    'Dépositaire', 'Classification', 'Périodicité VL', 'Souscripteurs'
+]
+
+# ASFIM table categories, recognized from the words used in their file names
+FREQUENCY_KEYWORDS = {
+    'quotidien': 'daily',
+    'hebdomadaire': 'weekly',
+    'mensuel': 'monthly',
+    'annuel': 'annual',
+}
+
+# Frequency assumed for files whose name does not say (the pipeline historically pulled weekly tables)
+DEFAULT_FREQUENCY = 'weekly'
+
+
+def extract_date_from_filename(filename: str) -> datetime:
+    """Extract date from filename like 'Tableau des performances quotidiennes au 02-10-2025.csv'"""
+    try:
+        # Match pattern: DD-MM-YYYY
+        match = re.search(r'(\d{2})-(\d{2})-(\d{4})', filename)
+        if match:
+            day, month, year = match.groups()
+            return datetime(int(year), int(month), int(day))
+    except Exception as e:
+        logger.warning(f"Could not extract date from {filename}: {e}")
+    return None
+
+
+def extract_frequency_from_filename(filename: str) -> str:
+    """Extract the table frequency from a filename like 'Tableau des performances hebdomadaires au 26-09-2025.csv'"""
+    name = filename.lower()
+    for keyword, frequency in FREQUENCY_KEYWORDS.items():
+        if keyword in name:
+            return frequency
+    return DEFAULT_FREQUENCY
+
+
+class FundHistoryStore:
+    """Typed Parquet store of ASFIM performance tables, partitioned by date (one file per source table)"""
+
+    def __init__(self, store_dir: str = "fund_history"):
+        self.store_dir = Path(store_dir)
+
+    def partition_path(self, source_name: str) -> Path:
+        """Path of the Parquet file holding one source table, e.g. 'fund_history/2025-10-02/<stem>.parquet'"""
+        date = extract_date_from_filename(source_name)
+        if date is None:
+            raise ValueError(f"Could not extract date from {source_name}")
+        return self.store_dir / date.strftime('%Y-%m-%d') / f"{Path(source_name).stem}.parquet"
+
+    def has_source(self, source_name: str) -> bool:
+        """Check whether a source table has already been stored"""
+        return self.partition_path(source_name).exists()
+
+    def partitions(self, dates: list[datetime] = None, frequency: str = None) -> list[Path]:
+        """List stored Parquet files in chronological order, optionally restricted to some dates or one frequency"""
+        paths = sorted(self.store_dir.glob('*/*.parquet'))
+        if dates is not None:
+            wanted = {date.strftime('%Y-%m-%d') for date in dates}
+            paths = [path for path in paths if path.parent.name in wanted]
+        if frequency is not None:
+            paths = [path for path in paths if extract_frequency_from_filename(path.name) == frequency]
+        return paths
+
+    def normalize(self, df: pd.DataFrame, date: datetime) -> pd.DataFrame:
+        """Apply the store's column types to one performance table"""
+        df = df.copy()
+        df.columns = [str(c).strip() for c in df.columns]
+
+        df['VL'] = pd.to_numeric(df['VL'], errors='coerce').astype('float64')
+        if 'Code Maroclear' in df.columns:
+            df['Code Maroclear'] = pd.to_numeric(df['Code Maroclear'], errors='coerce').astype('Int64')
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype('string').astype('category')
+        df['date'] = pd.Timestamp(date)
+
+        return df
+
+    def append(self, df: pd.DataFrame, source_name: str):
+        """Write one source table as its own partition file (replacing any previous version)"""
+        path = self.partition_path(source_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with atomic_write(path, 'wb') as f:
+            self.normalize(df, extract_date_from_filename(source_name)).to_parquet(f, index=False)
+
+    def append_batches(self, batches, source_name: str):
+        """Write one source table given as successive DataFrames, one Parquet row group each
+
+        Only one batch is held in memory at a time. The columns typed by normalize keep their types,
+        the others take those of the first batch (see batch_schema) and later batches are cast to them.
+        """
+        import pyarrow.parquet as pq
+
+        path = self.partition_path(source_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        date = extract_date_from_filename(source_name)
+
+        with atomic_write(path, 'wb') as f:
+            writer = None
+            try:
+                for batch in batches:
+                    table = pa.Table.from_pandas(self.normalize(batch, date), preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(f, self.batch_schema(table.schema))
+                    writer.write_table(table.cast(writer.schema))
+            finally:
+                # Closed before atomic_write closes the file, even when a batch failed
+                if writer is not None:
+                    writer.close()
+            if writer is None:
+                raise ValueError(f"No rows to store for {source_name}")
+
+    def batch_schema(self, schema: pa.Schema) -> pa.Schema:
+        """Schema of a partition written in batches, wide enough for every batch
+
+        Dictionary indices are widened to int32 since later batches may have more categories, and
+        columns that are blank in the first batch are stored as text, which any later value casts to.
+        """
+        fields = []
+        for field in schema:
+            if pa.types.is_dictionary(field.type):
+                field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+            elif pa.types.is_null(field.type):
+                field = field.with_type(pa.string())
+            fields.append(field)
+        return pa.schema(fields, metadata=schema.metadata)
+
+    def read_table(self, path: Path, columns: list[str] = None) -> pa.Table:
+        """Read one partition file as an Arrow table, skipping requested columns it does not have"""
+        import pyarrow.parquet as pq
+
+        if columns:
+            available = pq.read_schema(path).names
+            columns = [c for c in columns if c in available]
+        return pq.read_table(path, columns=columns)
+
+    def read_partition(self, path: Path, columns: list[str] = None) -> pd.DataFrame:
+        """Read one partition file"""
+        return self.read_table(path, columns).to_pandas()
+
+    def read(self, columns: list[str] = None, dates: list[datetime] = None, frequency: str = None) -> pd.DataFrame:
+        """Read the stored history, optionally restricted to some columns, dates and one frequency"""
+        tables = [self.read_table(path, columns) for path in self.partitions(dates, frequency)]
+
+        if not tables:
+            return pd.DataFrame()
+
+        # Concatenate in Arrow and convert once; per-partition dictionaries are unified into one categorical
+        df = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+
+        return df
+
+    def import_csv_dir(self, csv_dir: str = "csv_output", overwrite: bool = False) -> int:
+        """Import existing per-date CSV files into the store"""
+        imported = 0
+        for csv_file in sorted(Path(csv_dir).glob('*.csv')):
+            if extract_date_from_filename(csv_file.name) is None:
+                logger.warning(f"Skipping {csv_file.name} - could not extract date")
+                continue
+            if self.has_source(csv_file.name) and not overwrite:
+                continue
+            try:
+                self.append(pd.read_csv(csv_file), csv_file.name)
+                imported += 1
+                logger.info(f"Imported: {csv_file.name}")
+            except Exception as e:
+                logger.error(f"Error importing {csv_file.name}: {e}")
+
+        return imported
+
+
+def main():
+    # Configuration
+    CSV_DIR = "csv_output"        # Directory containing existing CSV files
+    STORE_DIR = "fund_history"    # Directory for the Parquet history store
+
+    store = FundHistoryStore(store_dir=STORE_DIR)
+    imported = store.import_csv_dir(CSV_DIR)
+    logger.info(f"✓ Imported {imported} CSV files into {store.store_dir.absolute()}")
+
+
+if __name__ == "__main__":
+    main()
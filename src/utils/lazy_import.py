@@ -0,0 +1,30 @@
+import sys
+import types
+import importlib
+import importlib.util
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that imports it on first attribute access"""
+
+    def __getattr__(self, attr: str):
+        # The regular import lock makes other threads wait until the module is fully initialized
+        module = importlib.import_module(self.__name__)
+        # Later lookups find the module's attributes directly
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str):
+    """Import a top-level module on first attribute access instead of now
+
+    Keeps pandas, numpy, httpx... out of the start-up time of scripts and code paths that never
+    use them. A missing module still fails here, like a regular import. Submodules
+    ('pyarrow.parquet') are imported where they are used.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    return LazyModule(name)
@@ -1,69 +1,153 @@
+from __future__ import annotations
+
 import json
-import pandas as pd
 from pathlib import Path
 
+from atomic_write import atomic_write
+from fund_identity import FundIdentityIndex
+from lazy_import import lazy_import
+from pipeline_metrics import PipelineMetrics
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# Columns read from the volatility CSV and their types ("Code Maroclear" may be missing)
+VOLATILITY_COLUMNS = {
+    "CODE ISIN": "string",
+    "Code Maroclear": "string",
+    "Fund Name": "string",
+    "Annual Volatility (%)": "float64",
+    "Sharpe Ratio": "float64",
+}
+
+
+def normalize_isin(values: pd.Series) -> pd.Series:
+    """Join key for ISIN codes (trimmed, upper case, '' when missing)"""
+    return values.fillna("").astype("string").str.strip().str.upper()
+
+
+def normalize_name(values: pd.Series) -> pd.Series:
+    """Join key for fund names (trimmed, lower case, '' when missing)"""
+    return values.fillna("").astype("string").str.strip().str.lower()
+
+
 def merge_volatility_into_funds(funds_json_path="src/frontend/funds.json",
                                 volatility_csv_path="fund_volatility_analysis.csv",
-                                output_path=None):
+                                output_path=None,
+                                metrics=None,
+                                identity_file=None):
     """
     Merge Annual Volatility (%) and Sharpe Ratio from fund_volatility_analysis.csv
-    into funds.json based on CODE ISIN or fund name matching.
+    into funds.json based on the fund identity index, CODE ISIN or fund name matching.
 
     Args:
         funds_json_path (str): Path to existing funds.json
         volatility_csv_path (str): Path to CSV containing volatility data
         output_path (str): Optional output path (defaults to overwrite input JSON)
+        metrics (PipelineMetrics): Optional stage timings and counters, recorded as the 'merge' stage
+        identity_file (str): Optional fund identity index, matched before ISIN and name
+
+    Returns:
+        dict: Match statistics (identity hits, ISIN hits, name fallbacks, misses)
     """
 
-    funds_file = Path(funds_json_path)
-    csv_file = Path(volatility_csv_path)
+    metrics = metrics or PipelineMetrics()
+    with metrics.stage("merge"):
+        identity = FundIdentityIndex(identity_file) if identity_file else None
+        stats = merge_files(Path(funds_json_path), Path(volatility_csv_path), output_path, metrics, identity)
+
+    metrics.save()
+    return stats
+
+
+def merge_files(funds_file, csv_file, output_path, run_metrics, identity=None):
+    """Keyed join of the volatility CSV into the funds JSON (see merge_volatility_into_funds)"""
 
     if not funds_file.exists():
         raise FileNotFoundError(f"Funds JSON not found: {funds_file}")
     if not csv_file.exists():
         raise FileNotFoundError(f"Volatility CSV not found: {csv_file}")
 
-    # Load both files
+    # Load both files, reading only the needed CSV columns
     with open(funds_file, "r", encoding="utf-8") as f:
         funds = json.load(f)
 
-    df_vol = pd.read_csv(csv_file)
-
-    # Normalize column names for easier access
+    df_vol = pd.read_csv(csv_file, usecols=lambda c: c.strip() in VOLATILITY_COLUMNS)
     df_vol.columns = [c.strip() for c in df_vol.columns]
+    # Older volatility files have no Maroclear codes: only the columns present are cast
+    df_vol = df_vol.astype({column: dtype for column, dtype in VOLATILITY_COLUMNS.items() if column in df_vol.columns})
+    run_metrics.count("files", 2)
+    run_metrics.count("bytes", funds_file.stat().st_size + csv_file.stat().st_size)
+    run_metrics.count("rows", len(df_vol))
+
+    metrics = ["Annual Volatility (%)", "Sharpe Ratio"]
+
+    # Keyed lookup tables (the last row wins for duplicate keys)
+    df_vol["isin_key"] = normalize_isin(df_vol["CODE ISIN"])
+    df_vol["name_key"] = normalize_name(df_vol["Fund Name"])
+    by_isin = df_vol[df_vol["isin_key"] != ""].drop_duplicates("isin_key", keep="last").set_index("isin_key")[metrics]
+    by_name = df_vol[df_vol["name_key"] != ""].drop_duplicates("name_key", keep="last").set_index("name_key")[metrics]
+
+    # Extract ISIN and Name from funds.json structure
+    keys = pd.DataFrame({
+        "isin": normalize_isin(pd.Series([fund.get("CODE ISIN") for fund in funds], dtype="object")),
+        "name": normalize_name(pd.Series([fund.get("OPCVM") for fund in funds], dtype="object")),
+    })
+
+    # Join on the stable fund id first (codes, accent-free and fuzzy names), then on ISIN, then on the name
+    id_hit = np.zeros(len(funds), dtype=bool)
+    by_id_values = np.full((len(funds), len(metrics)), np.nan)
+    if identity is not None:
+        vol_ids = identity.resolve(df_vol["CODE ISIN"], df_vol.get("Code Maroclear"), df_vol["Fund Name"], register=False)
+        fund_ids = identity.resolve(
+            pd.Series([fund.get("CODE ISIN") for fund in funds], dtype="object"),
+            pd.Series([fund.get("Code Maroclear") for fund in funds], dtype="object"),
+            pd.Series([fund.get("OPCVM") for fund in funds], dtype="object"),
+            register=False
+        )
+        by_id = df_vol.assign(fund_id=vol_ids).dropna(subset=["fund_id"]).drop_duplicates("fund_id", keep="last")
+        by_id = by_id.set_index("fund_id")[metrics]
+        id_hit = fund_ids.isin(by_id.index).to_numpy()
+        by_id_values = by_id.reindex(fund_ids).to_numpy(dtype="float64")
+
+    isin_hit = ~id_hit & keys["isin"].isin(by_isin.index).to_numpy()
+    name_hit = ~id_hit & ~isin_hit & keys["name"].isin(by_name.index).to_numpy()
+    by_isin_values = by_isin.reindex(keys["isin"]).to_numpy(dtype="float64")
+    by_name_values = by_name.reindex(keys["name"]).to_numpy(dtype="float64")
+    values = np.where(id_hit[:, None], by_id_values,
+                      np.where(isin_hit[:, None], by_isin_values, np.where(name_hit[:, None], by_name_values, np.nan)))
+
+    matched = id_hit | isin_hit | name_hit
+    for fund, is_matched, (volatility, sharpe) in zip(funds, matched, values):
+        # The CSV stores volatility as a percentage, so we use it directly.
+        # Missing metrics are written as null so the output stays valid JSON.
+        fund["annualVolatility"] = float(volatility) if is_matched and not np.isnan(volatility) else None
+        fund["sharpeRatio"] = float(sharpe) if is_matched and not np.isnan(sharpe) else None
 
-    # Build lookup tables
-    isin_map = {str(row["CODE ISIN"]).strip(): row for _, row in df_vol.iterrows()}
-    name_map = {str(row["Fund Name"]).strip().lower(): row for _, row in df_vol.iterrows()}
-
-    updated_count = 0
-    for fund in funds:
-        # Correctly extract ISIN and Name from funds.json structure
-        isin = str(fund.get("CODE ISIN") or "").strip()
-        name = str(fund.get("OPCVM") or "").strip().lower()
-
-        row = None
-        if isin and isin in isin_map:
-            row = isin_map[isin]
-        elif name in name_map:
-            row = name_map[name]
-
-        if row is not None:
-            # The CSV stores volatility as a percentage, so we use it directly.
-            fund["annualVolatility"] = float(row.get("Annual Volatility (%)", 0))
-            fund["sharpeRatio"] = float(row.get("Sharpe Ratio", 0))
-            updated_count += 1
-        else:
-            fund["annualVolatility"] = None
-            fund["sharpeRatio"] = None
-
-    # Write output
     output_path = Path(output_path or funds_file)
-    with open(output_path, "w", encoding="utf-8") as f:
+    with atomic_write(output_path) as f:
         json.dump(funds, f, indent=2, ensure_ascii=False)
 
+    stats = {
+        "identity_hits": int(id_hit.sum()),
+        "isin_hits": int(isin_hit.sum()),
+        "name_fallbacks": int(name_hit.sum()),
+        "misses": int((~matched).sum()),
+    }
+
+    updated_count = int(matched.sum())
     print(f"✓ Updated {updated_count}/{len(funds)} funds with volatility and Sharpe Ratio data.")
+    print(f"  Identity matches: {stats['identity_hits']}, ISIN matches: {stats['isin_hits']}, name fallbacks: {stats['name_fallbacks']}, unmatched: {stats['misses']}")
     print(f"→ Output saved to: {output_path}")
 
+    run_metrics.count("funds", updated_count)
+    run_metrics.skip("no ISIN or name match", stats["misses"])
+
+    return stats
+
 if __name__ == "__main__":
-    merge_volatility_into_funds()
\ No newline at end of file
+    # Record the merge in the same run report as the other stages
+    merge_volatility_into_funds(
+        metrics=PipelineMetrics(report_file="fund_volatility_analysis.run.json"),
+        identity_file="fund_identity.json" if Path("fund_identity.json").exists() else None
+    )
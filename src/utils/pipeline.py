@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import copy
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from compute_funds_stats import PANEL_COLUMNS, VolatilityCalculator
+from convert_xlsx_to_csv import ExcelToCSVConverter
+from export_fund_series import FundSeriesExporter
+from fund_database import FundDatabase
+from fund_identity import FundIdentityIndex
+from history_store import extract_date_from_filename, extract_frequency_from_filename
+from merge_volatility_data import merge_volatility_into_funds
+from pipeline_metrics import PipelineMetrics
+from scrape_funds_data import ASFIMScraper
+from validate_panel import PanelValidator
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Settings of a weekly refresh; a config file overrides any of them (sections key by key)
+DEFAULT_CONFIG = {
+    "url": "https://www.asfim.ma/publications/tableaux-des-performances/",
+    "download_dir": "asfim_downloads",
+    "csv_dir": "csv_output",
+    "history_dir": None,                 # Set to "fund_history" to use the Parquet history store instead of CSV
+    "output_file": "fund_volatility_analysis.csv",
+    "funds_json": "src/frontend/funds.json",  # Set to null to skip the merge
+    "database_file": None,               # Set to "fund_history.db" to keep the SQLite analytics database up to date
+    "series_dir": None,                  # Set to "src/frontend/public/series" to export per-fund series shards
+    "manifest_file": "pipeline_manifest.json",
+    "report_file": "fund_volatility_analysis.run.json",
+    "frequency": "weekly",
+    "validate": True,                    # Screen the panel for broken series before computing statistics
+    "quarantine_file": "fund_quarantine.csv",
+    "identity_file": "fund_identity.json",  # Stable fund ids across code changes and renames (null to match on codes only)
+    "headless": True,
+    "queue_size": 16,                    # Converted tables waiting for the calculator at most
+    "profile": [],                       # Stages to run under cProfile
+    "trace_memory": [],                  # Stages whose peak Python memory is traced
+    "scraper": {
+        "max_files": 104,
+        "category_filter": "Hebdomadaire",
+        "show_100_per_page": True,
+        "max_concurrent_downloads": 8,
+        "max_retries": 4,
+        "discovery_mode": "auto"
+    },
+    "converter": {
+        "use_processes": True,
+        "max_workers": None,
+        "max_in_flight": None,
+        "streaming": False,
+        "delete_original": False
+    },
+    "validation": {
+        "jump_z": 8.0,
+        "min_jump": 0.2,
+        "stale_periods": 4,
+        "duplicates": "keep_last",
+        "conflicts": "flag",
+        "jumps": "rescale",
+        "stale": "flag"
+    },
+    "series": {
+        "frequency": None,
+        "max_points": 260,
+        "binary": False,
+        "compress": True
+    }
+}
+
+
+def load_config(config_file: str = None) -> dict:
+    """Default settings overridden by a JSON config file"""
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if config_file is None:
+        return config
+
+    with open(config_file, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+
+    for key, value in overrides.items():
+        if key not in config:
+            raise ValueError(f"Unknown setting in {config_file}: {key}")
+        if isinstance(config[key], dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+
+class FundPipeline:
+    """Discovery, download, conversion, analysis and merge in one process
+
+    Each workbook is converted as soon as its download completes, and its table goes straight
+    to the calculator through a bounded queue instead of being read back from CSV. A weekly
+    refresh then takes about as long as its slowest stage instead of the sum of all stages.
+    Converted tables are still written to CSV (or the history store) for later runs.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.metrics = PipelineMetrics(
+            report_file=config["report_file"], profile=config["profile"], trace_memory=config["trace_memory"]
+        )
+        self.scraper = ASFIMScraper(
+            base_url=config["url"],
+            download_dir=config["download_dir"],
+            manifest_file=config["manifest_file"],
+            metrics=self.metrics,
+            **config["scraper"]
+        )
+        self.converter = ExcelToCSVConverter(
+            input_dir=config["download_dir"],
+            output_dir=config["csv_dir"],
+            history_dir=config["history_dir"],
+            manifest_file=config["manifest_file"],
+            metrics=self.metrics,
+            **config["converter"]
+        )
+        self.calculator = VolatilityCalculator(
+            csv_dir=config["csv_dir"],
+            output_file=config["output_file"],
+            history_dir=config["history_dir"],
+            frequency=config["frequency"],
+            metrics=self.metrics,
+            validator=PanelValidator(
+                quarantine_file=config["quarantine_file"], metrics=self.metrics, **config["validation"]
+            ) if config["validate"] else None,
+            identity=FundIdentityIndex(config["identity_file"]) if config["identity_file"] else None
+        )
+        self.exporter = FundSeriesExporter(
+            calculator=self.calculator,
+            output_dir=config["series_dir"],
+            volatility_file=config["output_file"],
+            manifest_file=config["manifest_file"],
+            metrics=self.metrics,
+            **config["series"]
+        ) if config["series_dir"] else None
+        self.database = FundDatabase(config["database_file"], metrics=self.metrics) if config["database_file"] else None
+        # One manifest for every stage, so entries recorded by one are not lost when another saves
+        self.converter.manifest = self.scraper.manifest
+        self.calculator.manifest = self.scraper.manifest
+        if self.exporter:
+            self.exporter.manifest = self.scraper.manifest
+        self.tables = {}  # Source name -> (date, prepared table) received by the calculator
+
+    async def download_and_convert(self, session, link: dict, download_slots: asyncio.Semaphore,
+                                   convert_slots: asyncio.Semaphore, executor, queue: asyncio.Queue):
+        """Download one workbook, convert it right away and hand its table to the calculator"""
+        async with download_slots:
+            downloaded = await self.scraper.download_file(session, link['url'], link['filename'])
+
+        xlsx_file = self.scraper.download_path(link['url'], link['filename'])
+        if not downloaded or xlsx_file.suffix.lower() != '.xlsx':
+            return
+
+        async with convert_slots:
+            converted, table = await self.converter.convert_file(xlsx_file, executor, columns=PANEL_COLUMNS)
+
+        if converted:
+            # Waits while the queue is full, so conversion never runs far ahead of the calculator
+            await queue.put((xlsx_file.name, table))
+
+    async def collect_tables(self, queue: asyncio.Queue):
+        """Receive converted tables until the producers are done (None)"""
+        while (item := await queue.get()) is not None:
+            table_name, table = item
+            if extract_frequency_from_filename(table_name) != self.calculator.frequency:
+                continue
+
+            date = extract_date_from_filename(table_name)
+            if date is None:
+                self.metrics.skip('no date in file name', stage='load')
+                continue
+
+            source = self.calculator.source_name(table_name)
+            if table is None:
+                # Already converted in an earlier run: read the existing output instead
+                table = await asyncio.to_thread(self.calculator.load_source, source)
+            else:
+                table = self.calculator.prepare_table(table, date)
+                self.metrics.count('rows', len(table), stage='load')
+            self.tables[source] = (date, table)
+
+    async def stream_tables(self, links: list[dict]):
+        """Download, convert and collect all tables with every stage running concurrently"""
+        queue = asyncio.Queue(maxsize=self.config["queue_size"])
+        download_slots = asyncio.Semaphore(self.scraper.max_concurrent_downloads)
+        convert_slots = asyncio.Semaphore(self.converter.max_in_flight)
+        executor = ProcessPoolExecutor(max_workers=self.converter.max_workers) if self.converter.use_processes else None
+
+        try:
+            async with self.scraper.create_client() as session, asyncio.TaskGroup() as tasks:
+                # One group: if the consumer fails, the producers blocked on the full queue are cancelled
+                tasks.create_task(self.collect_tables(queue))
+                producers = [
+                    tasks.create_task(self.download_and_convert(session, link, download_slots, convert_slots, executor, queue))
+                    for link in links
+                ]
+                await asyncio.gather(*producers)
+                await queue.put(None)
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def load_remaining_tables(self):
+        """Load sources from earlier runs that were not part of this run's downloads"""
+        for date, source in self.calculator.list_sources():
+            if source not in self.tables:
+                table = self.calculator.load_source(source)
+                if table is not None:
+                    self.tables[source] = (date, table)
+
+    async def run(self):
+        """Run the whole refresh and return the volatility results"""
+        logger.info("="*60)
+        logger.info("Starting Fund Pipeline")
+        logger.info("="*60)
+
+        with self.metrics.stage('discovery'):
+            links = await self.scraper.collect_links(self.config["headless"])
+            self.metrics.count('links', len(links))
+        logger.info(f"Collected {len(links)} download links")
+
+        try:
+            with self.metrics.stage('stream'):
+                await self.stream_tables(links)
+        finally:
+            if self.scraper.manifest:
+                self.scraper.manifest.save()
+
+        with self.metrics.stage('load'):
+            self.load_remaining_tables()
+            # Tables arrive in completion order, the panel needs them in date order
+            chunks = [table for _, table in sorted(self.tables.values(), key=lambda item: item[0])]
+            df = self.calculator.combine_panel(*self.calculator.panel_from_chunks(chunks))
+
+        if self.database:
+            # Raw VLs of the tables this run already holds in memory, the rest is read if missing
+            self.database.sync(self.calculator, tables={source: table for source, (_, table) in self.tables.items()})
+
+        if df.empty:
+            logger.error("No data to analyze")
+            return
+
+        df = self.calculator.screen_panel(df)
+        results = self.calculator.analyze_panel(df)
+
+        if results.empty:
+            return
+
+        if self.config["funds_json"]:
+            merge_volatility_into_funds(
+                funds_json_path=self.config["funds_json"],
+                volatility_csv_path=self.calculator.output_file,
+                metrics=self.metrics,
+                identity_file=self.config["identity_file"]
+            )
+
+        if self.exporter:
+            self.exporter.export(df)
+
+        self.calculator.display_summary(results)
+        self.metrics.log_summary()
+        self.metrics.save()
+
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh ASFIM fund data and volatility metrics in one run")
+    parser.add_argument("--config", help="JSON file overriding the default settings")
+    args = parser.parse_args()
+
+    pipeline = FundPipeline(load_config(args.config))
+    asyncio.run(pipeline.run())
+
+
+if __name__ == "__main__":
+    main()
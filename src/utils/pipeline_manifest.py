@@ -0,0 +1,68 @@
+import json
+import hashlib
+import logging
+from pathlib import Path
+
+from atomic_write import atomic_write
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class PipelineManifest:
+    """Records what each pipeline stage last processed so that unchanged inputs can be skipped
+
+    Entries are grouped by stage ('download', 'convert', 'compute') and keyed by source URL or
+    filename. File hashes are cached by (size, mtime) so unchanged files are not re-read.
+    """
+
+    def __init__(self, manifest_file: str = "pipeline_manifest.json"):
+        self.manifest_file = Path(manifest_file)
+        self.entries = {}
+        self.dirty = False
+
+        if self.manifest_file.exists():
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, stage: str, key: str) -> dict:
+        """Return the recorded entry for a stage input (None if never processed)"""
+        return self.entries.get(stage, {}).get(key)
+
+    def record(self, stage: str, key: str, **fields):
+        """Record (or replace) the entry for a stage input"""
+        self.entries.setdefault(stage, {})[key] = fields
+        self.dirty = True
+
+    def forget(self, stage: str, key: str):
+        """Drop the entry for a stage input so it is redone next time"""
+        if self.entries.get(stage, {}).pop(key, None) is not None:
+            self.dirty = True
+
+    def file_hash(self, path: Path) -> str:
+        """SHA-256 of a file, reusing the cached value while its size and mtime are unchanged"""
+        path = Path(path)
+        stat = path.stat()
+        key = str(path.resolve())
+
+        cached = self.get('files', key)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        sha256 = digest.hexdigest()
+        self.record('files', key, size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=sha256)
+        return sha256
+
+    def save(self):
+        """Write the manifest if anything changed"""
+        if not self.dirty:
+            return
+
+        with atomic_write(self.manifest_file) as f:
+            json.dump(self.entries, f, indent=2, ensure_ascii=False)
+        self.dirty = False
@@ -0,0 +1,168 @@
+import io
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from atomic_write import atomic_write
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Functions listed per profiled stage in the run report (by cumulative time)
+PROFILE_TOP_FUNCTIONS = 20
+
+
+class PipelineMetrics:
+    """Timing spans and counters of pipeline stages, written as a JSON run report
+
+    Stages ('discovery', 'download', 'conversion', 'load', 'validate', 'compute', 'merge',
+    'export') are opened with stage() and may nest. Counters (files, bytes, rows) and skip
+    reasons are attached to the innermost open stage, or to a named one when work of several
+    stages overlaps. Entering a stage again adds to its totals. Selected stages can be run
+    under cProfile or tracemalloc. The report merges into an existing file, so scripts run one after the
+    other fill in the same report.
+    """
+
+    def __init__(self, report_file: str = None, profile: list[str] = None, trace_memory: list[str] = None):
+        self.report_file = Path(report_file) if report_file else None
+        self.profile = set(profile or [])  # Stages run under cProfile (.prof file next to the report)
+        self.trace_memory = set(trace_memory or [])  # Stages whose peak Python allocations are traced
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.stages = {}
+        self.open_stages = []
+        self.lock = threading.Lock()
+
+    def entry(self, name: str) -> dict:
+        """Report entry of a stage, created on first use"""
+        return self.stages.setdefault(name, {
+            'parent': None, 'started': None, 'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+            'counters': {}, 'skipped': {}
+        })
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage (wall and CPU), profiling or tracing its memory when configured"""
+        entry = self.entry(name)
+        if entry['started'] is None:
+            entry['started'] = datetime.now().isoformat(timespec='seconds')
+            entry['parent'] = self.open_stages[-1] if self.open_stages else None
+        self.open_stages.append(name)
+
+        profiler = cProfile.Profile() if name in self.profile else None
+        traced = name in self.trace_memory
+        started_tracing = traced and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if traced:
+            # Keep the peak seen so far by enclosing traced stages before measuring this one
+            self.carry_peak()
+            tracemalloc.reset_peak()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            if profiler:
+                profiler.enable()
+            yield entry
+        finally:
+            if profiler:
+                profiler.disable()
+            entry['wall_s'] += time.perf_counter() - wall_start
+            entry['cpu_s'] += time.process_time() - cpu_start
+            entry['calls'] += 1
+            self.open_stages.pop()
+
+            if traced:
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                entry['peak_traced_mb'] = max(entry.get('peak_traced_mb', 0.0), entry.pop('_peak_mb', 0.0), peak_mb)
+                self.carry_peak(entry['peak_traced_mb'])
+                if started_tracing:
+                    tracemalloc.stop()
+            if profiler:
+                entry['profile'] = self.save_profile(name, profiler)
+
+    def carry_peak(self, peak_mb: float = None):
+        """Fold a traced peak into the enclosing traced stages (their peak covers nested stages)"""
+        if peak_mb is None:
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        for name in self.open_stages:
+            if name in self.trace_memory:
+                entry = self.stages[name]
+                entry['_peak_mb'] = max(entry.get('_peak_mb', 0.0), peak_mb)
+
+    def save_profile(self, name: str, profiler: cProfile.Profile) -> dict:
+        """Write a stage's cProfile stats next to the report and summarize its hottest functions"""
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        profile = {'top': []}
+
+        if self.report_file:
+            profile_file = self.report_file.with_name(f"{self.report_file.stem}.{name}.prof")
+            stats.dump_stats(profile_file)
+            profile['file'] = profile_file.name
+
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        for (filename, line, function), (_, calls, total, cumulative, _) in rows[:PROFILE_TOP_FUNCTIONS]:
+            profile['top'].append({
+                'function': f"{Path(filename).name}:{line}({function})",
+                'calls': calls,
+                'total_s': round(total, 6),
+                'cumulative_s': round(cumulative, 6)
+            })
+        return profile
+
+    def current(self, stage: str = None) -> dict:
+        """Entry of a named stage, or of the innermost open stage ('run' outside any stage)"""
+        return self.entry(stage or (self.open_stages[-1] if self.open_stages else 'run'))
+
+    def count(self, counter: str, value: int = 1, stage: str = None):
+        """Add to a counter (files, bytes, rows...) of a stage"""
+        with self.lock:
+            counters = self.current(stage)['counters']
+            counters[counter] = counters.get(counter, 0) + int(value)
+
+    def skip(self, reason: str, value: int = 1, stage: str = None):
+        """Count items (files, funds) left out by a stage, by reason"""
+        with self.lock:
+            skipped = self.current(stage)['skipped']
+            skipped[reason] = skipped.get(reason, 0) + int(value)
+
+    def report(self) -> dict:
+        """Run report with rounded timings"""
+        stages = {}
+        for name, entry in self.stages.items():
+            entry = {key: value for key, value in entry.items() if not key.startswith('_')}
+            for key in ('wall_s', 'cpu_s', 'peak_traced_mb'):
+                if key in entry:
+                    entry[key] = round(entry[key], 4)
+            stages[name] = entry
+        return {'run_started': self.started, 'stages': stages}
+
+    def log_summary(self):
+        """Log the time and counters of every stage"""
+        for name, entry in self.report()['stages'].items():
+            counters = ', '.join(f"{key}={value}" for key, value in {**entry['counters'], **entry['skipped']}.items())
+            # Stages that only collect counters (their work overlaps inside another stage) have no timing
+            timing = f"{entry['wall_s']:.2f}s wall, {entry['cpu_s']:.2f}s CPU" if entry['calls'] else "overlapped"
+            logger.info(f"⏱ {name}: {timing}" + (f" ({counters})" if counters else ""))
+
+    def save(self):
+        """Merge this run's stages into the report file (stages of other scripts are kept)"""
+        if self.report_file is None:
+            return
+
+        report = self.report()
+        if self.report_file.exists():
+            with open(self.report_file, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+            report['stages'] = {**previous.get('stages', {}), **report['stages']}
+        report['updated'] = datetime.now().isoformat(timespec='seconds')
+
+        with atomic_write(self.report_file) as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
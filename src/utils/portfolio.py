@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+
+from atomic_write import atomic_write
+from compute_funds_stats import NOMINAL_PERIODS_PER_YEAR, VolatilityCalculator, periods_per_year
+from fund_covariance import FundCovariance, FundCovarianceCalculator
+from fund_identity import FundIdentityIndex
+from lazy_import import lazy_import
+from validate_panel import PanelValidator
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def project_to_simplex(weights: np.ndarray) -> np.ndarray:
+    """Euclidean projection of each row onto {w >= 0, sum(w) = 1} (long-only, fully invested)"""
+    ordered = -np.sort(-weights, axis=1)
+    cumulative = np.cumsum(ordered, axis=1) - 1
+    ranks = np.arange(1, weights.shape[1] + 1)
+    support = (ordered - cumulative / ranks > 0).sum(axis=1)
+    theta = cumulative[np.arange(len(weights)), support - 1] / support
+    return np.maximum(weights - theta[:, None], 0)
+
+
+class PortfolioAnalyzer:
+    """Batched what-if evaluation of fund portfolios over the VL history and covariance matrix"""
+
+    def __init__(
+        self,
+        calculator: VolatilityCalculator = None,
+        covariance_file: str = "fund_covariance.npz",
+        risk_free_rate: float = 0.0,
+        batch_size: int = 1000
+    ):
+        self.calculator = calculator or VolatilityCalculator(validator=PanelValidator())
+        self.covariance_file = Path(covariance_file)
+        self.risk_free_rate = risk_free_rate  # Annual rate used for the Sharpe ratio
+        self.batch_size = batch_size  # Portfolios evaluated per matrix product (bounds memory)
+        self.isin = None
+        self.returns = None
+        self.expected_returns = None
+        self.covariance = None
+
+    def load(self):
+        """Load the VL panel and covariance matrix once, aligned on the same ISIN index
+
+        The saved matrix is reused only when it was estimated on the panel's current returns (same
+        last date and funds), otherwise it is recomputed from them. Volatilities and expected
+        returns therefore always come from the same return matrix.
+        """
+        df = self.calculator.load_screened_panel()
+        estimator = FundCovarianceCalculator(self.calculator, output_file=self.covariance_file)
+        returns = estimator.return_matrix(df)
+        end_date = str(returns.index.max().date()) if len(returns) else None
+
+        # covariance_from_returns keeps the funds whose returns vary
+        funds = set(returns.columns[returns.std() > 0])
+        matrix = FundCovariance(self.covariance_file) if self.covariance_file.exists() else None
+        if matrix is None or matrix.end_date != end_date or set(matrix.isin) != funds:
+            logger.info(f"{self.covariance_file} missing or not estimated on the current panel, computing it")
+            computed = estimator.covariance_from_returns(returns)
+            if not computed:
+                raise ValueError(f"No fund has at least {estimator.min_observations} returns")
+            estimator.save(computed)
+            matrix = FundCovariance(self.covariance_file)
+
+        self.isin = matrix.isin
+        self.covariance = matrix.covariance.astype(np.float64)
+
+        # Same date x ISIN return matrix the covariance was estimated on
+        self.returns = returns.reindex(columns=self.isin)
+        periods = periods_per_year(returns.index, default=NOMINAL_PERIODS_PER_YEAR[self.calculator.frequency])
+        self.expected_returns = self.returns.mean().to_numpy() * periods
+
+        logger.info(f"✓ Loaded {len(self.isin)} funds over {len(returns)} dates")
+
+    def weights_matrix(self, portfolios: list[dict]) -> np.ndarray:
+        """Stack portfolios given as {ISIN: weight} into a (portfolios x funds) weights array"""
+        index = {isin: i for i, isin in enumerate(self.isin)}
+        weights = np.zeros((len(portfolios), len(self.isin)))
+        for row, portfolio in enumerate(portfolios):
+            for isin, weight in portfolio.items():
+                weights[row, index[isin]] = weight
+        return weights
+
+    def max_drawdowns(self, weights: np.ndarray) -> np.ndarray:
+        """Historical max drawdown of each portfolio rebalanced every period
+
+        A fund without a return for a week is left out of that week and the remaining weights
+        are scaled back to 100%.
+        """
+        values = self.returns.to_numpy(dtype=np.float64)
+        observed = ~np.isnan(values)
+        filled = np.where(observed, values, 0.0)
+
+        weighted = filled @ weights.T
+        invested = observed.astype(np.float64) @ np.abs(weights.T)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            period_returns = np.where(invested > 0, weighted / invested, 0.0)
+
+        wealth = np.cumprod(1 + period_returns, axis=0)
+        running_max = np.maximum.accumulate(wealth, axis=0)
+        return (wealth / running_max - 1).min(axis=0)
+
+    def evaluate(self, weights: np.ndarray) -> pd.DataFrame:
+        """Expected return, volatility, max drawdown and Sharpe ratio of every weights row"""
+        if self.covariance is None:
+            self.load()
+
+        weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+        expected_returns = np.nan_to_num(self.expected_returns)
+
+        results = []
+        for start in range(0, len(weights), self.batch_size):
+            batch = weights[start:start + self.batch_size]
+
+            # w^T Σ w for the whole batch at once
+            variance = ((batch @ self.covariance) * batch).sum(axis=1)
+            volatility = np.sqrt(np.maximum(variance, 0))
+            expected = batch @ expected_returns
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sharpe = np.where(volatility > 0, (expected - self.risk_free_rate) / volatility, np.nan)
+
+            results.append(pd.DataFrame({
+                'Expected Return (%)': expected * 100,
+                'Volatility (%)': volatility * 100,
+                'Max Drawdown (%)': self.max_drawdowns(batch) * 100,
+                'Sharpe Ratio': sharpe
+            }))
+
+        return pd.concat(results, ignore_index=True)
+
+    def efficient_frontier(self, n_points: int = 25, isins: list = None,
+                           iterations: int = 500) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Long-only mean-variance frontier, one portfolio per risk aversion level
+
+        Maximizes w·mu - λ/2 w^T Σ w on the simplex for a sweep of λ values at once,
+        with accelerated projected gradient steps over the (λ x funds) weights array.
+        """
+        if self.covariance is None:
+            self.load()
+
+        universe = np.arange(len(self.isin))
+        if isins is not None:
+            universe = np.flatnonzero(np.isin(self.isin, isins))
+        covariance = self.covariance[np.ix_(universe, universe)]
+        expected_returns = np.nan_to_num(self.expected_returns[universe])
+
+        risk_aversion = np.logspace(-1, 4, n_points)[:, None]
+        step = 1 / (risk_aversion * np.linalg.eigvalsh(covariance)[-1])
+
+        weights = np.full((n_points, len(universe)), 1 / len(universe))
+        momentum = weights
+        for i in range(iterations):
+            gradient = expected_returns - risk_aversion * (momentum @ covariance)
+            updated = project_to_simplex(momentum + step * gradient)
+            momentum = updated + (i / (i + 3)) * (updated - weights)
+            weights = updated
+
+        weights[weights < 1e-6] = 0
+        weights /= weights.sum(axis=1, keepdims=True)
+
+        frontier = self.evaluate(self.embed(weights, universe))
+        frontier.insert(0, 'Risk Aversion', risk_aversion.ravel())
+        frontier_weights = pd.DataFrame(weights, columns=self.isin[universe])
+
+        return frontier, frontier_weights
+
+    def embed(self, weights: np.ndarray, universe: np.ndarray) -> np.ndarray:
+        """Expand weights over a subset of funds to the full ISIN index"""
+        full = np.zeros((len(weights), len(self.isin)))
+        full[:, universe] = weights
+        return full
+
+    def save_frontier(self, frontier: pd.DataFrame, frontier_weights: pd.DataFrame, output_file: str):
+        """Write the frontier with each portfolio's non-zero weights as JSON for the site"""
+        points = []
+        for metrics, (_, weights) in zip(frontier.to_dict('records'), frontier_weights.iterrows()):
+            held = weights[weights > 0].sort_values(ascending=False)
+            metrics = {key: (None if pd.isna(value) else float(value)) for key, value in metrics.items()}
+            metrics['weights'] = {isin: round(float(weight), 6) for isin, weight in held.items()}
+            points.append(metrics)
+
+        with atomic_write(output_file) as f:
+            json.dump(points, f, indent=2, ensure_ascii=False)
+
+
+def main():
+    # Configuration
+    CSV_DIR = "csv_output"  # Directory containing CSV files
+    HISTORY_DIR = None  # Set to "fund_history" to read the Parquet history store instead of CSV_DIR
+    COVARIANCE_FILE = "fund_covariance.npz"  # Computed first if missing
+    OUTPUT_FILE = "portfolio_frontier.json"
+    N_POINTS = 25  # Portfolios along the efficient frontier
+    RISK_FREE_RATE = 0.0  # Annual, for the Sharpe ratio
+    VALIDATE = True  # Screen the panel for broken series before estimating the frontier
+    IDENTITY_FILE = "fund_identity.json"  # Stable fund ids across code changes and renames (None to group by codes only)
+
+    analyzer = PortfolioAnalyzer(
+        calculator=VolatilityCalculator(
+            csv_dir=CSV_DIR,
+            history_dir=HISTORY_DIR,
+            validator=PanelValidator() if VALIDATE else None,
+            identity=FundIdentityIndex(IDENTITY_FILE) if IDENTITY_FILE else None
+        ),
+        covariance_file=COVARIANCE_FILE,
+        risk_free_rate=RISK_FREE_RATE
+    )
+
+    frontier, frontier_weights = analyzer.efficient_frontier(N_POINTS)
+    analyzer.save_frontier(frontier, frontier_weights, OUTPUT_FILE)
+
+    print("\nEfficient Frontier:")
+    print(frontier.to_string(index=False))
+    logger.info(f"\n✓ Results saved to: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import logging
+
+from compute_funds_stats import FUND_KEYS, NOMINAL_PERIODS_PER_YEAR, RESAMPLE_PERIODS, VolatilityCalculator, periods_per_year
+from fund_identity import FundIdentityIndex
+from lazy_import import lazy_import
+from validate_panel import PanelValidator
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class RiskMetricsCalculator:
+    """Rolling volatility, drawdown, downside risk and calendar-year returns for every fund at once"""
+
+    def __init__(
+        self,
+        calculator: VolatilityCalculator = None,
+        output_file: str = "fund_risk_metrics.csv",
+        rolling_windows: tuple = (52, 156),
+        minimum_acceptable_return: float = 0.0
+    ):
+        self.calculator = calculator or VolatilityCalculator(validator=PanelValidator())
+        self.output_file = output_file
+        self.rolling_windows = rolling_windows  # In observations of the calculator's frequency (weeks for weekly tables)
+        self.minimum_acceptable_return = minimum_acceptable_return  # Per-period threshold for downside risk
+
+    def periods_per_year(self, returns: pd.DataFrame) -> float:
+        """Observations per year of the panel, from the spacing of its dates"""
+        return periods_per_year(returns['date'], default=NOMINAL_PERIODS_PER_YEAR[self.calculator.frequency])
+
+    def rolling_volatility(self, returns: pd.DataFrame, window: int) -> pd.Series:
+        """Annualized rolling volatility of each fund's returns over a window of observations"""
+        rolling = (
+            returns.groupby(FUND_KEYS, sort=False, observed=True)['return']
+            .rolling(window, min_periods=window)
+            .std()
+        )
+        # groupby().rolling() prepends the group keys to the index, drop them to align with the panel
+        return rolling.droplevel(list(range(len(FUND_KEYS)))).reindex(returns.index) * np.sqrt(self.periods_per_year(returns))
+
+    def drawdowns(self, returns: pd.DataFrame) -> pd.DataFrame:
+        """Running drawdown of every fund from its cumulative VL high, with the date of that high"""
+        grouped = returns.groupby(FUND_KEYS, sort=False, observed=True)
+        running_max = grouped['VL'].cummax()
+
+        # Date of the latest high, carried forward to every later observation
+        high_date = returns['date'].where(returns['VL'] >= running_max)
+        peak_date = high_date.groupby([returns[k] for k in FUND_KEYS], sort=False, observed=True).ffill()
+
+        return pd.DataFrame({
+            'drawdown': returns['VL'] / running_max - 1,
+            'peak_date': peak_date
+        }, index=returns.index)
+
+    def max_drawdowns(self, returns: pd.DataFrame) -> pd.DataFrame:
+        """Deepest drawdown of each fund with its peak and trough dates"""
+        panel = pd.concat([returns[FUND_KEYS + ['date']], self.drawdowns(returns)], axis=1)
+
+        # Row of the deepest drawdown per fund (first one on ties)
+        trough_rows = panel.groupby(FUND_KEYS, observed=True)['drawdown'].idxmin()
+        troughs = panel.loc[trough_rows.to_numpy()].set_index(FUND_KEYS)
+
+        return pd.DataFrame({
+            'Max Drawdown (%)': troughs['drawdown'] * 100,
+            'Drawdown Peak Date': troughs['peak_date'],
+            'Drawdown Trough Date': troughs['date']
+        })
+
+    def downside_risk(self, returns: pd.DataFrame) -> pd.DataFrame:
+        """Annualized downside deviation and Sortino ratio of each fund"""
+        shortfall = np.minimum(returns['return'] - self.minimum_acceptable_return, 0)
+        frame = returns[FUND_KEYS].assign(
+            shortfall_sq=shortfall.where(returns['return'].notna()) ** 2,
+            ret=returns['return']
+        )
+        grouped = frame.groupby(FUND_KEYS, observed=True)
+        periods = self.periods_per_year(returns)
+
+        downside_dev = np.sqrt(grouped['shortfall_sq'].mean()) * np.sqrt(periods)
+        annual_return = grouped['ret'].mean() * periods
+        sortino = (annual_return / downside_dev).where(downside_dev > 0)
+
+        return pd.DataFrame({
+            'Downside Deviation (%)': downside_dev * 100,
+            'Sortino Ratio': sortino
+        })
+
+    def calendar_year_returns(self, returns: pd.DataFrame) -> pd.DataFrame:
+        """Return of each fund per calendar year (year-end VL over previous year-end VL)"""
+        year = returns['date'].dt.year.rename('year')
+        grouped = returns.groupby([returns[k] for k in FUND_KEYS] + [year], observed=True)['VL']
+        yearly = pd.DataFrame({'first_vl': grouped.first(), 'last_vl': grouped.last()})
+
+        # The first year of each fund starts from its first VL instead of a previous year-end
+        previous_close = yearly.groupby(level=FUND_KEYS, observed=True)['last_vl'].shift(1)
+        base = previous_close.fillna(yearly['first_vl'])
+        yearly_returns = ((yearly['last_vl'] / base - 1) * 100).unstack('year')
+        yearly_returns.columns = [f"Return {y} (%)" for y in yearly_returns.columns]
+
+        return yearly_returns
+
+    def calculate_metrics(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Compute all risk metrics for every fund of a loaded VL panel"""
+        returns = self.calculator.compute_returns(df)
+        grouped = returns.groupby(FUND_KEYS, observed=True)
+
+        # Fund info comes from each fund's earliest row
+        first_rows = df.groupby(FUND_KEYS, observed=True)['date'].idxmin()
+        info = df.loc[first_rows.to_numpy()].set_index(FUND_KEYS)
+        metrics = pd.DataFrame({
+            'Fund Name': info['Dénomination OPCVM'],
+            'Classification': info['Classification'],
+        }).loc[grouped.size().index]
+        metrics['Data Points'] = grouped.size()
+
+        # Latest value of each rolling volatility, i.e. the volatility of the last full window
+        last_rows = returns.groupby(FUND_KEYS, sort=False, observed=True).tail(1).index
+        fund_index = pd.MultiIndex.from_frame(returns.loc[last_rows, FUND_KEYS])
+        unit = RESAMPLE_PERIODS[self.calculator.frequency]  # Windows count observations: '52W' for weekly tables
+        for window in self.rolling_windows:
+            latest_vol = pd.Series(self.rolling_volatility(returns, window)[last_rows].to_numpy(), index=fund_index)
+            metrics[f"Rolling {window}{unit} Volatility (%)"] = latest_vol * 100
+
+        metrics = metrics.join(self.max_drawdowns(returns))
+        metrics = metrics.join(self.downside_risk(returns))
+        metrics = metrics.join(self.calendar_year_returns(returns))
+
+        # Single-observation funds have no return to measure risk on
+        metrics = metrics[metrics['Data Points'] >= 2]
+
+        return metrics.reset_index().sort_values('Max Drawdown (%)')
+
+    def run_analysis(self):
+        """Load the VL panel, compute risk metrics and save them"""
+        logger.info("="*60)
+        logger.info("Starting Fund Risk Metrics Analysis")
+        logger.info("="*60)
+
+        df = self.calculator.load_screened_panel()
+
+        if df.empty:
+            logger.error("No data to analyze")
+            return
+
+        results = self.calculate_metrics(df)
+
+        if results.empty:
+            logger.error("No risk metrics calculated")
+            return
+
+        results.to_csv(self.output_file, index=False)
+        logger.info(f"\n✓ Results saved to: {self.output_file}")
+
+        print("\nDeepest Drawdowns:")
+        print(results[['CODE ISIN', 'Fund Name', 'Max Drawdown (%)', 'Drawdown Peak Date',
+                       'Drawdown Trough Date']].head(10).to_string(index=False))
+
+        print("\n\nBest Sortino Ratios:")
+        print(results.nlargest(10, 'Sortino Ratio')[['CODE ISIN', 'Fund Name', 'Downside Deviation (%)',
+                                                     'Sortino Ratio']].to_string(index=False))
+
+        return results
+
+
+def main():
+    # Configuration
+    CSV_DIR = "csv_output"  # Directory containing CSV files
+    HISTORY_DIR = None  # Set to "fund_history" to read the Parquet history store instead of CSV_DIR
+    OUTPUT_FILE = "fund_risk_metrics.csv"
+    VALIDATE = True  # Screen the panel for broken series before computing the risk metrics
+    IDENTITY_FILE = "fund_identity.json"  # Stable fund ids across code changes and renames (None to group by codes only)
+
+    risk = RiskMetricsCalculator(
+        calculator=VolatilityCalculator(
+            csv_dir=CSV_DIR,
+            history_dir=HISTORY_DIR,
+            validator=PanelValidator() if VALIDATE else None,
+            identity=FundIdentityIndex(IDENTITY_FILE) if IDENTITY_FILE else None
+        ),
+        output_file=OUTPUT_FILE
+    )
+
+    risk.run_analysis()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,60 @@
+from __future__ import annotations
+
 import asyncio
-import httpx
-import aiofiles
-from playwright.async_api import async_playwright
 from pathlib import Path
-from urllib.parse import unquote
+from urllib.parse import unquote, urljoin
+import hashlib
+import importlib.util
 import logging
+import os
+import random
+import zipfile
+
+from lazy_import import lazy_import
+from pipeline_manifest import PipelineManifest
+from pipeline_metrics import PipelineMetrics
+
+# Loaded on first use; Playwright and selectolax are imported only by the discovery mode that needs them
+httpx = lazy_import('httpx')
+aiofiles = lazy_import('aiofiles')
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Downloads are requested unencoded so a .part file's size is a valid byte offset to resume from
+DOWNLOAD_HEADERS = {'Accept-Encoding': 'identity'}
+
+# Path drawn by the right chevron of the listing's next page button (disabled on the last page)
+NEXT_PAGE_ICON = 'm8.25 4.5 7.5 7.5'
+NEXT_PAGE_SELECTOR = f'button:has(svg path[d*="{NEXT_PAGE_ICON}"]):not([disabled])'
+
+# Read every table row in a single round-trip to the page
+EXTRACT_ROWS_JS = """
+rows => rows.map(row => {
+    const cells = row.querySelectorAll('td');
+    const link = row.querySelector('a[download]');
+    return {
+        href: link ? link.getAttribute('href') : null,
+        filename: cells.length > 0 ? cells[0].innerText : null,
+        category: cells.length > 1 ? cells[1].innerText : null
+    };
+})
+"""
+
+# Identify the rows currently displayed, to detect when the table has been re-rendered
+TABLE_SIGNATURE_JS = """
+() => {
+    const rows = document.querySelectorAll('table tbody tr');
+    return rows.length + '|' + (rows.length ? rows[0].innerText + '|' + rows[rows.length - 1].innerText : '');
+}
+"""
+
 
 class ASFIMScraper:
     def __init__(
@@ -17,13 +63,28 @@ class ASFIMScraper:
         download_dir: str = "downloads", 
         max_files: int = 50,
         category_filter: str = None,
-        show_100_per_page: bool = True
+        show_100_per_page: bool = True,
+        manifest_file: str = None,
+        max_concurrent_downloads: int = 8,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        discovery_mode: str = "auto",
+        metrics: PipelineMetrics = None
     ):
         self.base_url = base_url
         self.download_dir = Path(download_dir)
         self.max_files = max_files
         self.category_filter = category_filter  # e.g., "Quotidien", "Hebdomadaire"
         self.show_100_per_page = show_100_per_page
+        # Track size, ETag/Last-Modified and content hash of downloads when set
+        self.manifest = PipelineManifest(manifest_file) if manifest_file else None
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base  # Seconds before the first retry, doubled on each attempt
+        # "http" parses the listing HTML, "browser" drives Playwright, "auto" tries http first
+        self.discovery_mode = discovery_mode
+        # Stage timings and counters (written as a run report when it has a report file)
+        self.metrics = metrics or PipelineMetrics()
         self.download_dir.mkdir(exist_ok=True)
         
     async def set_items_per_page(self, page, items: int = 100):
@@ -34,10 +95,10 @@ class ASFIMScraper:
             # Find and click the select dropdown
             select = await page.query_selector('select')
             if select:
+                previous = await page.evaluate(TABLE_SIGNATURE_JS)
                 await select.select_option(str(items))
                 # Wait for the table to reload
-                await asyncio.sleep(1.5)
-                await page.wait_for_selector('table tbody tr', timeout=10000)
+                await self.wait_for_table_change(page, previous)
                 logger.info(f"✓ Now showing {items} items per page")
                 return True
             else:
@@ -47,6 +108,19 @@ class ASFIMScraper:
             logger.error(f"Failed to set items per page: {e}")
             return False
         
+    async def wait_for_table_change(self, page, previous: str, timeout: int = 10000):
+        """Wait until the table rows differ from a previous TABLE_SIGNATURE_JS snapshot"""
+        try:
+            await page.wait_for_function(
+                f"previous => ({TABLE_SIGNATURE_JS})() !== previous && "
+                "document.querySelectorAll('table tbody tr').length > 0",
+                arg=previous,
+                timeout=timeout
+            )
+        except Exception:
+            # Same rows after the timeout (e.g. page size already applied): carry on with what is shown
+            logger.warning("Table content did not change")
+        
     async def extract_download_links(self, page):
         """Extract all download links from the current page"""
         links = []
@@ -54,87 +128,96 @@ class ASFIMScraper:
         # Wait for table to be visible
         await page.wait_for_selector('table tbody tr', timeout=10000)
         
-        # Extract all download links
-        rows = await page.query_selector_all('table tbody tr')
+        # Extract all rows at once and filter them here
+        rows = await page.eval_on_selector_all('table tbody tr', EXTRACT_ROWS_JS)
         
         for row in rows:
-            # Get category if filtering is enabled
-            if self.category_filter:
-                category_element = await row.query_selector('td:nth-child(2)')
-                category = await category_element.inner_text() if category_element else None
-                
-                # Skip if category doesn't match filter
-                if category and category.strip() != self.category_filter:
-                    continue
-            
-            link_element = await row.query_selector('a[download]')
-            if link_element:
-                href = await link_element.get_attribute('href')
-                filename_element = await row.query_selector('td:first-child')
-                filename = await filename_element.inner_text() if filename_element else None
-                
-                # Get category for logging
-                category_element = await row.query_selector('td:nth-child(2)')
-                category = await category_element.inner_text() if category_element else "Unknown"
-                
-                if href:
-                    links.append({
-                        'url': href,
-                        'filename': filename.strip() if filename else None,
-                        'category': category.strip() if category else "Unknown"
-                    })
+            category = row['category'].strip() if row['category'] else None
+            
+            # Skip if category doesn't match filter
+            if self.category_filter and category and category != self.category_filter:
+                continue
+            
+            if row['href']:
+                links.append({
+                    'url': row['href'],
+                    'filename': row['filename'].strip() if row['filename'] else None,
+                    'category': category or "Unknown"
+                })
         
         return links
     
-    async def has_next_page(self, page):
-        """Check if there's a next page button available"""
-        # Find the next button (the right chevron that's not disabled)
-        next_button = await page.query_selector('button:has(svg path[d*="m8.25 4.5 7.5 7.5"]):not([disabled])')
-        return next_button is not None
-    
-    async def go_to_next_page(self, page):
-        """Click the next page button"""
-        next_button = await page.query_selector('button:has(svg path[d*="m8.25 4.5 7.5 7.5"]):not([disabled])')
-        if next_button:
-            await next_button.click()
-            # Wait for the table to update
-            await asyncio.sleep(1.5)  # Give time for the page to load
-            await page.wait_for_selector('table tbody tr', timeout=10000)
-            return True
-        return False
-    
-    async def download_file(self, session: httpx.AsyncClient, url: str, filename: str):
-        """Download a single file"""
-        try:
-            # Extract filename from URL if not provided
-            if not filename:
-                filename = unquote(url.split('/')[-1])
-            
-            filepath = self.download_dir / filename
-            
-            # Skip if file already exists
-            if filepath.exists():
-                logger.info(f"Skipping {filename} - already exists")
-                return True
+    def parse_listing_html(self, html: str, page_url: str = None) -> list[dict]:
+        """Extract download links from listing HTML in one pass (same rows as extract_download_links)"""
+        from selectolax.lexbor import LexborHTMLParser
+        
+        links = []
+        
+        for row in LexborHTMLParser(html).css('table tbody tr'):
+            cells = row.css('td')
+            category = cells[1].text(deep=True).strip() if len(cells) > 1 else None
             
-            logger.info(f"Downloading: {filename}")
+            # Skip if category doesn't match filter
+            if self.category_filter and category and category != self.category_filter:
+                continue
             
-            async with session.stream('GET', url) as response:
+            link_element = row.css_first('a[download]')
+            href = link_element.attributes.get('href') if link_element else None
+            if href:
+                filename = cells[0].text(deep=True).strip() if cells else None
+                links.append({
+                    'url': urljoin(page_url or self.base_url, href),
+                    'filename': filename or None,
+                    'category': category or "Unknown"
+                })
+        
+        return links
+    
+    def parse_listing_pagination(self, html: str, page_url: str = None) -> tuple[str, bool]:
+        """URL of the next listing page when the HTML links to one, and whether an enabled next page button is shown"""
+        from selectolax.lexbor import LexborHTMLParser
+        
+        tree = LexborHTMLParser(html)
+        next_link = tree.css_first('a[rel~="next"][href], link[rel~="next"][href]')
+        next_url = urljoin(page_url or self.base_url, next_link.attributes['href']) if next_link else None
+        
+        # Buttons page the table client-side: only the browser can follow them
+        has_next_button = any(
+            NEXT_PAGE_ICON in (path.attributes.get('d') or '')
+            for button in tree.css('button:not([disabled])')
+            for path in button.css('svg path')
+        )
+        return next_url, has_next_button
+    
+    async def discover_links_http(self) -> tuple[list[dict], bool]:
+        """Collect download links by fetching listing pages without a browser, following next page links
+        
+        Also tells whether links are missing because the listing has more pages that are only
+        reachable through its client-side next button.
+        """
+        links = []
+        page_url, seen = self.base_url, set()
+        has_next_button = False
+        
+        async with self.create_client() as session:
+            while page_url and page_url not in seen and len(links) < self.max_files:
+                seen.add(page_url)
+                logger.info(f"Fetching {page_url}")
+                response = await session.get(page_url)
                 response.raise_for_status()
                 
-                async with aiofiles.open(filepath, 'wb') as f:
-                    async for chunk in response.aiter_bytes(chunk_size=8192):
-                        await f.write(chunk)
-            
-            logger.info(f"✓ Downloaded: {filename}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"✗ Failed to download {filename}: {e}")
-            return False
+                page_links = self.parse_listing_html(response.text, str(response.url))
+                links.extend(page_links)
+                logger.info(f"Found {len(page_links)} files in the listing HTML (total: {len(links)})")
+                page_url, has_next_button = self.parse_listing_pagination(response.text, str(response.url))
+        
+        return links[:self.max_files], len(links) < self.max_files and has_next_button
     
-    async def scrape_and_download(self, headless:bool=False):
-        """Main method to scrape links and download files"""
+    async def discover_links_browser(self, headless: bool = False) -> list[dict]:
+        """Collect download links by paging through the table in Chromium"""
+        # Imported here so runs that never open a browser do not pay for Playwright
+        from playwright.async_api import async_playwright
+        
         all_links = []
         
         async with async_playwright() as p:
@@ -176,22 +259,267 @@ class ASFIMScraper:
             
             await browser.close()
         
+        return all_links
+    
+    async def collect_links(self, headless: bool = False) -> list[dict]:
+        """Collect download links, using Playwright only when the listing HTML lacks some"""
+        if self.discovery_mode in ("http", "auto"):
+            try:
+                links, paged_client_side = await self.discover_links_http()
+                if paged_client_side:
+                    shortfall = f"Listing HTML has {len(links)}/{self.max_files} files, more pages are paged client-side"
+                    if self.discovery_mode == "http":
+                        logger.warning(f"{shortfall} - keeping the links found")
+                        return links
+                    logger.info(f"{shortfall} - falling back to the browser")
+                elif links or self.discovery_mode == "http":
+                    return links
+                else:
+                    logger.info("No links in the listing HTML (rendered client-side?) - falling back to the browser")
+            except Exception as e:
+                if self.discovery_mode == "http":
+                    raise
+                logger.warning(f"HTTP discovery failed ({e}) - falling back to the browser")
+        
+        return await self.discover_links_browser(headless)
+    
+    async def has_next_page(self, page):
+        """Check if there's a next page button available"""
+        # Find the next button (the right chevron that's not disabled)
+        next_button = await page.query_selector(NEXT_PAGE_SELECTOR)
+        return next_button is not None
+    
+    async def go_to_next_page(self, page):
+        """Click the next page button"""
+        next_button = await page.query_selector(NEXT_PAGE_SELECTOR)
+        if next_button:
+            previous = await page.evaluate(TABLE_SIGNATURE_JS)
+            await next_button.click()
+            # Wait for the table to update
+            await self.wait_for_table_change(page, previous)
+            return True
+        return False
+    
+    def create_client(self) -> httpx.AsyncClient:
+        """HTTP client with a connection pool sized for the download workers"""
+        limits = httpx.Limits(
+            max_connections=self.max_concurrent_downloads,
+            max_keepalive_connections=self.max_concurrent_downloads
+        )
+        return httpx.AsyncClient(timeout=60.0, follow_redirects=True, limits=limits, http2=HTTP2_AVAILABLE)
+    
+    def validator_file(self, part_path: Path) -> Path:
+        """Sidecar of a partial download holding the ETag/Last-Modified of the copy it was started from"""
+        return part_path.with_name(part_path.name + '.validator')
+    
+    def discard_part(self, part_path: Path, validator_path: Path):
+        """Delete a partial download and its validator"""
+        part_path.unlink(missing_ok=True)
+        validator_path.unlink(missing_ok=True)
+    
+    async def stream_to_part(self, session: httpx.AsyncClient, url: str, part_path: Path, headers: dict) -> dict:
+        """Stream a URL into a .part file, resuming from its current size with a Range request"""
+        validator_path = self.validator_file(part_path)
+        headers = {**DOWNLOAD_HEADERS, **headers}
+        
+        resume_from = part_path.stat().st_size if part_path.exists() else 0
+        if resume_from and not validator_path.exists():
+            # No way to tell whether the server copy changed since this partial file was started
+            logger.warning(f"Discarding {part_path.name} - no validator to resume it safely")
+            self.discard_part(part_path, validator_path)
+            resume_from = 0
+        if resume_from:
+            headers['Range'] = f"bytes={resume_from}-"
+            # Only resume if the server copy is still the one the partial file came from
+            headers['If-Range'] = validator_path.read_text(encoding='utf-8')
+        
+        async with session.stream('GET', url, headers=headers) as response:
+            if response.status_code == 304:
+                return None
+            
+            if response.status_code == 416:
+                # The partial file does not match the server copy anymore: start over
+                self.discard_part(part_path, validator_path)
+                raise IOError("stale partial download")
+            
+            response.raise_for_status()
+            
+            # The server may ignore the Range header (or If-Range failed) and send the whole file
+            if response.status_code != 206:
+                resume_from = 0
+            
+            # A weak ETag cannot be used in If-Range, Last-Modified can
+            etag = response.headers.get('ETag')
+            validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+            # Decoded bytes of an encoded response are no valid offsets into the server copy
+            resumable = validator and response.headers.get('Content-Encoding', 'identity') == 'identity'
+            if resumable and not resume_from:
+                validator_path.write_text(validator, encoding='utf-8')
+            elif not resumable:
+                validator_path.unlink(missing_ok=True)
+            
+            digest = hashlib.sha256()
+            if resume_from:
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(chunk)
+            
+            content_length = response.headers.get('Content-Length')
+            size = resume_from
+            try:
+                async with aiofiles.open(part_path, 'ab' if resume_from else 'wb') as f:
+                    async for chunk in response.aiter_bytes(chunk_size=65536):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        await f.write(chunk)
+                
+                # Content-Length counts the bytes on the wire, before any Content-Encoding is decoded
+                if content_length is not None and response.num_bytes_downloaded != int(content_length):
+                    raise IOError(f"truncated download ({response.num_bytes_downloaded}/{content_length} bytes)")
+            except Exception:
+                if not resumable:
+                    self.discard_part(part_path, validator_path)
+                raise
+            
+            return {
+                'size': size,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'sha256': digest.hexdigest()
+            }
+    
+    async def download_with_retries(self, session: httpx.AsyncClient, url: str, filepath: Path, headers: dict) -> dict:
+        """Download to a .part file with retries and jittered backoff, then atomically rename it"""
+        part_path = filepath.with_name(filepath.name + '.part')
+        validator_path = self.validator_file(part_path)
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await self.stream_to_part(session, url, part_path, headers)
+                break
+            except (httpx.TransportError, httpx.HTTPStatusError, IOError) as e:
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in RETRYABLE_STATUS_CODES
+                if not retryable or attempt == self.max_retries:
+                    raise
+                
+                # Exponential backoff with jitter so concurrent workers do not retry in lockstep
+                delay = self.backoff_base * 2 ** attempt * random.uniform(0.5, 1.5)
+                logger.warning(f"Retrying {filepath.name} in {delay:.1f}s ({e})")
+                await asyncio.sleep(delay)
+        
+        if result is None:
+            # Our copy is current, drop any leftover partial download
+            self.discard_part(part_path, validator_path)
+            return None
+        
+        # Only complete files ever appear under their final name
+        os.replace(part_path, filepath)
+        validator_path.unlink(missing_ok=True)
+        return result
+    
+    def download_path(self, url: str, filename: str = None) -> Path:
+        """Local path of a download (named after the URL when the listing gives no filename)"""
+        return self.download_dir / (filename or unquote(url.split('/')[-1]))
+    
+    async def download_file(self, session: httpx.AsyncClient, url: str, filename: str):
+        """Download a single file"""
+        try:
+            filepath = self.download_path(url, filename)
+            filename = filepath.name
+            headers = {}
+            
+            # Skip if file already exists
+            if filepath.exists():
+                if self.manifest is None:
+                    logger.info(f"Skipping {filename} - already exists")
+                    self.metrics.skip('already exists', stage='download')
+                    return True
+                
+                entry = self.manifest.get('download', url)
+                if entry is None and zipfile.is_zipfile(filepath):
+                    # Complete spreadsheet from before the manifest existed: adopt it as is
+                    self.manifest.record(
+                        'download', url, filename=filename, size=filepath.stat().st_size,
+                        etag=None, last_modified=None, sha256=self.manifest.file_hash(filepath)
+                    )
+                    logger.info(f"Skipping {filename} - already exists")
+                    self.metrics.skip('already exists', stage='download')
+                    return True
+                
+                if entry and entry['sha256'] == self.manifest.file_hash(filepath):
+                    if not (entry.get('etag') or entry.get('last_modified')):
+                        logger.info(f"Skipping {filename} - already exists")
+                        self.metrics.skip('already exists', stage='download')
+                        return True
+                    # Ask the server whether the spreadsheet was re-published since our copy
+                    if entry.get('etag'):
+                        headers['If-None-Match'] = entry['etag']
+                    if entry.get('last_modified'):
+                        headers['If-Modified-Since'] = entry['last_modified']
+                else:
+                    logger.warning(f"{filename} is truncated or modified locally - downloading again")
+            
+            logger.info(f"Downloading: {filename}")
+            
+            result = await self.download_with_retries(session, url, filepath, headers)
+            if result is None:
+                logger.info(f"Skipping {filename} - unchanged on server")
+                self.metrics.skip('unchanged on server', stage='download')
+                return True
+            
+            if self.manifest:
+                self.manifest.record(
+                    'download', url, filename=filename, size=result['size'],
+                    etag=result['etag'], last_modified=result['last_modified'],
+                    sha256=result['sha256']
+                )
+            
+            logger.info(f"✓ Downloaded: {filename}")
+            self.metrics.count('files', stage='download')
+            self.metrics.count('bytes', result['size'], stage='download')
+            return True
+            
+        except Exception as e:
+            logger.error(f"✗ Failed to download {filename}: {e}")
+            self.metrics.skip('failed', stage='download')
+            return False
+    
+    async def scrape_and_download(self, headless:bool=False):
+        """Main method to scrape links and download files"""
+        with self.metrics.stage('discovery'):
+            all_links = await self.collect_links(headless)
+            self.metrics.count('links', len(all_links), stage='discovery')
+        
         logger.info(f"\nCollected {len(all_links)} download links")
         if all_links and self.category_filter:
             logger.info(f"All files are from category: {self.category_filter}")
         
-        # Download files concurrently
-        async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as session:
-            tasks = [
-                self.download_file(session, link['url'], link['filename'])
-                for link in all_links
-            ]
+        with self.metrics.stage('download'):
+            await self.download_all(all_links)
+        
+        self.metrics.log_summary()
+        self.metrics.save()
+    
+    async def download_all(self, links: list[dict]) -> int:
+        """Download links with at most max_concurrent_downloads transfers at once"""
+        semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+        
+        async def download_bounded(session, link):
+            async with semaphore:
+                return await self.download_file(session, link['url'], link['filename'])
+        
+        async with self.create_client() as session:
+            tasks = [download_bounded(session, link) for link in links]
             results = await asyncio.gather(*tasks)
         
+        if self.manifest:
+            self.manifest.save()
+        
         success_count = sum(results)
         logger.info(f"\n{'='*50}")
-        logger.info(f"Download complete: {success_count}/{len(all_links)} files succeeded")
+        logger.info(f"Download complete: {success_count}/{len(links)} files succeeded")
         logger.info(f"Files saved to: {self.download_dir.absolute()}")
+        return success_count
 
 
 async def main():
@@ -208,12 +536,31 @@ async def main():
     # Optional: Show 100 items per page (faster scraping, fewer page loads)
     SHOW_100_PER_PAGE = True  # Set to False to use default 10 per page
     
+    # Shared manifest used to skip unchanged downloads, conversions and analyses
+    MANIFEST_FILE = "pipeline_manifest.json"
+    
+    # Link discovery: "http" (listing HTML, no browser), "browser" (Playwright) or "auto" (http, then browser)
+    DISCOVERY_MODE = "auto"
+    
+    # Download engine: parallel transfers and retries (with jittered exponential backoff)
+    MAX_CONCURRENT_DOWNLOADS = 8
+    MAX_RETRIES = 4
+    
+    # JSON run report with stage timings and counters, and stages to profile with cProfile
+    REPORT_FILE = "fund_volatility_analysis.run.json"
+    PROFILE_STAGES = []  # e.g. ["discovery", "download"]
+    
     scraper = ASFIMScraper(
         base_url=URL,
         download_dir=DOWNLOAD_DIR,
         max_files=MAX_FILES,
         category_filter=CATEGORY_FILTER,
-        show_100_per_page=SHOW_100_PER_PAGE
+        show_100_per_page=SHOW_100_PER_PAGE,
+        manifest_file=MANIFEST_FILE,
+        max_concurrent_downloads=MAX_CONCURRENT_DOWNLOADS,
+        max_retries=MAX_RETRIES,
+        discovery_mode=DISCOVERY_MODE,
+        metrics=PipelineMetrics(report_file=REPORT_FILE, profile=PROFILE_STAGES)
     )
     
     await scraper.scrape_and_download(headless=HEADLESS)
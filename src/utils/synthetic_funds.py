@@ -0,0 +1,203 @@
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Columns of an ASFIM performance table, in the order convert_xlsx_to_csv.py writes them
+ASFIM_COLUMNS = [
+    'CODE ISIN', 'Code Maroclear', 'Dénomination OPCVM', 'Société de Gestion', 'Nature juridique',
+    'Classification', 'Sensibilité', 'Indice Bentchmark', 'Périodicité VL', 'Souscripteurs',
+    'Affectation des résultats', 'Commission de souscription', ' Commission de rachat', 'Frais de gestion',
+    'Dépositaire', 'Réseau placeur', 'AN', 'VL', 'YTD', '1 jour', '1 semaine', '1 mois', '3 mois',
+    '6 mois', '1 an', '2 ans', '3 ans', '5 ans'
+]
+
+# Trailing performance columns filled with random returns
+PERFORMANCE_COLUMNS = ['YTD', '1 jour', '1 semaine', '1 mois', '3 mois', '6 mois', '1 an', '2 ans', '3 ans', '5 ans']
+
+# Classifications with their share of funds and annual volatility, roughly as in the published tables
+CLASSIFICATIONS = {
+    'OMLT': (0.35, 0.03),
+    'Diversifié': (0.22, 0.08),
+    'Actions': (0.18, 0.18),
+    'Monétaire': (0.11, 0.005),
+    'OCT': (0.11, 0.01),
+    'Contractuel': (0.03, 0.05),
+}
+
+MANAGEMENT_COMPANIES = [
+    'CDG CAPITAL GESTION', 'WAFA GESTION', 'CFG GESTION', 'BMCE CAPITAL GESTION', 'UPLINE CAPITAL MANAGEMENT',
+    'CIH CAPITAL MANAGEMENT', 'VALORIS MANAGEMENT', 'ATLANTA CAPITAL', 'RED MED ASSET MANAGEMENT', 'AXA AM MAROC'
+]
+
+DEPOSITARIES = ['ATTIJARIWAFA BANK', 'BCP', 'CDG Capital', 'BMCE BANK', 'CIH', 'BMCI', 'SGMB', 'CAM']
+
+# Word used in the table file names for each frequency, and the spacing of its dates
+FREQUENCY_NAMES = {'daily': 'quotidiennes', 'weekly': 'hebdomadaires', 'monthly': 'mensuelles', 'annual': 'annuelles'}
+FREQUENCY_DATES = {'daily': 'B', 'weekly': 'W-FRI', 'monthly': 'BME', 'annual': 'BYE'}
+PERIODS_PER_YEAR = {'daily': 252, 'weekly': 52, 'monthly': 12, 'annual': 1}
+
+# Size of the weekly history the pipeline processes today (funds x tables)
+BASELINE_FUNDS = 640
+BASELINE_DATES = 104
+
+
+class SyntheticFundData:
+    """Generator of ASFIM-shaped performance tables with random-walk VLs and injected defects"""
+
+    def __init__(
+        self,
+        n_funds: int = BASELINE_FUNDS,
+        n_dates: int = BASELINE_DATES,
+        frequency: str = 'weekly',
+        end_date: str = '2025-09-26',
+        nan_ratio: float = 0.01,
+        zero_ratio: float = 0.002,
+        late_start_ratio: float = 0.1,
+        seed: int = 0
+    ):
+        self.n_funds = n_funds
+        self.n_dates = n_dates
+        self.frequency = frequency
+        self.dates = pd.date_range(end=end_date, periods=n_dates, freq=FREQUENCY_DATES[frequency])
+        self.nan_ratio = nan_ratio  # Share of VLs published as empty cells
+        self.zero_ratio = zero_ratio  # Share of VLs published as 0
+        self.late_start_ratio = late_start_ratio  # Share of funds launched during the history
+        self.rng = np.random.default_rng(seed)
+        self.funds = self.fund_descriptors()
+        self.launch = self.launch_indices()
+        self.vl = self.vl_paths()
+
+    def fund_descriptors(self) -> pd.DataFrame:
+        """Static columns of every fund (one row per fund)"""
+        n = self.n_funds
+        rng = self.rng
+
+        names = list(CLASSIFICATIONS)
+        shares = np.array([share for share, _ in CLASSIFICATIONS.values()])
+        classification = rng.choice(len(names), size=n, p=shares / shares.sum())
+        nature = np.where(rng.random(n) < 0.08, 'SICAV', 'FCP')
+        company = rng.choice(MANAGEMENT_COMPANIES, size=n)
+
+        return pd.DataFrame({
+            'CODE ISIN': [f"MA{i:010d}" for i in range(n)],
+            'Code Maroclear': np.arange(n) + 1000,
+            'Dénomination OPCVM': [f"{kind} SYNTHETIQUE {i}" for i, kind in enumerate(nature)],
+            'Société de Gestion': company,
+            'Nature juridique': nature,
+            'Classification': np.array(names)[classification],
+            'Sensibilité': '[0  0,5[',
+            'Indice Bentchmark': 'MASI',
+            'Périodicité VL': np.where(rng.random(n) < 0.3, 'QUOTIDIENNE', 'HEBDOMADAIRE'),
+            'Souscripteurs': 'Tous souscripteurs',
+            'Affectation des résultats': 'CAPITALISANT',
+            'Commission de souscription': 0.0,
+            ' Commission de rachat': 0.0,
+            'Frais de gestion': rng.uniform(0.002, 0.02, n).round(4),
+            'Dépositaire': rng.choice(DEPOSITARIES, size=n),
+            'Réseau placeur': company,
+            'AN': rng.lognormal(18, 1.5, n).round(2),
+        })
+
+    def launch_indices(self) -> np.ndarray:
+        """Index of the first table listing each fund (0 except for funds launched during the history)"""
+        launched = self.rng.random(self.n_funds) < self.late_start_ratio
+        return np.where(launched, self.rng.integers(0, self.n_dates, self.n_funds), 0)
+
+    def vl_paths(self) -> np.ndarray:
+        """(dates x funds) VL matrix of geometric random walks, with empty and zero VLs"""
+        rng = self.rng
+        annual_vol = self.funds['Classification'].map({name: vol for name, (_, vol) in CLASSIFICATIONS.items()})
+        period_vol = annual_vol.to_numpy() / np.sqrt(PERIODS_PER_YEAR[self.frequency])
+
+        returns = rng.normal(0.0005, period_vol, size=(self.n_dates, self.n_funds))
+        start = rng.lognormal(np.log(500), 1.5, self.n_funds)
+        vl = start * np.cumprod(1 + returns, axis=0)
+
+        defects = rng.random(vl.shape)
+        vl = np.where(defects < self.nan_ratio, np.nan, vl)
+        vl = np.where((defects >= self.nan_ratio) & (defects < self.nan_ratio + self.zero_ratio), 0.0, vl)
+        return vl.round(2)
+
+    def source_name(self, date: pd.Timestamp) -> str:
+        """Table name as published by ASFIM (without extension)"""
+        return f"Tableau des performances {FREQUENCY_NAMES[self.frequency]} au {date.strftime('%d-%m-%Y')}"
+
+    def table(self, index: int) -> pd.DataFrame:
+        """Performance table of one date, with the converter's column layout"""
+        # Funds launched later are not listed yet
+        listed = self.launch <= index
+        df = self.funds[listed].assign(VL=self.vl[index][listed])
+        performance = self.rng.normal(0.01, 0.05, size=(len(df), len(PERFORMANCE_COLUMNS)))
+        df[PERFORMANCE_COLUMNS] = performance
+        return df[ASFIM_COLUMNS].reset_index(drop=True)
+
+    def write_csv_dir(self, csv_dir: str) -> list[Path]:
+        """Write every table as a CSV file named like the converter's output"""
+        csv_dir = Path(csv_dir)
+        csv_dir.mkdir(parents=True, exist_ok=True)
+
+        paths = []
+        for index, date in enumerate(self.dates):
+            path = csv_dir / f"{self.source_name(date)}.csv"
+            self.table(index).to_csv(path, index=False, encoding='utf-8')
+            paths.append(path)
+
+        logger.info(f"✓ Wrote {len(paths)} tables of up to {self.n_funds} funds to {csv_dir}")
+        return paths
+
+    def write_xlsx_dir(self, xlsx_dir: str, max_files: int = None) -> list[Path]:
+        """Write the latest tables as ASFIM workbooks (title row, then the header row)"""
+        xlsx_dir = Path(xlsx_dir)
+        xlsx_dir.mkdir(parents=True, exist_ok=True)
+
+        indices = range(len(self.dates))[-max_files:] if max_files else range(len(self.dates))
+        paths = []
+        for index in indices:
+            name = self.source_name(self.dates[index])
+            df = self.table(index)
+
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append([name])
+            sheet.append(ASFIM_COLUMNS)
+            for row in df.itertuples(index=False):
+                sheet.append([None if isinstance(v, float) and np.isnan(v) else v for v in row])
+
+            path = xlsx_dir / f"{name}.xlsx"
+            workbook.save(path)
+            paths.append(path)
+
+        return paths
+
+    def write_funds_json(self, path: str) -> Path:
+        """Write a funds.json like the frontend's, from the latest table"""
+        df = self.table(len(self.dates) - 1).rename(columns={'Dénomination OPCVM': 'OPCVM'})
+        df['Code Maroclear'] = df['Code Maroclear'].astype(str)
+        records = df.astype(object).where(df.notna(), None).to_dict('records')
+
+        path = Path(path)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2, ensure_ascii=False)
+        return path
+
+
+def main():
+    # Configuration
+    OUTPUT_DIR = "synthetic_csv_output"  # Directory for the generated CSV tables
+    N_FUNDS = BASELINE_FUNDS             # Funds per table
+    N_DATES = BASELINE_DATES             # Number of tables
+    FREQUENCY = "weekly"                 # "daily", "weekly", "monthly" or "annual"
+
+    data = SyntheticFundData(n_funds=N_FUNDS, n_dates=N_DATES, frequency=FREQUENCY)
+    data.write_csv_dir(OUTPUT_DIR)
+
+
+if __name__ == "__main__":
+    main()
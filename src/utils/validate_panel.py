@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+
+from lazy_import import lazy_import
+from pipeline_metrics import PipelineMetrics
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Columns identifying one VL series (the calculator's fund keys)
+SERIES_KEYS = ['CODE ISIN', 'Code Maroclear']
+
+# Actions allowed for each check
+ACTIONS = {
+    'duplicates': ['flag', 'keep_last', 'drop'],  # Several rows for one (ISIN, date)
+    'conflicts': ['flag', 'unify', 'exclude'],    # One ISIN with several Maroclear codes, or the reverse
+    'jumps': ['flag', 'rescale', 'exclude'],      # VL moves far outside a fund's usual returns
+    'stale': ['flag', 'drop'],                    # VL repeated unchanged for several periods
+}
+
+# Action as written in the quarantine report
+ACTION_LABELS = {'flag': 'flagged', 'drop': 'dropped', 'unify': 'unified', 'exclude': 'excluded', 'rescale': 'rescaled'}
+
+# Scale of the median absolute deviation to a standard deviation under normal returns
+MAD_TO_STD = 1.4826
+
+# Fewest returns whose median and MAD can single out a jump (with two, the jump moves both)
+MIN_ROBUST_RETURNS = 3
+
+QUARANTINE_COLUMNS = ['CODE ISIN', 'Code Maroclear', 'Fund Name', 'date', 'check', 'action',
+                      'VL', 'Previous VL', 'Log Return', 'Robust Z']
+
+
+class PanelValidator:
+    """Screens a loaded panel for broken VL series before any statistics are computed
+
+    Every check runs on the whole panel at once (grouped shifts and transforms, no loop over
+    funds). Flagged rows are collected in a quarantine report with the action taken:
+
+    - invalid VLs (missing or not positive) are always dropped
+    - ISIN/Maroclear conflicts are flagged, unified (the ISIN keeps its latest code so its
+      series is not split in two) or excluded
+    - duplicate (ISIN, date) rows are flagged, reduced to the last row or dropped
+    - VL jumps: log returns beyond jump_z robust z-scores (median and MAD of the fund's own
+      returns) and at least min_jump in size. A jump reverted at the next date is a one-off
+      bad VL (dropped unless flagging); a lasting jump is a unit change or split, corrected by
+      rescaling the earlier history to the new level, or excluded with the whole fund
+    - stale VLs repeated for stale_periods dates or more are flagged or reduced to their first date
+    """
+
+    def __init__(
+        self,
+        jump_z: float = 8.0,
+        min_jump: float = 0.2,
+        stale_periods: int = 4,
+        duplicates: str = 'keep_last',
+        conflicts: str = 'flag',
+        jumps: str = 'rescale',
+        stale: str = 'flag',
+        quarantine_file: str = None,
+        metrics: PipelineMetrics = None
+    ):
+        self.jump_z = jump_z  # Robust z-score of a log return beyond which it is a jump
+        self.min_jump = min_jump  # Smallest absolute log return counted as a jump (0.2 is about +22% / -18%)
+        self.stale_periods = stale_periods  # Identical VLs in a row from which a series is stale
+        self.actions = {'duplicates': duplicates, 'conflicts': conflicts, 'jumps': jumps, 'stale': stale}
+        for check, action in self.actions.items():
+            if action not in ACTIONS[check]:
+                raise ValueError(f"Unknown {check} action {action!r}, expected one of {ACTIONS[check]}")
+        self.quarantine_file = Path(quarantine_file) if quarantine_file else None
+        self.metrics = metrics or PipelineMetrics()
+        self.quarantine = pd.DataFrame(columns=QUARANTINE_COLUMNS)
+
+    def rules(self) -> dict:
+        """Thresholds and actions, recorded with results so changing them invalidates those results"""
+        return {'jump_z': self.jump_z, 'min_jump': self.min_jump, 'stale_periods': self.stale_periods, **self.actions}
+
+    def flag(self, df: pd.DataFrame, mask, check: str, action: str, **columns):
+        """Add the rows selected by a mask to the quarantine report"""
+        mask = np.asarray(mask, dtype=bool)
+        count = int(mask.sum())
+        self.metrics.count(check, count)
+        if not count:
+            return
+
+        rows = pd.DataFrame({
+            'CODE ISIN': df['CODE ISIN'].to_numpy()[mask],
+            'Code Maroclear': df['Code Maroclear'].to_numpy()[mask],
+            'Fund Name': df['Dénomination OPCVM'].to_numpy()[mask],
+            'date': df['date'].to_numpy()[mask],
+            'check': check,
+            'action': np.asarray(action)[mask] if np.ndim(action) else action,
+            'VL': df['VL'].to_numpy()[mask],
+        })
+        for column, values in columns.items():
+            rows[column] = np.asarray(values)[mask]
+        self.reports.append(rows)
+
+    def drop(self, df: pd.DataFrame, mask, check: str) -> pd.DataFrame:
+        """Remove the rows selected by a mask, counting them as skipped (flagged rows are counted by flag())"""
+        mask = np.asarray(mask, dtype=bool)
+        self.metrics.skip(f"{check} removed", int(mask.sum()))
+        return df[~mask]
+
+    def screen_invalid(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Drop rows whose VL is missing or not positive (unparsable cells were read as missing)"""
+        invalid = ~(df['VL'] > 0).to_numpy()
+        self.flag(df, invalid, 'invalid VL', 'dropped')
+        return self.drop(df, invalid, 'invalid VL')
+
+    def screen_conflicts(self, df: pd.DataFrame) -> pd.DataFrame:
+        """ISINs listed under several Maroclear codes, and Maroclear codes shared by several ISINs"""
+        codes_per_isin = df.groupby('CODE ISIN', observed=True)['Code Maroclear'].transform('nunique')
+        isins_per_code = df.groupby('Code Maroclear', observed=True)['CODE ISIN'].transform('nunique')
+        isin_conflict = (codes_per_isin > 1).to_numpy()
+        code_conflict = (isins_per_code > 1).to_numpy()
+        action = self.actions['conflicts']
+
+        # One report row per conflicting series: its latest row
+        latest = ~df.sort_values('date', kind='stable').duplicated(SERIES_KEYS, keep='last').sort_index()
+        self.flag(df, isin_conflict & latest.to_numpy(), 'ISIN with several Maroclear codes', ACTION_LABELS[action])
+        self.flag(df, code_conflict & latest.to_numpy(), 'Maroclear code with several ISINs',
+                  'excluded' if action == 'exclude' else 'flagged')
+
+        if action == 'unify':
+            # Every row of a conflicting ISIN takes the code of its latest row
+            latest_code = df.sort_values('date', kind='stable').groupby('CODE ISIN', observed=True)['Code Maroclear'].last()
+            unified = df['CODE ISIN'].map(latest_code).astype('Int64')
+            df = df.assign(**{'Code Maroclear': df['Code Maroclear'].where(~isin_conflict, unified)})
+        elif action == 'exclude':
+            df = self.drop(df, isin_conflict | code_conflict, 'code conflict')
+        return df
+
+    def screen_duplicates(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Several rows for one ISIN and date (e.g. a fund listed twice in a table)"""
+        duplicated = df.duplicated(['CODE ISIN', 'date'], keep=False).to_numpy()
+        action = self.actions['duplicates']
+
+        if action == 'keep_last':
+            removed = df.duplicated(['CODE ISIN', 'date'], keep='last').to_numpy()
+            self.flag(df, duplicated, 'duplicate ISIN and date', np.where(removed, 'dropped', 'kept'))
+            return self.drop(df, removed, 'duplicate ISIN and date')
+        if action == 'drop':
+            self.flag(df, duplicated, 'duplicate ISIN and date', 'dropped')
+            return self.drop(df, duplicated, 'duplicate ISIN and date')
+        self.flag(df, duplicated, 'duplicate ISIN and date', 'flagged')
+        return df
+
+    def log_returns(self, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """Log return of every row from the previous date of its series, with that previous VL"""
+        log_vl = np.log(df['VL'])
+        previous = df.groupby(SERIES_KEYS, sort=False, observed=True)['VL'].shift(1)
+        return (log_vl - np.log(previous)).to_numpy(), previous.to_numpy()
+
+    def screen_jumps(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Returns far outside a fund's own distribution: one-off bad VLs and lasting level shifts"""
+        log_return, previous = self.log_returns(df)
+        returns = pd.Series(log_return, index=df.index)
+
+        # Robust z-score: distance from the fund's median return in MADs (scaled to a standard deviation)
+        median = returns.groupby([df[k] for k in SERIES_KEYS], sort=False, observed=True).transform('median')
+        mad = (returns - median).abs().groupby([df[k] for k in SERIES_KEYS], sort=False, observed=True).transform('median')
+        count = returns.groupby([df[k] for k in SERIES_KEYS], sort=False, observed=True).transform('count')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = ((returns - median) / (MAD_TO_STD * mad)).to_numpy()
+            # A fund with a flat history (zero MAD) or too few returns has an infinite z-score for any
+            # move, so min_jump decides (e.g. the new rows of an incremental run after the stored VL)
+            direction = np.sign(log_return - median.to_numpy())
+            direction = np.where(direction == 0, np.sign(log_return), direction)
+            z = np.where((mad.to_numpy() == 0) | (count.to_numpy() < MIN_ROBUST_RETURNS), direction * np.inf, z)
+        jump = (np.abs(log_return) >= self.min_jump) & (np.abs(z) >= self.jump_z)
+
+        # A jump undone by the next return is a single bad VL, not a change of level
+        next_return = df.groupby(SERIES_KEYS, sort=False, observed=True)['VL'].shift(-1).to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            next_log_return = np.log(next_return) - np.log(df['VL'].to_numpy())
+        next_jump = np.append(jump[1:], False) & ~np.isnan(next_log_return)
+        spike = jump & next_jump & (np.abs(log_return + next_log_return) < self.min_jump)
+        reverted = np.insert(spike[:-1], 0, False) & jump
+        level_shift = jump & ~spike & ~reverted
+
+        action = self.actions['jumps']
+        details = {'Previous VL': previous, 'Log Return': log_return, 'Robust Z': z}
+        self.flag(df, spike, 'VL spike', 'flagged' if action == 'flag' else 'dropped', **details)
+        self.flag(df, level_shift, 'VL level shift', ACTION_LABELS[action], **details)
+
+        if action == 'exclude':
+            shifted_funds = pd.Series(level_shift, index=df.index).groupby(
+                [df[k] for k in SERIES_KEYS], sort=False, observed=True).transform('any').to_numpy()
+            return self.drop(df, shifted_funds | spike, 'VL jump')
+        if action == 'rescale':
+            # Bring the history before each shift to the level after it: multiply every VL by the
+            # exponential of the shifts that come after it in its series
+            shift = pd.Series(np.where(level_shift, log_return, 0.0), index=df.index)
+            keys = [df[k] for k in SERIES_KEYS]
+            later_shifts = shift.groupby(keys, sort=False, observed=True).transform('sum') - \
+                shift.groupby(keys, sort=False, observed=True).cumsum()
+            df = df.assign(VL=df['VL'] * np.exp(later_shifts))
+            self.metrics.count('rescaled funds', len(df.loc[level_shift, SERIES_KEYS].drop_duplicates()))
+            return self.drop(df, spike, 'VL spike')
+        return df
+
+    def screen_stale(self, df: pd.DataFrame) -> pd.DataFrame:
+        """VLs repeated unchanged for stale_periods dates or more (the repeats after the first date)"""
+        previous = df.groupby(SERIES_KEYS, sort=False, observed=True)['VL'].shift(1)
+        repeated = (df['VL'] == previous).to_numpy()
+        # Each run of identical VLs gets its own id; the first row of a series always starts a run
+        run = np.cumsum(~repeated)
+        run_length = pd.Series(run).groupby(run).transform('size').to_numpy()
+        stale = repeated & (run_length >= self.stale_periods)
+
+        action = self.actions['stale']
+        self.flag(df, stale, 'stale VL', ACTION_LABELS[action], **{'Previous VL': previous})
+        if action == 'drop':
+            return self.drop(df, stale, 'stale VL')
+        return df
+
+    def screen(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Run every check on a panel (one row per fund and date) and return the cleaned panel"""
+        self.reports = []
+        with self.metrics.stage('validate'):
+            rows = len(df)
+            df = df.reset_index(drop=True)
+            df = self.screen_invalid(df)
+            # Conflicts first, so unified codes are seen by the duplicate and series checks
+            df = self.screen_conflicts(df)
+            df = self.screen_duplicates(df)
+
+            # Series checks work on each fund's rows in date order
+            df = df.sort_values(SERIES_KEYS + ['date'], kind='stable').reset_index(drop=True)
+            df = self.screen_jumps(df)
+            df = self.screen_stale(df.reset_index(drop=True))
+            df = df.reset_index(drop=True)
+
+            reports = [report.dropna(axis=1, how='all') for report in self.reports]
+            self.quarantine = pd.concat(reports, ignore_index=True).reindex(columns=QUARANTINE_COLUMNS) \
+                if reports else pd.DataFrame(columns=QUARANTINE_COLUMNS)
+            self.metrics.count('rows', rows)
+
+        logger.info(f"Validation: {len(self.quarantine)} rows quarantined, {rows - len(df)} removed")
+        if self.quarantine_file:
+            self.quarantine.to_csv(self.quarantine_file, index=False)
+            logger.info(f"✓ Quarantine report saved to: {self.quarantine_file}")
+        return df
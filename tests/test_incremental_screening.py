@@ -0,0 +1,78 @@
+import contextlib
+import io
+import logging
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'utils'))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from compute_funds_stats import VolatilityCalculator  # noqa: E402
+from validate_panel import PanelValidator  # noqa: E402
+
+DATES = pd.date_range('2025-01-03', periods=12, freq='7D')
+
+# Report columns that incremental runs must reproduce
+COMPARED = ['Data Points', 'Annual Volatility (%)', 'Annualized Return (%)', 'Sharpe Ratio']
+
+
+def weekly_tables(unit_change_from: int) -> list[pd.DataFrame]:
+    """Two funds of steady weekly returns; the second one's VL is quoted 86 times smaller from a date on"""
+    rng = np.random.default_rng(0)
+    vl = 100 * np.cumprod(1 + rng.normal(0.001, 0.01, size=(len(DATES), 2)), axis=0)
+    vl[unit_change_from:, 1] /= 86
+    return [pd.DataFrame({
+        'CODE ISIN': ['MA0000000001', 'MA0000000002'],
+        'Code Maroclear': [1001, 1002],
+        'Dénomination OPCVM': ['FCP ALPHA', 'FCP BETA'],
+        'Société de Gestion': 'GESTION',
+        'Nature juridique': 'FCP',
+        'Dépositaire': 'BANQUE',
+        'Classification': 'Actions',
+        'VL': row,
+    }) for row in vl]
+
+
+class IncrementalScreeningTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def calculator(self, name: str, jumps: str) -> VolatilityCalculator:
+        return VolatilityCalculator(
+            csv_dir=self.dir / 'csv', output_file=self.dir / f'{name}.csv', state_file=self.dir / f'{name}.json',
+            validator=PanelValidator(jumps=jumps)
+        )
+
+    def compare(self, jumps: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Volatility report of a full run and of incremental runs adding one table at a time"""
+        (self.dir / 'csv').mkdir()
+        # The runs print their summary tables
+        with contextlib.redirect_stdout(io.StringIO()):
+            for date, table in zip(DATES, weekly_tables(unit_change_from=7)):
+                table.to_csv(self.dir / 'csv' / f"Tableau des performances hebdomadaires au {date:%d-%m-%Y}.csv", index=False)
+                incremental = self.calculator('incremental', jumps).run_incremental_analysis()
+            full = self.calculator('full', jumps).run_analysis()
+        return (full.astype({'CODE ISIN': str}).set_index('CODE ISIN')[COMPARED],
+                incremental.astype({'CODE ISIN': str}).set_index('CODE ISIN')[COMPARED])
+
+    def test_unit_change_is_rescaled(self):
+        full, incremental = self.compare('rescale')
+        self.assertLess(full.loc['MA0000000002', 'Annual Volatility (%)'], 15)
+        pd.testing.assert_frame_equal(incremental, full, check_dtype=False)
+
+    def test_fund_with_a_jump_stays_excluded(self):
+        full, incremental = self.compare('exclude')
+        self.assertEqual(list(full.index), ['MA0000000001'])
+        pd.testing.assert_frame_equal(incremental, full, check_dtype=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
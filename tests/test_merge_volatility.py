@@ -0,0 +1,66 @@
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'utils'))
+
+import pandas as pd  # noqa: E402
+
+from fund_identity import FundIdentityIndex  # noqa: E402
+from merge_volatility_data import merge_volatility_into_funds  # noqa: E402
+
+FUNDS = [
+    {"OPCVM": "FCP Alpha", "CODE ISIN": "MA0000000001", "Code Maroclear": "1001"},
+    {"OPCVM": "FCP Beta", "CODE ISIN": "", "Code Maroclear": "1002"},
+    {"OPCVM": "FCP Gamma", "CODE ISIN": "MA0000000003", "Code Maroclear": "1003"},
+]
+
+
+class MergeVolatilityTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        self.funds_file = self.dir / 'funds.json'
+        self.funds_file.write_text(json.dumps(FUNDS), encoding='utf-8')
+
+        identity = FundIdentityIndex(self.dir / 'fund_identity.json')
+        identity.resolve(
+            pd.Series([f["CODE ISIN"] for f in FUNDS]), pd.Series([f["Code Maroclear"] for f in FUNDS]),
+            pd.Series([f["OPCVM"] for f in FUNDS])
+        )
+        identity.save()
+
+    def merge(self, volatility: pd.DataFrame) -> tuple[dict, list[dict]]:
+        csv_file = self.dir / 'fund_volatility_analysis.csv'
+        volatility.to_csv(csv_file, index=False)
+        stats = merge_volatility_into_funds(self.funds_file, csv_file, identity_file=self.dir / 'fund_identity.json')
+        return stats, json.loads(self.funds_file.read_text(encoding='utf-8'))
+
+    def test_volatility_file_without_maroclear_codes(self):
+        # Written before the volatility CSV carried the Maroclear codes
+        stats, funds = self.merge(pd.DataFrame({
+            "Fund Name": ["FCP Alpha", "FCP Beta"],
+            "CODE ISIN": ["MA0000000001", None],
+            "Annual Volatility (%)": [1.5, 2.5],
+            "Sharpe Ratio": [0.5, 0.7],
+        }))
+        self.assertEqual([fund["annualVolatility"] for fund in funds], [1.5, 2.5, None])
+        self.assertEqual(stats['identity_hits'], 2)
+
+    def test_maroclear_codes_match_funds_without_isin(self):
+        stats, funds = self.merge(pd.DataFrame({
+            "Fund Name": ["Beta (ex Delta)"],
+            "CODE ISIN": [None],
+            "Code Maroclear": ["1002"],
+            "Annual Volatility (%)": [2.5],
+            "Sharpe Ratio": [0.7],
+        }))
+        self.assertEqual([fund["annualVolatility"] for fund in funds], [None, 2.5, None])
+        self.assertEqual(stats['identity_hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
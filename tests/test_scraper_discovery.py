@@ -0,0 +1,124 @@
+import asyncio
+import functools
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'utils'))
+
+from scrape_funds_data import ASFIMScraper  # noqa: E402
+
+# Saved listing pages: a table paged client-side (first and last page) and a listing linking its pages
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+
+BASE_URL = "https://www.asfim.ma/publications/tableaux-des-performances/"
+
+
+class ListingParserTest(unittest.TestCase):
+    def parse(self, fixture: str, category_filter: str = None) -> list[dict]:
+        scraper = ASFIMScraper(BASE_URL, download_dir=self.dir, category_filter=category_filter)
+        return scraper.parse_listing_html((FIXTURES / fixture).read_text(encoding='utf-8'), BASE_URL)
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def test_rows_with_a_download_link(self):
+        links = self.parse('listing_client_paged.html')
+        self.assertEqual(len(links), 9)
+        self.assertEqual(links[0], {
+            'url': "https://www.asfim.ma/wp-content/uploads/2025/10/"
+                   "Tableau%20des%20performances%20quotidiennes%20au%2017-10-2025.xlsx",
+            'filename': "Tableau des performances quotidiennes au 17-10-2025.xlsx",
+            'category': "Quotidien",
+        })
+
+    def test_category_filter(self):
+        links = self.parse('listing_client_paged.html', category_filter="Hebdomadaire")
+        self.assertEqual(
+            [link['filename'] for link in links],
+            [f"Tableau des performances hebdomadaires au {date}.xlsx" for date in ['17-10-2025', '10-10-2025', '26-09-2025']]
+        )
+
+    def test_pagination(self):
+        scraper = ASFIMScraper(BASE_URL, download_dir=self.dir)
+        pagination = {
+            fixture: scraper.parse_listing_pagination((FIXTURES / fixture).read_text(encoding='utf-8'), BASE_URL)
+            for fixture in ['listing_client_paged.html', 'listing_client_last_page.html', 'listing_page_1.html', 'listing_page_2.html']
+        }
+        self.assertEqual(pagination, {
+            'listing_client_paged.html': (None, True),
+            'listing_client_last_page.html': (None, False),
+            'listing_page_1.html': (BASE_URL + 'listing_page_2.html', False),
+            'listing_page_2.html': (None, False),
+        })
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class LinkDiscoveryTest(unittest.TestCase):
+    """collect_links against the fixtures served by a local HTTP server, with a stub browser"""
+
+    def setUp(self):
+        handler = functools.partial(QuietHandler, directory=str(FIXTURES))
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def collect(self, fixture: str, max_files: int, discovery_mode: str = "auto") -> tuple[list[dict], bool]:
+        """Links found and whether the browser was used"""
+        scraper = ASFIMScraper(
+            f"http://127.0.0.1:{self.server.server_port}/{fixture}", download_dir=self.dir,
+            max_files=max_files, discovery_mode=discovery_mode
+        )
+        browser_links = [{'url': 'from-browser', 'filename': None, 'category': 'Unknown'}]
+        with mock.patch.object(scraper, 'discover_links_browser', mock.AsyncMock(return_value=browser_links)) as browser:
+            links = asyncio.run(scraper.collect_links(headless=True))
+        return links, browser.await_count > 0
+
+    def test_follows_next_page_links(self):
+        links, used_browser = self.collect('listing_page_1.html', max_files=104)
+        self.assertEqual(len(links), 6)
+        self.assertFalse(used_browser)
+
+    def test_stops_at_max_files(self):
+        links, used_browser = self.collect('listing_page_1.html', max_files=2)
+        self.assertEqual(len(links), 2)
+        self.assertFalse(used_browser)
+
+    def test_falls_back_to_browser_for_client_side_pages(self):
+        links, used_browser = self.collect('listing_client_paged.html', max_files=104)
+        self.assertTrue(used_browser)
+        self.assertEqual(links[0]['url'], 'from-browser')
+
+    def test_first_page_is_enough(self):
+        links, used_browser = self.collect('listing_client_paged.html', max_files=5)
+        self.assertEqual(len(links), 5)
+        self.assertFalse(used_browser)
+
+    def test_last_client_side_page(self):
+        links, used_browser = self.collect('listing_client_last_page.html', max_files=104)
+        self.assertEqual(len(links), 3)
+        self.assertFalse(used_browser)
+
+    def test_http_mode_keeps_the_links_found(self):
+        links, used_browser = self.collect('listing_client_paged.html', max_files=104, discovery_mode="http")
+        self.assertEqual(len(links), 9)
+        self.assertFalse(used_browser)
+
+
+if __name__ == '__main__':
+    unittest.main()
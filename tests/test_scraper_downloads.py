@@ -0,0 +1,153 @@
+import asyncio
+import gzip
+import hashlib
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src' / 'utils'))
+
+from scrape_funds_data import ASFIMScraper  # noqa: E402
+
+CONTENT = bytes(range(256)) * 800
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves one spreadsheet with ETag, Range/If-Range and If-None-Match support
+
+    Each request takes the next action of the server's plan: a status code, or words among 'ok',
+    'truncate' (drop the connection halfway through the body) and 'gzip' (encode the body whatever
+    the client accepts).
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        action = server.plan.pop(0) if server.plan else 'ok'
+
+        if isinstance(action, int):
+            self.send_response(action)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body, status = server.content, 200
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range', server.etag) == server.etag:
+            start = int(byte_range.removeprefix('bytes=').rstrip('-'))
+            body, status = body[start:], 206
+
+        if 'gzip' in action:
+            body = gzip.compress(body)
+
+        self.send_response(status)
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        if 'gzip' in action:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body[:len(body) // 2] if 'truncate' in action else body)
+
+
+class DownloadEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.content, self.server.etag = CONTENT, '"v1"'
+        self.server.plan, self.server.requests = [], []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/table.xlsx"
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.dir = Path(tmp.name)
+        self.scraper = ASFIMScraper(
+            self.url, download_dir=self.dir / 'downloads', manifest_file=self.dir / 'manifest.json',
+            max_retries=3, backoff_base=0
+        )
+        self.path = self.scraper.download_path(self.url)
+        self.part_path = self.path.with_name(self.path.name + '.part')
+
+    def download(self) -> bool:
+        async def run():
+            async with self.scraper.create_client() as session:
+                return await self.scraper.download_file(session, self.url, None)
+        return asyncio.run(run())
+
+    def assert_downloaded(self, content: bytes = CONTENT):
+        self.assertEqual(self.path.read_bytes(), content)
+        self.assertEqual(self.scraper.manifest.get('download', self.url)['sha256'], hashlib.sha256(content).hexdigest())
+        self.assertEqual(sorted(p.name for p in self.path.parent.iterdir()), [self.path.name])
+
+    def test_resumes_interrupted_download(self):
+        self.server.plan = ['truncate', 'ok']
+        self.assertTrue(self.download())
+        self.assert_downloaded()
+
+        retry = self.server.requests[1]
+        self.assertRegex(retry['Range'], r'^bytes=[1-9]\d*-$')
+        self.assertEqual(retry['If-Range'], '"v1"')
+
+    def test_retries_transient_errors(self):
+        self.server.plan = [503, 429, 'ok']
+        self.assertTrue(self.download())
+        self.assert_downloaded()
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_does_not_retry_client_errors(self):
+        self.server.plan = [404]
+        self.assertFalse(self.download())
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertFalse(self.path.exists())
+
+    def test_unchanged_file_is_not_downloaded_again(self):
+        self.assertTrue(self.download())
+        self.assertTrue(self.download())
+        self.assertEqual(self.server.requests[1]['If-None-Match'], '"v1"')
+        self.assertEqual(self.scraper.metrics.stages['download']['skipped']['unchanged on server'], 1)
+        self.assert_downloaded()
+
+    def test_partial_file_of_an_older_copy_is_not_resumed(self):
+        # Left by a crashed run before the spreadsheet was re-published
+        self.part_path.write_bytes(b'old' * 1000)
+        self.scraper.validator_file(self.part_path).write_text('"v0"', encoding='utf-8')
+
+        self.assertTrue(self.download())
+        self.assertEqual(self.server.requests[0]['If-Range'], '"v0"')
+        self.assert_downloaded()
+
+    def test_partial_file_without_validator_is_discarded(self):
+        self.part_path.write_bytes(CONTENT[:1000])
+
+        self.assertTrue(self.download())
+        self.assertNotIn('Range', self.server.requests[0])
+        self.assert_downloaded()
+
+    def test_encoded_response(self):
+        self.server.plan = ['gzip']
+        self.assertTrue(self.download())
+        self.assertEqual(self.server.requests[0]['Accept-Encoding'], 'identity')
+        self.assert_downloaded()
+
+    def test_interrupted_encoded_response_is_restarted(self):
+        # Decoded bytes are no offsets into the server copy, so the retry starts from scratch
+        self.server.plan = ['gzip truncate', 'ok']
+        self.assertTrue(self.download())
+        self.assertNotIn('Range', self.server.requests[1])
+        self.assert_downloaded()
+
+
+if __name__ == '__main__':
+    unittest.main()